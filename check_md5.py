@@ -3,48 +3,53 @@
 # created 2017/12/27 @Northrend
 #
 # Check md5 of files and get duplicates
-# Support Multi-thread processing
+# Support Multi-process processing
 #
 
 
 from __future__ import print_function
 import os
-import commands
 import time
 import re
-import threading
-import Queue
 import json
 import docopt
 import hashlib
+import multiprocessing
+from collections import defaultdict
 # import md5
 import pprint
 
 
 # globale vars initialization
-GLOBAL_LOCK = threading.Lock()
 REMOVE_NUMBER = 0
+HASH_CHUNK = 1 << 20        # bytes read per step while hashing
+PARTIAL_SIZE = 64 << 10     # bytes hashed from both head and tail in partial pass
+TASK_CHUNK = 64             # files sent to a worker per task
 
 
 def _init_():
     """
-    Check files md5 with multi-thread processing
+    Check files hash with multi-process processing
 
     Change log:
+    2026/10/18      v2.0        process pool with streaming hashing, md5/sha1/xxhash/blake2,
+                                size and partial-hash prefilters, reusable hash index
     2017/12/27      v1.0        basic functions
 
     Usage:
         check_md5.py                    <infile> <outfile> <thread-number>
                                         [-d | --delete-dup]
                                         [--data-prefix=str --uniq-filelist=str]
+                                        [--algo=str --index=str --size-prefilter --partial-hash]
 
         check_md5.py                    -v|--version
         check_md5.py                    -h|--help
 
     Arguments:
         <infile>                        input file list
-        <outfile>                       output md5 list
-        <thread-number>                 number of processing thread
+        <outfile>                       output md5 list, files proven unique by
+                                        prefilters are written with hash '-'
+        <thread-number>                 number of processing processes
 
     Options:
         -h --help                       show this screen
@@ -53,7 +58,12 @@ def _init_():
         ------------------------------------------------------------------------------------------
         --data-prefix=str               path to files, if needed
         --uniq-filelist=str             path to save md5-uniq file list, if needed
-        
+        --algo=str                      md5, sha1, xxhash or blake2 [default: md5]
+        --index=str                     hash index of former runs, files with unchanged size and
+                                        mtime are not hashed again, updated after this run
+        --size-prefilter                set to only hash files sharing their size with others
+        --partial-hash                  set to hash head and tail of same-size files first,
+                                        only files still colliding are fully hashed
     """
     print('=' * 80 + '\nArguments submitted:')
     for key in sorted(args.keys()):
@@ -61,49 +71,94 @@ def _init_():
     print('=' * 80)
 
 
-class cons_worker(threading.Thread):
-    global GLOBAL_LOCK
-
-    def __init__(self, queue, md5_list, md5_dict, delete_dup=False):
-        threading.Thread.__init__(self)
-        self.queue = queue
-        self.md5_list = md5_list
-        self.md5_dict = md5_dict
-        self.delete_dup = delete_dup
-
-    def run(self):
-        global REMOVE_NUMBER
-        while(not self.queue.empty()):
-            if GLOBAL_LOCK.acquire(False):
-                temp = self.queue.get()
-                GLOBAL_LOCK.release()
-                md5_temp = get_md5(temp)
-                GLOBAL_LOCK.acquire()
-                self.md5_list.append((temp, md5_temp))
-                if md5_temp in self.md5_dict:
-                    self.md5_dict[md5_temp].append(temp)
-                    # delete duplicates
-                    if args['--delete-dup']:
-                        os.system('rm {}'.format(temp))
-                        REMOVE_NUMBER += 1
-                else:
-                    self.md5_dict[md5_temp] = [temp]
-                GLOBAL_LOCK.release()
-            else:
-                pass
-        GLOBAL_LOCK.acquire()
-        # ERROR_NUMBER += err_num
-        print('thread:', self.name, 'successfully quit')
-        GLOBAL_LOCK.release()
+def _new_hasher(algo):
+    if algo == 'xxhash':
+        try:
+            import xxhash
+        except ImportError:
+            raise ImportError('xxhash is not installed, try: pip install xxhash')
+        return xxhash.xxh64()
+    if algo == 'blake2':
+        if hasattr(hashlib, 'blake2b'):
+            return hashlib.blake2b(digest_size=20)
+        try:
+            import pyblake2
+        except ImportError:
+            raise ImportError('blake2 needs python>=3.6 or pyblake2')
+        return pyblake2.blake2b(digest_size=20)
+    return hashlib.new(algo)
+
+
+def get_hash(file_name, algo='md5', partial=False):
+    """
+    hash file chunk by chunk, or only its head and tail if partial
+    """
+    hasher = _new_hasher(algo)
+    with open(file_name, 'rb') as f:
+        if partial:
+            hasher.update(f.read(PARTIAL_SIZE))
+            f.seek(max(f.tell(), os.fstat(f.fileno()).st_size - PARTIAL_SIZE))
+            hasher.update(f.read(PARTIAL_SIZE))
+        else:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                hasher.update(chunk)
+    return hasher.hexdigest()
 
 
 def get_md5(file_name):
-    with open(file_name, 'r') as f:
-        md5 = hashlib.md5(f.read()).hexdigest()
-    return md5
+    return get_hash(file_name, 'md5')
+
+
+def _hash_task(task):
+    file_name, algo, partial = task
+    try:
+        return file_name, get_hash(file_name, algo, partial)
+    except (IOError, OSError):
+        return file_name, None
+
+
+def hash_files(file_list, algo, proc_num, partial=False):
+    """
+    hash files in a process pool, return dict of file to hash, None if failed
+    """
+    if not file_list:
+        return dict()
+    pool = multiprocessing.Pool(proc_num)
+    try:
+        tasks = ((x, algo, partial) for x in file_list)
+        return dict(pool.imap_unordered(_hash_task, tasks, chunksize=TASK_CHUNK))
+    finally:
+        pool.terminate()
+
+
+def load_index(path, algo):
+    """
+    hash index, one line per file: size \\t mtime \\t algo \\t hash \\t path
+    """
+    index = dict()
+    if path and os.path.isfile(path):
+        with open(path, 'r') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t', 4)
+                if len(fields) == 5 and fields[2] == algo:
+                    index[fields[4]] = (int(fields[0]), int(fields[1]), fields[3])
+    return index
+
+
+def save_index(path, index, algo):
+    with open(path + '.tmp', 'w') as f:
+        for file_name in sorted(index):
+            size, mtime, digest = index[file_name]
+            f.write('{}\t{}\t{}\t{}\t{}\n'.format(size, mtime, algo, digest, file_name))
+    os.rename(path + '.tmp', path)
+
+
+def _colliding(groups):
+    return [x for group in groups.values() if len(group) > 1 for x in group]
 
 
 def main():
+    global REMOVE_NUMBER
     # read file list
     with open(args['<infile>'], 'r') as f:
         _ = f.readlines()
@@ -112,26 +167,68 @@ def main():
         else:
             file_list = [x.strip() for x in _]
         del _
+    print('file number:', len(file_list))
+    algo = args['--algo']
+    proc_num = int(args['<thread-number>'])
+    tic = time.time()
 
-    # start threads
-    queue = Queue.Queue(0)
-    for item in file_list:
-        queue.put(item)
-    print('file number:', queue.qsize())
-    md5_list = list()
+    # stat files, cached hashes are reused only if size and mtime are unchanged
+    stats = dict()
+    for file_name in file_list:
+        try:
+            stat = os.stat(file_name)
+            stats[file_name] = (stat.st_size, int(stat.st_mtime))
+        except OSError:
+            print('stat error:', file_name)
+    index = load_index(args['--index'], algo)
+    hashes = dict((x, index[x][2]) for x in stats if x in index and index[x][:2] == stats[x])
+    print('hashes reused from index:', len(hashes))
+
+    # prefilters, files with unique size or partial hash could not have duplicates
+    candidates = list(stats)
+    if args['--size-prefilter'] or args['--partial-hash']:
+        size_groups = defaultdict(list)
+        for file_name in candidates:
+            size_groups[stats[file_name][0]].append(file_name)
+        candidates = _colliding(size_groups)
+        print('files sharing size:', len(candidates))
+    if args['--partial-hash']:
+        partial_todo = [x for x in candidates if x not in hashes]
+        partial = hash_files(partial_todo, algo, proc_num, partial=True)
+        # files of the same size as a cached one still need full hash
+        cached_sizes = set(stats[x][0] for x in candidates if x in hashes)
+        partial_groups = defaultdict(list)
+        for file_name in partial_todo:
+            if partial[file_name] is not None:
+                partial_groups[(stats[file_name][0], partial[file_name])].append(file_name)
+        candidates = [x for x in candidates if x in hashes or stats[x][0] in cached_sizes] + _colliding(partial_groups)
+        print('files sharing partial hash:', len(candidates))
+    todo = [x for x in candidates if x not in hashes]
+    hashes.update((k, v) for k, v in hash_files(todo, algo, proc_num).items() if v is not None)
+    print('files hashed: {}, hash time: {:.4f}s'.format(len(todo), time.time() - tic))
+    if args['--index']:
+        index.update((x, stats[x] + (hashes[x],)) for x in hashes)
+        save_index(args['--index'], index, algo)
+
+    # duplicates, first file in input order is kept
     md5_dict = dict()
-    uniq_list = list()
-    thread_count = int(args['<thread-number>'])
-    delete_dup = args['--delete-dup'] 
-    tic = time.time()
-    for i in xrange(thread_count):
-        exec('thread_cons_{} = cons_worker(queue, md5_list, md5_dict, delete_dup)'.format(i))
-        eval('thread_cons_{}.start()'.format(i))
-    for i in xrange(thread_count):
-        eval('thread_cons_{}.join()'.format(i))
-    print('md5 time: {:.4f}s'.format(time.time() - tic))
-    for key in md5_dict:
-        uniq_list.append(md5_dict[key][0])
+    md5_list = list()
+    for file_name in file_list:
+        if file_name not in stats:
+            continue
+        md5_temp = hashes.get(file_name, '-')
+        md5_list.append((file_name, md5_temp))
+        if md5_temp == '-':
+            md5_dict[file_name] = [file_name]
+        elif md5_temp in md5_dict:
+            md5_dict[md5_temp].append(file_name)
+            # delete duplicates
+            if args['--delete-dup']:
+                os.remove(file_name)
+                REMOVE_NUMBER += 1
+        else:
+            md5_dict[md5_temp] = [file_name]
+    uniq_list = [md5_dict[key][0] for key in md5_dict]
     print('uniq file number:', len(uniq_list))
     print('removed file number:', REMOVE_NUMBER)
 
@@ -150,7 +247,7 @@ def main():
 
 if __name__ == '__main__':
     version = re.compile('.*\d+/\d+\s+(v[\d.]+)').findall(_init_.__doc__)[0]
-    args = docopt.docopt(_init_.__doc__, version='Multi-threading hash checker {}'.format(
+    args = docopt.docopt(_init_.__doc__, version='Multi-process hash checker {}'.format(
         version), argv=None, help=True, options_first=False)
     _init_()
     print('start checking...')
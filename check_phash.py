@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# created 2026/10/18 @Northrend
+#
+# Find near-duplicate images by perceptual hash
+# Support Multi-process processing
+#
+
+
+from __future__ import print_function
+import os
+import time
+import re
+import docopt
+import multiprocessing
+import cv2
+import numpy as np
+
+
+TASK_CHUNK = 256        # images sent to a worker per task
+COMPARE_TILE = 1024     # bucket rows compared at once, bounds memory to tile x bucket
+POPCOUNT = np.array([bin(x).count('1') for x in range(256)], dtype=np.uint8)
+
+
+def _init_():
+    """
+    Compute perceptual hashes of images and cluster near-duplicates within a hamming radius
+
+    Change log:
+    2026/10/18      v1.0        basic functions
+
+    Usage:
+        check_phash.py                  <infile> <outfile> <thread-number>
+                                        [--data-prefix=str --hash=str --radius=int]
+                                        [--hash-list=str --max-bucket=int]
+
+        check_phash.py                  -v|--version
+        check_phash.py                  -h|--help
+
+    Arguments:
+        <infile>                        input image list
+        <outfile>                       output duplicate clusters, one cluster per line,
+                                        tab-separated, first image in input order comes first
+        <thread-number>                 number of hashing processes
+
+    Options:
+        -h --help                       show this screen
+        -v --version                    show script version
+        ------------------------------------------------------------------------------------------
+        --data-prefix=str               path to images, if needed
+        --hash=str                      ahash, dhash or phash [default: phash]
+        --radius=int                    max hamming distance of 64-bit hashes in one cluster,
+                                        hashes are split into radius+1 blocks for indexing, so
+                                        larger radius means larger buckets to verify [default: 3]
+        --hash-list=str                 path to save image hashes, if needed
+        --max-bucket=int                buckets sharing one block larger than this are skipped,
+                                        e.g. blank images [default: 20000]
+    """
+    print('=' * 80 + '\nArguments submitted:')
+    for key in sorted(args.keys()):
+        print ('{:<20}= {}'.format(key.replace('--', ''), args[key]))
+    print('=' * 80)
+
+
+def _bits_to_int(bits):
+    return int(np.packbits(bits.ravel()).view('>u8')[0])
+
+
+def ahash(img):
+    small = cv2.resize(img, (8, 8), interpolation=cv2.INTER_AREA).astype(np.float32)
+    return _bits_to_int(small > small.mean())
+
+
+def dhash(img):
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA).astype(np.float32)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def phash(img):
+    small = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8]
+    # dc term is excluded from median
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+
+HASH_FUNCS = {'ahash': ahash, 'dhash': dhash, 'phash': phash}
+
+
+def _hash_task(task):
+    image_path, hash_name = task
+    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    return HASH_FUNCS[hash_name](img)
+
+
+def hash_images(image_list, hash_name, proc_num):
+    """
+    hash images in a process pool, return list in input order, None if reading failed
+    """
+    pool = multiprocessing.Pool(proc_num)
+    try:
+        return pool.map(_hash_task, [(x, hash_name) for x in image_list], chunksize=TASK_CHUNK)
+    finally:
+        pool.terminate()
+
+
+def hamming(a, b):
+    """
+    element-wise hamming distance of uint64 arrays
+    """
+    x = np.ascontiguousarray(np.bitwise_xor(a, b), dtype=np.uint64)
+    return POPCOUNT[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def near_pairs(codes, radius, max_bucket=20000):
+    """
+    multi-index hashing: 64 bits are split into radius+1 blocks, by pigeonhole any two codes within
+    radius share at least one block exactly, so only codes in the same bucket of a block are compared
+    buckets are compared by tiles of rows against the rest of the bucket
+    yield (i, j) index arrays of pairs within radius
+    """
+    num_blocks = radius + 1
+    bounds = np.linspace(0, 64, num_blocks + 1).astype(int)
+    for block in range(num_blocks):
+        width = bounds[block + 1] - bounds[block]
+        keys = (codes >> np.uint64(bounds[block])) & np.uint64((1 << width) - 1)
+        order = np.argsort(keys, kind='mergesort')
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(keys[order])) + 1, [len(order)]])
+        sizes = np.diff(starts)
+        for run in np.flatnonzero(sizes > 1):
+            if sizes[run] > max_bucket:
+                print('bucket of {} hashes skipped in block {}'.format(sizes[run], block))
+                continue
+            ids = order[starts[run]:starts[run + 1]]
+            bucket = codes[ids]
+            for start in range(0, len(ids) - 1, COMPARE_TILE):
+                # rows start:start+tile against columns start:, keep pairs with j > i
+                dist = hamming(bucket[start:start + COMPARE_TILE, np.newaxis], bucket[np.newaxis, start:])
+                i, j = np.nonzero(dist <= radius)
+                upper = j > i
+                if upper.any():
+                    yield ids[start + i[upper]], ids[start + j[upper]]
+
+
+class DisjointSet(object):
+    def __init__(self, num):
+        self.parent = list(range(num))
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, x, y):
+        x, y = self.find(x), self.find(y)
+        if x != y:
+            self.parent[max(x, y)] = min(x, y)
+
+
+def cluster(codes, radius, max_bucket=20000):
+    """
+    return cluster id of each code, identical codes are collapsed before indexing
+    """
+    uniq, inverse = np.unique(codes, return_inverse=True)
+    dsu = DisjointSet(len(uniq))
+    num_pairs = 0
+    for i, j in near_pairs(uniq, radius, max_bucket):
+        num_pairs += len(i)
+        for x, y in zip(i.tolist(), j.tolist()):
+            dsu.union(x, y)
+    print('uniq hashes: {}, near pairs: {}'.format(len(uniq), num_pairs))
+    roots = np.array([dsu.find(x) for x in range(len(uniq))], dtype=np.int64)
+    return roots[inverse]
+
+
+def main():
+    with open(args['<infile>'], 'r') as f:
+        _ = [x.strip() for x in f if x.strip()]
+        if args['--data-prefix']:
+            image_list = [os.path.join(args['--data-prefix'], x) for x in _]
+        else:
+            image_list = _
+        del _
+    print('image number:', len(image_list))
+    tic = time.time()
+    hashes = hash_images(image_list, args['--hash'], int(args['<thread-number>']))
+    valid = [i for i, x in enumerate(hashes) if x is not None]
+    print('hash time: {:.4f}s, reading failed: {}'.format(time.time() - tic, len(image_list) - len(valid)))
+    if args['--hash-list']:
+        with open(args['--hash-list'], 'w') as f:
+            for i in valid:
+                f.write('{}\t{:016x}\n'.format(image_list[i], hashes[i]))
+
+    tic = time.time()
+    codes = np.array([hashes[i] for i in valid], dtype=np.uint64)
+    labels = cluster(codes, int(args['--radius']), int(args['--max-bucket']))
+    clusters = dict()
+    for i, label in zip(valid, labels.tolist()):
+        clusters.setdefault(label, list()).append(i)
+    dup_clusters = sorted([x for x in clusters.values() if len(x) > 1], key=lambda x: x[0])
+    print('cluster time: {:.4f}s'.format(time.time() - tic))
+    print('duplicate clusters: {}, duplicate images: {}'.format(
+        len(dup_clusters), sum(len(x) - 1 for x in dup_clusters)))
+    with open(args['<outfile>'], 'w') as f:
+        for members in dup_clusters:
+            # get original file name from input list
+            names = [image_list[i].replace(args['--data-prefix'], '') if args['--data-prefix'] else image_list[i] for i in members]
+            f.write('\t'.join(names) + '\n')
+
+
+if __name__ == '__main__':
+    version = re.compile('.*\d+/\d+\s+(v[\d.]+)').findall(_init_.__doc__)[0]
+    args = docopt.docopt(_init_.__doc__, version='Multi-process perceptual hash checker {}'.format(
+        version), argv=None, help=True, options_first=False)
+    _init_()
+    print('start checking...')
+    main()
+    print('...done')
@@ -21,10 +21,20 @@ import pandas
 import re
 import logging
 import numpy as np
+from collections import namedtuple
+
+cur_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(cur_path, 'mxnet-cubicle/img-cls/lib'))
+from result_util import BinaryResult, is_binary_result, iter_json_records
 
 
 POSITIVE = 1
 RESULT_FILE = 'result'
+PR_CHUNK_SIZE = 4096     # rows of score matrix binned per step
+LOG_CHUNK_SIZE = 4096    # records of log parsed into one chunk
+MAX_ERR_FILES = 256      # error log files kept open at once under all-label mode
+TOP_K_ONLY_ERROR = ('{} keeps confidences of top-k classes only, pr-curve and cross entropy need '
+                    'confidences of all classes, please test with LOG_ALL_CONFIDENCE')
 
 
 # init global logger
@@ -36,11 +46,15 @@ logger = logging.getLogger()
 def _init_():
     '''
     Evalutaion script for image-classification task
-    Update: 2019/01/31
+    Update: 2026/10/18
     Author: @Northrend
     Contributor:
 
     Change log:
+    2026/10/18      v2.6            support binary result files by mxnet_image_classifier.py
+    2026/10/18      v2.5            streaming log reader, support json-lines log
+                                    support confusion matrix mode again
+    2026/10/18      v2.4            vectorized single-pass pr-curve engine
     2019/01/31      v2.3            support loss computing mode 
     2018/06/04      v2.2            fix basename bug 
     2018/06/01      v2.1            fix numeric bug 
@@ -58,19 +72,20 @@ def _init_():
                                         [-s|--service] [-c|--conf-mat] [-a|--all-labels] 
                                         [-e|--err-log] [-b|--base-name] [-l|--loss]
                                         [--log-lv=str --pos=int --label=str --nrop]
-                                        [--top-k=int --label-range=int]
+                                        [--top-k=int --label-range=int --thresholds=int]
         classification_evaluator.py     -v | --version
         classification_evaluator.py     -h | --help
 
     Arguments:
-        <in-log>                    test inference log
+        <in-log>                    test inference log, json or json-lines, 
+                                    or prefix of binary result files
         <out-path>                  evaluation result file
 
     Options:
         -h --help                   show this help screen
         -v --version                show current version
         -s --service                online-service log mode
-        -c --conf-mat               generate confusion matrix mode
+        -c --conf-mat               generate confusion matrix mode, --label required
         -a --all-labels             recurrently eval on all labels mode
         -b --base-name              use basename of files in gt list
         -e --err-log                save error image json as /out-path/err.json
@@ -83,6 +98,8 @@ def _init_():
         --nrop                      set nrop flag to convert nrop logs
         --label=str                 path to index2label file
         --top-k=int                 top k in log [default: 1]
+        --thresholds=int            number of evenly spaced thresholds in (0,1) to
+                                    draw pr-curve on [default: 99]
     '''
     logger.setLevel(eval('logging.{}'.format(args['--log-lv'])))
     logger.info('=' * 80 + '\nArguments submitted:')
@@ -129,14 +146,81 @@ def _read_category(label_list_file, position=1):
     return lst_label
 
 
-def _is_positive(dict_image, threshold):
+LogChunk = namedtuple('LogChunk', ['images', 'labels', 'top_k', 'confidence', 'records'])
+
+
+def _iter_log_chunks(log_path, dict_gt, top_k=1, chunk_size=LOG_CHUNK_SIZE, log_stat=None):
     '''
-    positive judgement
+    push records of images found in groundtruth into compact typed arrays,
+    yield LogChunk of at most chunk_size images:
+    images          list of file names
+    labels          int64 groundtruth labels
+    top_k           int32 N x k predicted indices
+    confidence      float32 N x C confidences
+    records         list of raw records, only kept for the current chunk,
+                    None for binary results
+    log_stat dict, if given, is filled with numbers of files and missing files
     '''
-    if float(dict_image['Confidence'][POSITIVE]) > threshold:
-        return True
-    else:
-        return False
+    if is_binary_result(log_path):
+        for chunk in _iter_binary_chunks(log_path, dict_gt, chunk_size=chunk_size, log_stat=log_stat):
+            yield chunk
+        return
+    key_top_k = 'Top-{} Index'.format(top_k)
+    log_stat = log_stat if log_stat is not None else dict()
+    log_stat['files'], log_stat['missing'] = 0, 0
+    buff_top_k, buff_conf, buff_images, buff_labels, buff_records = None, None, list(), list(), list()
+    for image, record in iter_json_records(log_path):
+        log_stat['files'] += 1
+        if image not in dict_gt:
+            log_stat['missing'] += 1
+            continue
+        if buff_conf is None:
+            assert len(record['Confidence']) > np.max(record[key_top_k]), TOP_K_ONLY_ERROR.format(log_path)
+            buff_top_k = np.empty((chunk_size, top_k), dtype=np.int32)
+            buff_conf = np.empty((chunk_size, len(record['Confidence'])), dtype=np.float32)
+        idx = len(buff_images)
+        buff_top_k[idx] = record[key_top_k]
+        buff_conf[idx] = record['Confidence']
+        buff_images.append(image)
+        buff_labels.append(dict_gt[image])
+        buff_records.append(record)
+        if len(buff_images) == chunk_size:
+            yield LogChunk(buff_images, np.array(buff_labels, dtype=np.int64), buff_top_k.copy(), buff_conf.copy(), buff_records)
+            buff_images, buff_labels, buff_records = list(), list(), list()
+    if buff_images:
+        num = len(buff_images)
+        yield LogChunk(buff_images, np.array(buff_labels, dtype=np.int64), buff_top_k[:num].copy(), buff_conf[:num].copy(), buff_records)
+
+
+def _iter_binary_chunks(log_path, dict_gt, chunk_size=LOG_CHUNK_SIZE, log_stat=None):
+    '''
+    slice memory-mapped binary results into LogChunk, only rows found in 
+    groundtruth of each slice are copied out
+    '''
+    result = BinaryResult(log_path)
+    assert result.all_confidence, TOP_K_ONLY_ERROR.format(log_path)
+    log_stat = log_stat if log_stat is not None else dict()
+    log_stat['files'], log_stat['missing'] = len(result), 0
+    for start in xrange(0, len(result), chunk_size):
+        names = result.names(start, start + chunk_size)
+        rows = [idx for idx, image in enumerate(names) if image in dict_gt]
+        log_stat['missing'] += len(names) - len(rows)
+        if not rows:
+            continue
+        rows = np.array(rows, dtype=np.int64)
+        yield LogChunk([names[idx] for idx in rows], np.array([dict_gt[names[idx]] for idx in rows], dtype=np.int64),
+                       result.top_k[start + rows], result.confidence[start + rows].astype(np.float32), None)
+
+
+def _accumulate_bincount(hist, values):
+    '''
+    add bincount of non-negative values into hist, enlarge hist if necessary
+    '''
+    counts = np.bincount(values)
+    if len(counts) > len(hist):
+        hist = np.concatenate([hist, np.zeros(len(counts) - len(hist), dtype=hist.dtype)])
+    hist[:len(counts)] += counts
+    return hist
 
 
 def _draw_2d_curve(lst_x, lst_y, save_path='./tmp.png', style='--r', xlabel='x', ylabel='y'):
@@ -153,40 +237,39 @@ def _draw_2d_curve(lst_x, lst_y, save_path='./tmp.png', style='--r', xlabel='x',
     pyplot.close()      # release cache, or next picture will get fucked
 
 
-def _draw_confusion_matrix(dict_log, dict_gt, label_position=1):
-    '''
-    TODO
-    '''
-    label_lst = _read_category(args['--label'], position=label_position)
-    logger.debug(label_lst)
-    matrix = [[0 for col in xrange(len(label_lst))]
-              for row in xrange(len(label_lst))]
-    # update confusion matrix
-    for image in dict_log:
-        try:
-            if image not in dict_gt:
-                logger.error('image not found in groundtruth file')
-                # miss += 1
-                continue
-            elif type(dict_log[image]['Top-{} Index'.format(args['--top-k'])]) == list:
-                matrix[dict_log[image]['Top-{} Index'.format(args['--top-k'])][0]][dict_gt[image]] += 1
-            elif type(dict_log[image]['Top-{} Index'.format(args['--top-k'])]) == int:
-                matrix[dict_log[image]['Top-{} Index'.format(args['--top-k'])]][dict_gt[image]] += 1
-        except:
+class ConfusionMatrixCounter(object):
+    '''
+    accumulate matrix[prediction][groundtruth] from log chunks
+    '''
+    def __init__(self, num_cls):
+        self.num_cls = num_cls
+        self.matrix = np.zeros((num_cls, num_cls), dtype=np.int64)
+
+    def update(self, chunk):
+        pred, gt = chunk.top_k[:, 0].astype(np.int64), chunk.labels
+        valid = (pred >= 0) & (pred < self.num_cls) & (gt >= 0) & (gt < self.num_cls)
+        if not np.all(valid):
             logger.debug('update matrix error')
+        self.matrix += np.bincount(pred[valid] * self.num_cls + gt[valid],
+                                   minlength=self.num_cls * self.num_cls).reshape(self.num_cls, self.num_cls)
 
+
+def _draw_confusion_matrix(matrix, label_lst, save_path='./conf-mat.png'):
+    '''
+    draw confusion matrix accumulated by ConfusionMatrixCounter
+    '''
     df_cm = pandas.DataFrame(matrix, index=[cls for cls in label_lst], columns=[cls for cls in label_lst])
     logger.debug('start drawing confusion matrix')
     logger.debug(matrix)
     pyplot.figure(figsize=(len(matrix), len(matrix) + 3))
     logger.debug(df_cm)
     try:
-        seaborn.heatmap(df_cm, annot=True, cmap='Reds')
-        pyplot.savefig('./test.png')
+        seaborn.heatmap(df_cm, annot=True, fmt='d', cmap='Reds')
+        pyplot.savefig(save_path)
     except:
         logger.warn('drawing matrix failed')
         for row in matrix:
-            logger.info(row)
+            logger.info(row.tolist())
     pyplot.close()
 
 
@@ -194,62 +277,85 @@ def _calculate_ap(lst_rec, lst_pre):
     '''
     calculate average precision for one class
     '''
-    # initialize AP
-    AP = lst_rec[-1] * lst_pre[-1]
-    for i in xrange(1, len(lst_rec)):
-        AP += min(lst_pre[i], lst_pre[i - 1]) * (lst_rec[i - 1] - lst_rec[i])
-    return AP
+    rec, pre = np.asarray(lst_rec, dtype=np.float64), np.asarray(lst_pre, dtype=np.float64)
+    AP = rec[-1] * pre[-1] + np.sum(np.minimum(pre[1:], pre[:-1]) * (rec[:-1] - rec[1:]))
+    return float(AP)
 
 
-def _calculate_pr(dict_log, dict_gt):
+def _build_thresholds(num_thresholds=99):
     '''
-    calculate precision and recall values according to top-1 index
+    evenly spaced threshold grid inside (0,1),
+    default 99 points are exactly 0.01, 0.02, ..., 0.99
     '''
-    tp = 0
-    fp = 0
-    fn = 0
-    for image in dict_log.keys():
-        if image not in dict_gt:    # image check
-            continue
-        elif dict_log[image]['Top-1 Index'] == POSITIVE and dict_gt[image] == POSITIVE:
-            tp += 1
-        elif dict_log[image]['Top-1 Index'] == POSITIVE and dict_gt[image] != POSITIVE:
-            fp += 1
-        elif dict_log[image]['Top-1 Index'] != POSITIVE and dict_gt[image] == POSITIVE:
-            fn += 1
-    precision, recall = (float(tp) / (tp + fp)), (float(tp) / (tp + fn))
-    return precision, recall
+    num_thresholds = int(num_thresholds)
+    assert num_thresholds > 0, 'number of thresholds should be positive'
+    return np.arange(1, num_thresholds + 1, dtype=np.float64) / (num_thresholds + 1)
 
 
-def _calculate_pr_curve(dict_log, dict_gt):
+class PRCurveEngine(object):
+    '''
+    precision/recall/f1 on every threshold of every class in one pass
+
+    each score is binned by the number of thresholds below it, so that
+    "score > thresholds[j]" holds for all j < bin. per-class histograms of 
+    all bins and of the groundtruth-class bins are accumulated, and counts 
+    on every threshold come out of a reversed cumsum over them.
+    '''
+    def __init__(self, num_cls, thresholds, chunk_size=PR_CHUNK_SIZE):
+        # compare in float32, the same precision as scores
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+        assert np.all(np.diff(self.thresholds) > 0), 'thresholds should be strictly increasing'
+        self.num_cls = num_cls
+        self.num_bins = len(self.thresholds) + 1
+        self.chunk_size = chunk_size
+        self.hist_pred = np.zeros((num_cls, self.num_bins), dtype=np.int64)
+        self.hist_tp = np.zeros((num_cls, self.num_bins), dtype=np.int64)
+        self.num_gt = np.zeros(num_cls, dtype=np.int64)
+
+    def update(self, scores, labels):
+        '''
+        accumulate NxC scores and N groundtruth labels
+        '''
+        assert scores.shape[1] == self.num_cls, 'number of classes mismatch'
+        offsets = np.arange(self.num_cls, dtype=np.int64) * self.num_bins
+        for start in xrange(0, scores.shape[0], self.chunk_size):
+            chunk = np.asarray(scores[start:start + self.chunk_size], dtype=np.float32)
+            chunk_labels = np.asarray(labels[start:start + self.chunk_size], dtype=np.int64)
+            bins = np.searchsorted(self.thresholds, chunk, side='left')
+            self.hist_pred += np.bincount((bins + offsets).ravel(),
+                                          minlength=self.num_cls * self.num_bins).reshape(self.num_cls, self.num_bins)
+            valid = np.nonzero((chunk_labels >= 0) & (chunk_labels < self.num_cls))[0]
+            gt = chunk_labels[valid]
+            self.hist_tp += np.bincount(gt * self.num_bins + bins[valid, gt],
+                                        minlength=self.num_cls * self.num_bins).reshape(self.num_cls, self.num_bins)
+            self.num_gt += np.bincount(gt, minlength=self.num_cls)
+
+    def curves(self):
+        '''
+        return CxT precision, recall and f1 arrays
+        '''
+        # counts of scores with bin > j, namely score > thresholds[j]
+        tp = np.cumsum(self.hist_tp[:, ::-1], axis=1)[:, ::-1][:, 1:].astype(np.float64)
+        pred = np.cumsum(self.hist_pred[:, ::-1], axis=1)[:, ::-1][:, 1:].astype(np.float64)
+        fp = pred - tp
+        fn = self.num_gt[:, np.newaxis] - tp
+        degenerate = np.logical_or(tp + fp == 0, tp + fn == 0)
+        fp[degenerate], fn[degenerate] = float(1e-8), float(1e-8)
+        precision = tp / (tp + fp)
+        recall = tp / (tp + fn)
+        f1 = 2 * tp / (2 * tp + fp + fn)
+        return precision, recall, f1
+
+
+def _calculate_pr_curve(pr_curves, thresholds):
     '''
     calculate list of precision and recall values, for one given class
+    pr_curves is the output of PRCurveEngine.curves()
     '''
-    lst_precision = []
-    lst_recall = []
-    lst_f1 = []
-    lst_threshold = []
-    for i in xrange(1, 100):
-        tp = 0
-        fp = 0
-        fn = 0
-        threshold = float(i) / 100    # not 0.01*i
-        lst_threshold.append(threshold)
-        for image in dict_log.keys():
-            if image not in dict_gt:    # image check
-                # print 'error: '+image
-                continue
-            elif _is_positive(dict_log[image], threshold) and dict_gt[image] == POSITIVE:
-                tp += 1
-            elif _is_positive(dict_log[image], threshold) and dict_gt[image] != POSITIVE:
-                fp += 1
-            elif not _is_positive(dict_log[image], threshold) and dict_gt[image] == POSITIVE:
-                fn += 1
-        if (tp + fp) == 0 or (tp + fn) == 0:
-            fp, fn = float(1e-8), float(1e-8)
-        lst_precision.append(float(tp) / (tp + fp))
-        lst_recall.append(float(tp) / (tp + fn))
-        lst_f1.append(float(2 * tp) / (2 * tp + fp + fn))
+    lst_precision = pr_curves[0][POSITIVE].tolist()
+    lst_recall = pr_curves[1][POSITIVE].tolist()
+    lst_f1 = pr_curves[2][POSITIVE].tolist()
+    lst_threshold = list(thresholds)
     AP = _calculate_ap(lst_recall, lst_precision)
     _draw_2d_curve(lst_recall, lst_precision, save_path=os.path.join(
         (args['<out-path>']), str(POSITIVE), 'pr-{}.png'.format(POSITIVE)), xlabel='Recall', ylabel='Precision')
@@ -258,55 +364,90 @@ def _calculate_pr_curve(dict_log, dict_gt):
     return lst_precision, lst_recall, lst_f1, lst_threshold, AP
 
 
-def _calculate_accuracy(dict_log, dict_gt, err_log=None):
+class ErrorLogWriter(object):
+    '''
+    stream misclassified records into json file <err_log>.<label> of each given label
+    they are predicted as or labeled with, so that records are not kept in memory
+    '''
+    def __init__(self, err_log, labels):
+        self.err_log = err_log
+        self.labels = set(labels)
+        self.started = set()
+        self.files = dict()
+
+    def _open(self, label):
+        if label not in self.files:
+            if len(self.files) >= MAX_ERR_FILES:
+                for f in self.files.values():
+                    f.close()
+                self.files.clear()
+            self.files[label] = open('{}.{}'.format(self.err_log, label), 'a' if label in self.started else 'w')
+        return self.files[label]
+
+    def write(self, image, image_label, record):
+        for label in set([image_label, record['Ground-truth Label']]) & self.labels:
+            f = self._open(label)
+            f.write(',\n' if label in self.started else '{\n')
+            self.started.add(label)
+            f.write('    {}: {}'.format(json.dumps(image), json.dumps(record)))
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+        for label in self.labels:
+            with open('{}.{}'.format(self.err_log, label), 'a' if label in self.started else 'w') as f:
+                f.write('\n}\n' if label in self.started else '{}\n')
+
+
+class AccuracyCounter(object):
+    '''
+    accumulate top-1 predictions against groundtruth from log chunks,
+    misclassified records are streamed to err_writer if given
+    '''
+    def __init__(self, err_writer=None):
+        self.err_writer = err_writer
+        self.total, self.correct = 0, 0
+        self.hist_pred = np.zeros(0, dtype=np.int64)
+        self.hist_gt = np.zeros(0, dtype=np.int64)
+        self.hist_tp = np.zeros(0, dtype=np.int64)
+
+    def update(self, chunk):
+        pred, gt = chunk.top_k[:, 0].astype(np.int64), chunk.labels
+        correct = pred == gt
+        self.total += len(gt)
+        self.correct += int(np.count_nonzero(correct))
+        self.hist_pred = _accumulate_bincount(self.hist_pred, pred)
+        self.hist_gt = _accumulate_bincount(self.hist_gt, gt)
+        self.hist_tp = _accumulate_bincount(self.hist_tp, pred[correct])
+        if self.err_writer:
+            for idx in np.nonzero(~correct)[0]:
+                if chunk.records is not None:
+                    record = chunk.records[idx].copy()
+                else:
+                    record = {'File Name': chunk.images[idx], 
+                              'Top-{} Index'.format(chunk.top_k.shape[1]): chunk.top_k[idx].tolist(), 
+                              'Confidence': [str(x) for x in chunk.confidence[idx]]}
+                record['Ground-truth Label'] = int(gt[idx])
+                self.err_writer.write(chunk.images[idx], int(pred[idx]), record)
+
+    def count(self, label):
+        '''
+        return tp, fp, fn of one given class
+        '''
+        get = lambda hist: int(hist[label]) if label < len(hist) else 0
+        tp = get(self.hist_tp)
+        return tp, get(self.hist_pred) - tp, get(self.hist_gt) - tp
+
+
+def _calculate_accuracy(acc_counter):
     '''
     calculate top-1 error
     '''
-    total, tptn, tp, fp, fn, miss = 0, 0, 0, 0, 0, 0
-    err_dic = dict()
-    epsilon = 10^(-10)
-    for image in dict_log.keys():
-        total += 1
-
-        # key check
-        if image not in dict_gt:
-            # print 'image not found in groundtruth file'
-            miss += 1
-            total -= 1
-            continue
-
-        # get image inference label
-        if type(dict_log[image]['Top-1 Index']) == list:
-            image_label = dict_log[image]['Top-1 Index'][0]
-        elif type(dict_log[image]['Top-1 Index']) == int:
-            image_label = dict_log[image]['Top-1 Index']
-
-        # calculation
-        if image_label == dict_gt[image]:
-            tptn += 1
-            if image_label == POSITIVE:
-                tp += 1
-        elif image_label != dict_gt[image] and image_label == POSITIVE:
-            fp += 1
-            # record error images
-            err_dic[image] = dict_log[image].copy()
-            err_dic[image]['Ground-truth Label'] = dict_gt[image]
-        elif image_label != dict_gt[image] and dict_gt[image] == POSITIVE:
-            fn += 1
-            # record error images
-            err_dic[image] = dict_log[image].copy()
-            err_dic[image]['Ground-truth Label'] = dict_gt[image]
-
-    logger.info('files: ' + str(len(dict_log.keys())))
-    top_1_error = 1 - float(tptn) / total
-    # precision = float(tp) / (tp + fp + epsilon)
+    tp, fp, fn = acc_counter.count(POSITIVE)
+    top_1_error = 1 - float(acc_counter.correct) / acc_counter.total
     precision = float(tp) / (tp + fp)
-    # recall = float(tp) / (tp + fn + epsilon)
     recall = float(tp) / (tp + fn)
-    logger.info('missing files: ' + str(miss))
-    if err_log:
-        with open(err_log + '.{}'.format(POSITIVE),'w') as f:
-            json.dump(err_dic,f,indent=4)
     return top_1_error, precision, recall
 
 
@@ -335,8 +476,10 @@ def _generate_model_evaluation_result(file_result, lst_precision, lst_recall, ls
     file_result.write('Recall: {:.6f}\n'.format(recall))
     file_result.write('Positive AP: {:.6f}\n'.format(AP))
     file_result.write('Thre\tPre \tRec \tF1 - score\n')
+    # 2 decimals for the default 99-point grid, more for denser ones
+    thre_format = '{{:.{}f}}\t{{:.4f}}\t{{:.4f}}\t{{:.4f}}\n'.format(max(2, len(str(len(lst_threshold) + 1)) - 1))
     for i in xrange(len(lst_threshold)):
-        file_result.write('{:.2f}\t{:.4f}\t{:.4f}\t{:.4f}\n'.format(
+        file_result.write(thre_format.format(
             lst_threshold[i], lst_precision[i], lst_recall[i], lst_f1[i]))
 
 
@@ -347,87 +490,117 @@ def _generate_service_evaluation_result(file_result, precision, recall, top_1_er
     file_result.write('Recall: {}\n'.format(recall))
 
 
-def _calculate_ce(dict_log, dict_gt, false_sample_mask=False):
-    ce_list = list()
-    total, fsample, miss = 0, 0, 0
-    eps = 1e-16
-    for img in dict_log:
-        # key check
-        if img not in dict_gt:
-            # print 'image not found in groundtruth file'
-            miss += 1
-            continue
-        total += 1
-        # get image inference label
-        if type(dict_log[img]['Top-1 Index']) == list:
-            image_label = dict_log[img]['Top-1 Index'][0]
-        elif type(dict_log[image]['Top-1 Index']) == int:
-            image_label = dict_log[img]['Top-1 Index']
-        if image_label != dict_gt[img]:
-            fsample += 1
-            # eliminate false pos/neg samples
-            if false_sample_mask:   
-                continue
-
-        # calculate ce
-        num_cls = len(dict_log[img]['Confidence'])
-        y_quote = np.array([float(x) for x in dict_log[img]['Confidence']])
-        y = np.eye(num_cls)[dict_gt[img]]
-        assert y_quote.shape == y.shape, 'Failed matching shape of pred_labels and gt_labels'
-        ce_list.append(-sum(y*np.log(y_quote+eps)))
+class CrossEntropyCounter(object):
+    '''
+    accumulate cross entropy from log chunks,
+    set false_sample_mask to eliminate false pos/neg samples
+    '''
+    def __init__(self, false_sample_mask=False, eps=1e-16):
+        self.false_sample_mask = false_sample_mask
+        self.eps = eps
+        self.total, self.fsample = 0, 0
+        self.ce_sum, self.ce_num = 0.0, 0
+
+    def update(self, chunk):
+        gt = chunk.labels
+        false_sample = chunk.top_k[:, 0] != gt
+        self.total += len(gt)
+        self.fsample += int(np.count_nonzero(false_sample))
+        mask = ~false_sample if self.false_sample_mask else np.ones(len(gt), dtype=bool)
+        y_quote = chunk.confidence[np.nonzero(mask)[0], gt[mask]].astype(np.float64)
+        self.ce_sum += float(-np.sum(np.log(y_quote + self.eps)))
+        self.ce_num += len(y_quote)
+
+
+def _calculate_ce(ce_counter, miss=0):
     print('==> missing images:', miss)
-    print('==> false sample mask:', false_sample_mask)
-    print('==> false samples:', fsample)
-    print('==> top-1 error:{:.6f}'.format(float(fsample)/total))
-    print('==> cross entropy:{:.6f}'.format(sum(ce_list)/len(ce_list)))
+    print('==> false sample mask:', ce_counter.false_sample_mask)
+    print('==> false samples:', ce_counter.fsample)
+    print('==> top-1 error:{:.6f}'.format(float(ce_counter.fsample)/ce_counter.total))
+    print('==> cross entropy:{:.6f}'.format(ce_counter.ce_sum/ce_counter.ce_num))
 
 
 @_time_it.time_it
 def main():
     global POSITIVE
     dict_gt = _read_list(args['--gt'], base_name=True) if args['--base-name'] else _read_list(args['--gt'])      # read groundtruth
-    file_log = open(args['<in-log>'], 'r')
-    dict_log = json.load(file_log)
-    err_log = os.path.join(args['<out-path>'], 'err_img.log') if args['--err-log'] else None
-    if args['--loss']:
-        _calculate_ce(dict_log, dict_gt, false_sample_mask=True)
-        file_log.close()
+    # positive labels to evaluate, known before the pass so error records could be streamed
+    if args['--all-labels']:
+        assert args['--label-range'], 'please input label range!'
+        positive_labels = range(int(args['--label-range']))
+    else:
+        if args['--pos']:
+            POSITIVE = int(args['--pos'])
+        positive_labels = [POSITIVE]
+    thresholds = _build_thresholds(args['--thresholds'])
+    ce_counter = CrossEntropyCounter(false_sample_mask=True) if args['--loss'] else None
+    err_writer = None
+    if args['--err-log'] and not ce_counter:
+        _check_path(args['<out-path>'])
+        err_writer = ErrorLogWriter(os.path.join(args['<out-path>'], 'err_img.log'), positive_labels)
+    acc_counter = AccuracyCounter(err_writer=err_writer)
+    if args['--conf-mat']:
+        assert args['--label'], 'please input index2label file!'
+        label_lst = _read_category(args['--label'])
+        cm_counter = ConfusionMatrixCounter(len(label_lst))
+    pr_engine = None
+    log_stat = dict()
+
+    # one streaming pass over log feeds every counter
+    for chunk in _iter_log_chunks(args['<in-log>'], dict_gt, top_k=int(args['--top-k']), log_stat=log_stat):
+        if ce_counter:
+            ce_counter.update(chunk)
+            continue
+        acc_counter.update(chunk)
+        if pr_engine is None:
+            pr_engine = PRCurveEngine(chunk.confidence.shape[1], thresholds)
+        pr_engine.update(chunk.confidence, chunk.labels)
+        if args['--conf-mat']:
+            cm_counter.update(chunk)
+    if err_writer:
+        err_writer.close()
+    logger.info('files: ' + str(log_stat['files']))
+    logger.info('missing files: ' + str(log_stat['missing']))
+    if ce_counter:
+        _calculate_ce(ce_counter, miss=log_stat['missing'])
         return 0
-    elif args['--pos']:
-        file_result = open(os.path.join(args['<out-path>'], str(POSITIVE), RESULT_FILE), 'w')
-        POSITIVE = int(args['--pos'])
+    assert pr_engine, 'no image in log matches groundtruth'
+    pr_curves = pr_engine.curves()
+    if args['--conf-mat']:
+        _draw_confusion_matrix(cm_counter.matrix, label_lst, save_path=os.path.join(args['<out-path>'], 'conf-mat.png'))
     # if args['--service']:
     #     dict_log=_convert_service_log(
     #         dict_log)   # convert online service log
     #     precision, recall=_calculate_pr(dict_log, dict_gt)
     #     _generate_service_evaluation_result(
     # file_result, precision, recall, _calculate_accuracy(dict_log, dict_gt))
-    elif args['--all-labels']:
-        assert args['--label-range'], 'please input label range!'
-        for POSITIVE in xrange(int(args['--label-range'])):
+    if args['--all-labels']:
+        for POSITIVE in positive_labels:
             logger.info('positive label: {}'.format(POSITIVE))
             _check_path(os.path.join(args['<out-path>'], str(POSITIVE)))
             file_result = open(os.path.join(args['<out-path>'], str(POSITIVE), RESULT_FILE), 'w')
-            lst_precision, lst_recall, lst_f1, lst_threshold, AP = _calculate_pr_curve(dict_log, dict_gt)
+            lst_precision, lst_recall, lst_f1, lst_threshold, AP = _calculate_pr_curve(pr_curves, thresholds)
             _generate_model_evaluation_result(file_result, lst_precision, lst_recall,
-                                              lst_f1, lst_threshold, _calculate_accuracy(dict_log, dict_gt, err_log), AP)
+                                              lst_f1, lst_threshold, _calculate_accuracy(acc_counter), AP)
             file_result.close()
     else:
-        lst_precision, lst_recall, lst_f1, lst_threshold, AP = _calculate_pr_curve(dict_log, dict_gt)
+        _check_path(os.path.join(args['<out-path>'], str(POSITIVE)))
+        file_result = open(os.path.join(args['<out-path>'], str(POSITIVE), RESULT_FILE), 'w')
+        lst_precision, lst_recall, lst_f1, lst_threshold, AP = _calculate_pr_curve(pr_curves, thresholds)
         _generate_model_evaluation_result(file_result, lst_precision, lst_recall,
-                                          lst_f1, lst_threshold, _calculate_accuracy(dict_log, dict_gt, err_log), AP)
+                                          lst_f1, lst_threshold, _calculate_accuracy(acc_counter), AP)
         file_result.close()
-    file_log.close()
 
 
 def unit_test():
     dict_gt = _read_list(args['--gt'], base_name=True)      # read groundtruth
     # logger.debug(dict_gt)
-    file_log = open(args['<in-log>'], 'r')
-    dict_log = json.load(file_log)
+    ce_counter = CrossEntropyCounter(false_sample_mask=True)
+    log_stat = dict()
+    for chunk in _iter_log_chunks(args['<in-log>'], dict_gt, top_k=int(args['--top-k']), log_stat=log_stat):
+        ce_counter.update(chunk)
     logger.debug('log successfully loaded')
-    # _draw_confusion_matrix(dict_log, dict_gt, 0)
-    _calculate_ce(dict_log, dict_gt, false_sample_mask=True)
+    _calculate_ce(ce_counter, miss=log_stat['missing'])
 
 
 if __name__ == '__main__':
@@ -436,6 +609,6 @@ if __name__ == '__main__':
         _init_.__doc__, version='mxnet training script {}'.format(version))
     _init_()
     logger.info('Start evaluation job...')
-    # main()
-    unit_test()
+    main()
+    # unit_test()
     logger.info('...done')
@@ -7,30 +7,50 @@
 
 from __future__ import print_function
 import os
-import commands
 import time
 import re
+import random
+import socket
 import threading
-import Queue
 import json
+import hashlib
 import docopt
+try:
+    import Queue as queue
+    import httplib
+    from urlparse import urlsplit, urljoin
+except ImportError:
+    import queue
+    import http.client as httplib
+    from urllib.parse import urlsplit, urljoin
 
 # globale vars initialization
 GLOBAL_LOCK = threading.Lock()
 ERROR_NUMBER = 0
-DOWNLOAD_NUMBER = 1
+DOWNLOAD_NUMBER = 0
+SKIP_NUMBER = 0
+DUP_URL_NUMBER = 0
+DUP_CONTENT_NUMBER = 0
 FILE_NAME = str()
-SS_HOST = "nbxs-gate-io.qiniu.com" 
+SS_HOST = "nbxs-gate-io.qiniu.com"
 TIMEOUT = 180    # set default timeout for wget as 600 sec
+CHUNK_SIZE = 1 << 16    # bytes written per read from response
+MAX_REDIRECTS = 5
+RETRY_STATUS = (408, 429, 500, 502, 503, 504)
+JOURNAL_FLUSH = 1000    # journal entries buffered before flushing
+LOG_INTERVAL = 1000     # files between progress logs
 
 
 def _init_():
     """
     Multi-threading downloader script
-    Update: 2019/01/14
+    Update: 2026/10/18
 
     Change log:
-    2019/01/14      v1.6                support wget timeout 
+    2026/10/18      v2.1                journal size and md5, dedup of urls and contents
+    2026/10/18      v2.0                http engine with keep-alive connection pool, per-host limits,
+                                        retries and resumable journal
+    2019/01/14      v1.6                support wget timeout
     2018/09/04      v1.5                support download via source station proxy
     2018/08/06      v1.4                optimize std out
     2018/03/05      v1.3                fix bug
@@ -39,9 +59,11 @@ def _init_():
     2017/11/23      v1.0                basic functions
 
     Usage:
-        download_from_urls.py           <infile> <thread-number> [-b|--basename -s|--source-station] 
+        download_from_urls.py           <infile> <thread-number> [-b|--basename -s|--source-station]
                                         [--mapfile-path=str --date=str --start-index=int]
                                         [--download-path=str --prefix=str --suffix=str --ext=str]
+                                        [--engine=str --max-per-host=int --retries=int --backoff=float]
+                                        [--timeout=int --journal=str --dedup-url --dedup-content]
         download_from_urls.py           -v|--version
         download_from_urls.py           -h|--help
 
@@ -60,8 +82,18 @@ def _init_():
         --download-path=str             path to save result file [default: ./]
         --mapfile-path=str              path to save mapping files
         --prefix=str                    prefix of filename
-        --suffix=str                    suffix of fileanme, supposed to be begin with '_' 
+        --suffix=str                    suffix of fileanme, supposed to be begin with '_'
         --ext=str                       extension of filename [default: jpg]
+        --engine=str                    http: built-in client with keep-alive connections,
+                                        wget: one wget/curl process per file [default: http]
+        --max-per-host=int              max concurrent connections to one host [default: 8]
+        --retries=int                   retries of connection errors and 408/429/5xx [default: 3]
+        --backoff=float                 base seconds of exponential retry backoff [default: 1.0]
+        --timeout=int                   socket timeout in seconds [default: 180]
+        --journal=str                   progress journal, files finished in a former run are skipped
+        --dedup-url                     set to download each url only once, repeated urls do not take an index
+        --dedup-content                 set to delete downloaded files identical to an earlier one by md5,
+                                        recorded in dup.json under mapfile-path
     """
     print('=' * 80 + '\nArguments submitted:')
     for key in sorted(args.keys()):
@@ -69,93 +101,290 @@ def _init_():
     print('=' * 80)
 
 
-class prod_worker(threading.Thread):
+class HostPool(object):
     """
-    producing worker
+    keep-alive connections and concurrency slots of each host
     """
-    global GLOBAL_LOCK
+    def __init__(self, max_per_host=8, timeout=TIMEOUT):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = dict()
+        self.slots = dict()
 
-    def __init__(self, queue, infile, f2u, u2f, use_basename=False):
-        threading.Thread.__init__(self)
-        self.queue = queue
-        self.infile = infile
-        self.f2u = f2u
-        self.u2f = u2f
-        self.use_basename = use_basename
+    def acquire(self, scheme, host):
+        key = (scheme, host)
+        with self.lock:
+            if key not in self.slots:
+                self.slots[key] = threading.BoundedSemaphore(self.max_per_host)
+                self.idle[key] = list()
+            slot = self.slots[key]
+        slot.acquire()
+        with self.lock:
+            if self.idle[key]:
+                return self.idle[key].pop()
+        conn_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+        return conn_class(host, timeout=self.timeout)
 
-    def run(self):
-        i = int(args['--start-index'])
-        for buff in self.infile:
-            temp = dict()
-            # skip blank line
-            if not buff.strip():
+    def release(self, scheme, host, conn, reuse=True):
+        key = (scheme, host)
+        if reuse:
+            with self.lock:
+                self.idle[key].append(conn)
+        else:
+            conn.close()
+        self.slots[key].release()
+
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle = dict((key, list()) for key in self.idle)
+
+
+class Journal(object):
+    """
+    append-only progress journal, one line per finished file:
+    status \\t filename \\t url \\t size \\t md5 [\\t filename kept for same md5]
+    status is ok, dup or error:<reason>, files of ok and dup are skipped by later runs
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        self.hashes = dict()
+        self.dups = dict()
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    # last line may be cut by a crash
+                    if len(fields) < 5 or fields[0] not in ('ok', 'dup'):
+                        continue
+                    self.done.add(fields[1])
+                    if fields[0] == 'ok' and fields[4]:
+                        self.hashes.setdefault(fields[4], fields[1])
+                    elif fields[0] == 'dup' and len(fields) > 5:
+                        self.dups[fields[1]] = fields[5]
+        self.file = open(path, 'a')
+        self.pending = 0
+
+    def is_done(self, filename):
+        return filename in self.done
+
+    def write(self, status, filename, url, size=0, md5='', dup_of=None):
+        with self.lock:
+            fields = [status, filename, url, str(size), md5] + ([dup_of] if dup_of else [])
+            self.file.write('\t'.join(fields) + '\n')
+            self.pending += 1
+            if self.pending >= JOURNAL_FLUSH:
+                self.file.flush()
+                self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class ContentIndex(object):
+    """
+    md5 to the first file saved with it
+    """
+    def __init__(self, hashes=None):
+        self.lock = threading.Lock()
+        self.hashes = dict(hashes or dict())
+
+    def claim(self, md5, filename):
+        """
+        return file already saved with md5, or register filename and return None
+        """
+        with self.lock:
+            kept = self.hashes.setdefault(md5, filename)
+        return None if kept == filename else kept
+
+
+def file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def _fetch_once(pool, url, output_path, use_ss_dl=False):
+    """
+    GET url following redirects and stream body into output_path
+    return (http status, size, md5 of body)
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        host = SS_HOST if use_ss_dl else parts.netloc
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        conn = pool.acquire(parts.scheme, host)
+        reuse = False
+        try:
+            conn.request('GET', path, headers={'Host': parts.netloc, 'Connection': 'keep-alive'})
+            resp = conn.getresponse()
+            if resp.status in (301, 302, 303, 307, 308) and resp.getheader('location'):
+                resp.read()
+                reuse = not resp.will_close
+                url = urljoin(url, resp.getheader('location'))
                 continue
-            temp['url'] = buff.strip().split()[0]
-            if self.use_basename:
-                temp['filename'] = os.path.join(
-                    args['--download-path'], os.path.basename(temp['url']))
-            elif args['--date']:
-                temp['filename'] = os.path.join(
-                    args['--download-path'], FILE_NAME.format(args['--date'], i))
-            else:
-                temp['filename'] = os.path.join(
-                    args['--download-path'], FILE_NAME.format(i))
-            self.f2u[os.path.basename(temp['filename'])] = temp['url']
-            self.u2f[temp['url']] = os.path.basename(temp['filename'])
-            GLOBAL_LOCK.acquire()
-            self.queue.put(temp)
-            i += 1
-            # print(temp, 'put into queue by', self.name)
-            GLOBAL_LOCK.release()
-        GLOBAL_LOCK.acquire()
-        print('=> thread:', self.name, 'successfully quit')
-        GLOBAL_LOCK.release()
+            if resp.status != 200:
+                resp.read()
+                reuse = not resp.will_close
+                return resp.status, 0, ''
+            size, md5 = 0, hashlib.md5()
+            with open(output_path + '.part', 'wb') as f:
+                while True:
+                    chunk = resp.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    md5.update(chunk)
+                    size += len(chunk)
+            # connection closed before the whole body arrived
+            length = resp.getheader('content-length')
+            if length and length.isdigit() and size != int(length):
+                raise httplib.IncompleteRead(b'', int(length) - size)
+            os.rename(output_path + '.part', output_path)
+            reuse = not resp.will_close
+            return resp.status, size, md5.hexdigest()
+        finally:
+            pool.release(parts.scheme, host, conn, reuse=reuse)
+    # too many redirects
+    return 310, 0, ''
+
+
+def fetch(pool, url, output_path, use_ss_dl=False, retries=3, backoff=1.0):
+    """
+    download url into output_path with retries, return (success, status or error, size, md5)
+    urls without scheme are fetched by http
+    """
+    if '://' not in url:
+        url = 'http://' + url.lstrip('/')
+    scheme = urlsplit(url).scheme
+    if scheme not in ('http', 'https'):
+        return False, 'unsupported url scheme: {}'.format(scheme), 0, ''
+    for attempt in range(retries + 1):
+        try:
+            status, size, md5 = _fetch_once(pool, url, output_path, use_ss_dl)
+            if status == 200:
+                return True, status, size, md5
+            error = status
+            if status not in RETRY_STATUS:
+                break
+        except (socket.error, httplib.HTTPException, IOError, OSError) as e:
+            error = repr(e)
+        if attempt < retries:
+            # exponential backoff with jitter, so retries from all threads do not arrive together
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+    # body cut by a failed attempt
+    if os.path.isfile(output_path + '.part'):
+        os.remove(output_path + '.part')
+    return False, error, 0, ''
+
+
+def fetch_wget(url, output_path, use_ss_dl=False, timeout=TIMEOUT):
+    """
+    download url by an external wget or curl process
+    """
+    if use_ss_dl:
+        domain = url.split('/')[2]
+        cmd = 'curl {} -H "Host: {}" -o {} > /dev/null 2>&1 '.format(url.replace(domain, SS_HOST), domain, output_path)
+    else:
+        cmd = 'wget -q -T {} -O {} "{}"'.format(timeout, output_path, url)
+    status = os.system(cmd)
+    if status != 0:
+        return False, status, 0, ''
+    return True, status, os.path.getsize(output_path), file_md5(output_path)
 
 
 class cons_worker(threading.Thread):
+    """
+    consuming worker, blocks on queue until a None is got
+    """
     global GLOBAL_LOCK
 
-    def __init__(self, queue, use_ss_dl=False):
+    def __init__(self, queue, pool, journal=None, use_ss_dl=False, content_index=None, dup_map=None):
         threading.Thread.__init__(self)
         self.queue = queue
+        self.pool = pool
+        self.journal = journal
         self.use_ss_dl = use_ss_dl
+        self.content_index = content_index
+        self.dup_map = dup_map
 
-    def download(self, url, output_path, err_num):
-        try:
-            # commands.getoutput('wget -O {} {}'.format(output_path, url))
-            if self.use_ss_dl:
-                domain = url.split('/')[2]
-                cmd = 'curl {} -H "Host: {}" -o {} > /dev/null 2>&1 '.format(url.replace(domain, SS_HOST), domain, output_path)
-            else:
-                # cmd = 'wget -q -O {} "{}"'.format(output_path, url)
-                cmd = 'wget -q -T {} -O {} "{}"'.format(TIMEOUT, output_path, url)
-            if os.system(cmd) != 0:
-                print('=> download ERROR:', url)
-                err_num += 1
-        except all as e:
-            print('=> download ERROR:', url)
-            err_num += 1
-        return err_num
+    def download(self, url, output_path):
+        if args['--engine'] == 'wget':
+            return fetch_wget(url, output_path, self.use_ss_dl, int(args['--timeout']))
+        return fetch(self.pool, url, output_path, self.use_ss_dl,
+                     retries=int(args['--retries']), backoff=float(args['--backoff']))
 
     def run(self):
-        global ERROR_NUMBER, DOWNLOAD_NUMBER
-        err_num = 0
-        while(not self.queue.empty()):
-            if GLOBAL_LOCK.acquire(False):
-                # customized downloading code
-                temp = self.queue.get()
-                print('=> file [{}]: {}'.format(DOWNLOAD_NUMBER, temp['url']))
+        global ERROR_NUMBER, DOWNLOAD_NUMBER, DUP_CONTENT_NUMBER
+        while True:
+            temp = self.queue.get()
+            if temp is None:
+                break
+            filename = os.path.basename(temp['filename'])
+            try:
+                success, status, size, md5 = self.download(temp['url'], temp['filename'])
+                dup_of = self.content_index.claim(md5, filename) if success and self.content_index else None
+                if dup_of:
+                    os.remove(temp['filename'])
+            except Exception as e:
+                # one bad url must not kill the worker and leave its share of the queue undone
+                success, status, size, md5, dup_of = False, repr(e), 0, '', None
+            if self.journal:
+                journal_status = ('dup' if dup_of else 'ok') if success else 'error:{}'.format(status)
+                self.journal.write(journal_status, filename, temp['url'], size, md5, dup_of)
+            with GLOBAL_LOCK:
                 DOWNLOAD_NUMBER += 1
-                GLOBAL_LOCK.release()
-                err_num = self.download(temp['url'], temp['filename'], err_num)
-                # time.sleep(5)
-                # print(temp, 'poped from queue by', self.name)
-            else:
-                pass
-        GLOBAL_LOCK.acquire()
-        ERROR_NUMBER += err_num
-        print('=> thread:', self.name, 'successfully quit')
-        GLOBAL_LOCK.release()
+                if dup_of:
+                    DUP_CONTENT_NUMBER += 1
+                    self.dup_map[filename] = dup_of
+                if not success:
+                    ERROR_NUMBER += 1
+                    print('=> download ERROR [{}]: {}'.format(status, temp['url']))
+                if DOWNLOAD_NUMBER % LOG_INTERVAL == 0:
+                    print('=> files downloaded: {}, errors: {}'.format(DOWNLOAD_NUMBER, ERROR_NUMBER))
+
+
+def produce(infile, queue, f2u, u2f, use_basename=False, journal=None):
+    """
+    put files to download into queue, files finished in journal are skipped
+    """
+    global SKIP_NUMBER, DUP_URL_NUMBER
+    i = int(args['--start-index'])
+    for buff in infile:
+        temp = dict()
+        # skip blank line
+        if not buff.strip():
+            continue
+        temp['url'] = buff.strip().split()[0]
+        if args['--dedup-url'] and temp['url'] in u2f:
+            DUP_URL_NUMBER += 1
+            continue
+        if use_basename:
+            temp['filename'] = os.path.join(
+                args['--download-path'], os.path.basename(temp['url']))
+        elif args['--date']:
+            temp['filename'] = os.path.join(
+                args['--download-path'], FILE_NAME.format(args['--date'], i))
+        else:
+            temp['filename'] = os.path.join(
+                args['--download-path'], FILE_NAME.format(i))
+        f2u[os.path.basename(temp['filename'])] = temp['url']
+        u2f[temp['url']] = os.path.basename(temp['filename'])
+        i += 1
+        if journal and journal.is_done(os.path.basename(temp['filename'])):
+            SKIP_NUMBER += 1
+            continue
+        queue.put(temp)
 
 
 def filename_init():
@@ -171,9 +400,9 @@ def filename_init():
     else:
         FILE_NAME = args['--prefix'] + '_{:0>8}' + \
             args['--suffix'] + '.' + args['--ext']
-        
+
     if not args['--basename']:
-        print('=> files will be saved as:', FILE_NAME.format(args['--date'], 0))
+        print('=> files will be saved as:', FILE_NAME.format(args['--date'], 0) if args['--date'] else FILE_NAME.format(0))
 
 
 def main():
@@ -182,24 +411,40 @@ def main():
     u2f = dict()
     filename_init()
     thread_count = int(args['<thread-number>'])
-    queue = Queue.Queue(0)
-    thread_prod = prod_worker(queue, infile, f2u, u2f, args['--basename'])
-    thread_prod.start()
-    print('=> thread:', thread_prod.name, 'successfully started')
-    time.sleep(1)
-    for i in xrange(thread_count):
-        exec('thread_cons_{} = cons_worker(queue, use_ss_dl={})'.format(i, args['--source-station']))
-        eval('thread_cons_{}.start()'.format(i))
-    thread_prod.join()
-    for i in xrange(thread_count):
-        eval('thread_cons_{}.join()'.format(i))
-    print('=> total error number:', ERROR_NUMBER)
+    journal = Journal(args['--journal']) if args['--journal'] else None
+    if journal:
+        print('=> {} files finished in journal will be skipped'.format(len(journal.done)))
+    content_index = ContentIndex(journal.hashes if journal else None) if args['--dedup-content'] else None
+    dup_map = dict(journal.dups) if journal else dict()
+    pool = HostPool(int(args['--max-per-host']), int(args['--timeout']))
+    # bounded, so urls are read only as fast as they are downloaded
+    task_queue = queue.Queue(thread_count * 4)
+    threads = [cons_worker(task_queue, pool, journal, use_ss_dl=args['--source-station'], content_index=content_index,
+                           dup_map=dup_map) for _ in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    tic = time.time()
+    produce(infile, task_queue, f2u, u2f, args['--basename'], journal)
+    for _ in threads:
+        task_queue.put(None)
+    for thread in threads:
+        thread.join()
+    pool.close()
+    if journal:
+        journal.close()
+    print('=> total downloaded: {}, skipped: {}, error number: {}, {:.1f} files/s'.format(
+        DOWNLOAD_NUMBER, SKIP_NUMBER, ERROR_NUMBER, DOWNLOAD_NUMBER / max(time.time() - tic, 1e-6)))
+    if args['--dedup-url'] or args['--dedup-content']:
+        print('=> duplicate urls: {}, duplicate contents removed: {}'.format(DUP_URL_NUMBER, DUP_CONTENT_NUMBER))
     infile.close()
     if args['--mapfile-path']:
         with open(os.path.join(args['--mapfile-path'],'f2u.json'), 'w') as f:
             json.dump(f2u, f, indent=4)
         with open(os.path.join(args['--mapfile-path'],'u2f.json'), 'w') as u:
             json.dump(u2f, u, indent=4)
+        if args['--dedup-content']:
+            with open(os.path.join(args['--mapfile-path'],'dup.json'), 'w') as d:
+                json.dump(dup_map, d, indent=4)
     else:
         pass
 
@@ -212,4 +457,3 @@ if __name__ == '__main__':
     print('=> start downloading...')
     main()
     print('=> ...done')
-
@@ -1,60 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Filter broken images, header-only check first, decode only if needed
+# Support Multi-process processing
+#
+
 from __future__ import print_function
 import os
 import sys
-import multiprocessing 
+import re
+import mmap
 import time
+import multiprocessing
+from collections import Counter
+import docopt
 import cv2
 import numpy as np
 
+cur_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(cur_path, 'mxnet-cubicle/img-cls/lib'))
+import img_header
+
 
 class ImgErr(RuntimeError):
     def __init__(self, msg):
         self.msg = msg
 
+    def __str__(self):
+        return self.msg
+
+
+class ImgSuspicious(ImgErr):
+    '''
+    header is readable but not enough to judge, e.g. unknown format or missing end marker
+    '''
+    pass
+
+
 SILENT_MODE = True  # set to NOT print error image path
-CLEAN_MODE = True  # DANGEROUS, set to delete error images simultaneously
-invalid_list = multiprocessing.Manager().list()
+CLEAN_MODE = False  # DANGEROUS, set to delete error images, could also be enabled by --clean
+TASK_CHUNK = 64     # images sent to a worker per task
+
+
+def _init_():
+    '''
+    Filter broken images with multi-process processing
+
+    Change log:
+    2026/10/18      v2.0        header-only validation of jpeg/png, decode only suspicious images,
+                                results collected by imap_unordered, explicit clean and dry-run
+
+    Usage:
+        img_filter_cv2.py           <num-proc> <image-list> [<image-prefix>]
+                                    [--decode --clean --dry-run --verbose --error-list=str]
+
+        img_filter_cv2.py           -v|--version
+        img_filter_cv2.py           -h|--help
+
+    Arguments:
+        <num-proc>                  number of processing processes
+        <image-list>                input image list
+        <image-prefix>              path to images, if needed
+
+    Options:
+        -h --help                   show this screen
+        -v --version                show script version
+        ------------------------------------------------------------------------------------------
+        --decode                    set to decode every image passing header check,
+                                    otherwise only suspicious images are decoded
+        --clean                     DANGEROUS, set to delete error images
+        --dry-run                   set to only list images which would be deleted, nothing removed
+        --verbose                   set to print error image path
+        --error-list=str            path to save error image list [default: ./_error_img.lst]
+    '''
+    print('=' * 80 + '\nArguments submitted:')
+    for key in sorted(args.keys()):
+        print ('{:<20}= {}'.format(key.replace('--', ''), args[key]))
+    print('=' * 80)
 
 
-def sub_proc(img_path):
+def _has_tail(buf, tag):
+    return tag in buf[max(0, len(buf) - img_header.TAIL_SIZE):]
+
+
+def check_header(img_path):
+    '''
+    header-only check of image file by img_header on a memory map, only pages read are loaded,
+    return (format, width, height, channels)
+    raise ImgErr if broken, ImgSuspicious if decoding is needed to judge
+    '''
+    with open(img_path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            raise ImgErr('empty file')
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
     try:
-        img_read = cv2.imread(img_path)
-        if np.shape(img_read) == tuple():
-            raise ImgErr('cv2 load error')
-    except:
-        if not SILENT_MODE:
-            print('=> Image error: {}'.format(img_path))
-        if CLEAN_MODE:
-            os.remove(img_path)
-            if not SILENT_MODE:
-                print('=> Delete image: {}'.format(img_path))
-        invalid_list.append(img_path)
-    return 0
+        head = buf[:8]
+        # a missing end marker may be encoder padding, let decoding judge
+        if head[:2] == b'\xff\xd8':
+            if not _has_tail(buf, b'\xff\xd9'):
+                raise ImgSuspicious('missing jpeg EOI')
+        elif head == img_header.PNG_SIGNATURE:
+            if not _has_tail(buf, b'IEND'):
+                raise ImgSuspicious('missing png IEND')
+        else:
+            raise ImgSuspicious('unknown format')
+        try:
+            return img_header.parse_header(buf)
+        except ValueError as e:
+            raise ImgErr(str(e))
+    finally:
+        buf.close()
 
 
-def main():
+def check_decode(img_path):
+    img_read = cv2.imread(img_path)
+    if np.shape(img_read) == tuple():
+        raise ImgErr('cv2 load error')
+
+
+def sub_proc(task):
     '''
-    :params: <num-proc> /path/to/image/list/file [/path/to/image/prefix, optinal]
+    return (img_path, None) if valid, otherwise (img_path, reason)
     '''
-    with open(sys.argv[2],'r') as f:
-        if len(sys.argv) == 3:
-            img_path_list = [x.strip() for x in f.readlines()]
-        elif len(sys.argv) == 4:
-            img_path_list = [os.path.join(sys.argv[3],x.strip()) for x in f.readlines()]
+    img_path, decode = task
+    try:
+        try:
+            check_header(img_path)
+        except ImgSuspicious:
+            decode = True
+        if decode:
+            check_decode(img_path)
+    except ImgErr as e:
+        return img_path, e.msg
+    except (IOError, OSError) as e:
+        return img_path, 'io error: {}'.format(e.strerror)
+    except Exception as e:
+        return img_path, 'error: {}'.format(e)
+    return img_path, None
+
+
+def main():
+    global SILENT_MODE, CLEAN_MODE
+    SILENT_MODE = SILENT_MODE and not args['--verbose']
+    CLEAN_MODE = CLEAN_MODE or args['--clean'] or args['--dry-run']
+    with open(args['<image-list>'], 'r') as f:
+        if args['<image-prefix>']:
+            img_path_list = [os.path.join(args['<image-prefix>'], x.strip()) for x in f if x.strip()]
         else:
-            print('Invalid args')
-            return 0
-    pool = multiprocessing.Pool(processes=int(sys.argv[1]))
+            img_path_list = [x.strip() for x in f if x.strip()]
+    pool = multiprocessing.Pool(processes=int(args['<num-proc>']))
     tic = time.time()
-    ret = pool.map(sub_proc, img_path_list)
-    with open('./_error_img.lst','w') as f:
+    invalid_list = list()
+    reasons = Counter()
+    tasks = ((x, args['--decode']) for x in img_path_list)
+    try:
+        for img_path, reason in pool.imap_unordered(sub_proc, tasks, chunksize=TASK_CHUNK):
+            if reason is None:
+                continue
+            invalid_list.append(img_path)
+            reasons[re.sub(r' at \d+', '', reason)] += 1
+            if not SILENT_MODE:
+                print('=> Image error: {}, {}'.format(img_path, reason))
+    finally:
+        pool.terminate()
+    with open(args['--error-list'], 'w') as f:
         for img in invalid_list:
             f.write(img + '\n')
-    print('=> Total image number:',len(img_path_list))
-    print('=> Filtered image number:',len(invalid_list))
-    print('=> Error image list temporarily saved in ./_error_img.lst')
+    if CLEAN_MODE:
+        for img in invalid_list:
+            if args['--dry-run']:
+                print('=> Would delete image: {}'.format(img))
+                continue
+            try:
+                os.remove(img)
+            except OSError:
+                continue
+            if not SILENT_MODE:
+                print('=> Delete image: {}'.format(img))
+    print('=> Total image number:', len(img_path_list))
+    print('=> Filtered image number:', len(invalid_list))
+    for reason, num in reasons.most_common():
+        print('   {:<40}{}'.format(reason, num))
+    if CLEAN_MODE:
+        print('=> {} image number: {}'.format('Deletable' if args['--dry-run'] else 'Deleted', len(invalid_list)))
+    print('=> Error image list saved in {}'.format(args['--error-list']))
     print('=> Processing time: {:.6f}s'.format(time.time() - tic))
 
 
 if __name__ == '__main__':
+    version = re.compile('.*\d+/\d+\s+(v[\d.]+)').findall(_init_.__doc__)[0]
+    args = docopt.docopt(_init_.__doc__, version='Multi-process image filter {}'.format(
+        version), argv=None, help=True, options_first=False)
+    _init_()
     main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# created 2026/10/18 @Northrend
+#
+# Recall and latency of IVF-PQ index against exact search
+#
+
+from __future__ import print_function
+import re
+import time
+import logging
+import docopt
+import numpy as np
+
+from feat_search import FeatureSearcher
+from ivf_pq import IVFPQIndex
+
+# init global logger
+log_format = '%(asctime)s %(levelname)s: %(message)s'
+logging.basicConfig(level=logging.INFO, format=log_format)
+logger = logging.getLogger()
+
+
+def _init_():
+    '''
+    Benchmark recall-vs-latency of IVFPQIndex, with FeatureSearcher as ground truth
+    Update: 2026/10/18
+    Author: @Northrend
+    Contributor:
+
+    Change log:
+    2026/10/18      v1.0            basic functions
+
+    Usage:
+        benchmark_ivf_pq.py     <corpus-npy> [<query-npy>] [--metric=str --top-k=int]
+                                [--nlist=int --m=int --nbits=int --nprobe=str]
+                                [--num-queries=int --index-prefix=str]
+        benchmark_ivf_pq.py     -v | --version
+        benchmark_ivf_pq.py     -h | --help
+
+    Arguments:
+        <corpus-npy>            N x D features saved by mxnet_feature_extractor.py
+        <query-npy>             Q x D query features, sampled from corpus if not given
+
+    Options:
+        -h --help               show this help screen
+        -v --version            show current version
+        ---------------------------------------------------------------------------
+        --metric=str            cosine or euclid [default: cosine]
+        --top-k=int             recall is measured on top-k [default: 10]
+        --nlist=int             number of inverted lists [default: 1024]
+        --m=int                 number of sub-quantizers [default: 16]
+        --nbits=int             bits per sub-quantizer code [default: 8]
+        --nprobe=str            comma-separated numbers of lists probed [default: 1,4,16,64]
+        --num-queries=int       number of queries sampled from corpus [default: 1000]
+        --index-prefix=str      load index from this prefix if it exists, otherwise build and save to it
+    '''
+    logger.info('=' * 80 + '\nArguments submitted:')
+    for key in sorted(args.keys()):
+        logger.info('{:<20}= {}'.format(key.replace('--', ''), args[key]))
+    logger.info('=' * 80)
+
+
+def recall_at_k(result, ground_truth):
+    '''
+    fraction of exact top-k found in approximate top-k
+    '''
+    hits = sum(len(np.intersect1d(x, y)) for x, y in zip(result, ground_truth))
+    return float(hits) / ground_truth.size
+
+
+def _build_index(corpus):
+    index_prefix = args['--index-prefix']
+    if index_prefix:
+        try:
+            index = IVFPQIndex.load(index_prefix)
+            logger.info('Index of {} vectors loaded: {}'.format(index.ntotal, index_prefix))
+            return index
+        except IOError:
+            pass
+    index = IVFPQIndex(corpus.shape[1], nlist=int(args['--nlist']), m=int(args['--m']),
+                       nbits=int(args['--nbits']), metric=args['--metric'])
+    tic = time.time()
+    index.train(corpus)
+    logger.info('Trained in {:.3f}s'.format(time.time() - tic))
+    tic = time.time()
+    index.add(corpus)
+    logger.info('{} vectors added in {:.3f}s'.format(index.ntotal, time.time() - tic))
+    if index_prefix:
+        index.save(index_prefix)
+    return index
+
+
+def main():
+    k = int(args['--top-k'])
+    corpus = np.load(args['<corpus-npy>'], mmap_mode='r')
+    if args['<query-npy>']:
+        queries = np.asarray(np.load(args['<query-npy>']), dtype=np.float32)
+    else:
+        rng = np.random.RandomState(0)
+        sel = rng.choice(len(corpus), min(int(args['--num-queries']), len(corpus)), replace=False)
+        queries = np.asarray(corpus[np.sort(sel)], dtype=np.float32)
+
+    searcher = FeatureSearcher(corpus, metric=args['--metric'], chunked=True)
+    tic = time.time()
+    ground_truth, _ = searcher.search(queries, k=k)
+    time_exact = (time.time() - tic) / len(queries)
+
+    index = _build_index(corpus)
+    logger.info('{:<10}{:>12}{:>16}'.format('nprobe', 'recall@{}'.format(k), 'ms per query'))
+    logger.info('{:<10}{:>12.4f}{:>16.3f}'.format('exact', 1.0, time_exact * 1000))
+    for nprobe in [int(x) for x in args['--nprobe'].split(',')]:
+        tic = time.time()
+        result, _ = index.search(queries, k=k, nprobe=nprobe)
+        latency = (time.time() - tic) / len(queries)
+        logger.info('{:<10}{:>12.4f}{:>16.3f}'.format(nprobe, recall_at_k(result, ground_truth), latency * 1000))
+
+
+if __name__ == '__main__':
+    version = re.compile('.*\d+/\d+\s+(v[\d.]+)').findall(_init_.__doc__)[0]
+    args = docopt.docopt(
+        _init_.__doc__, version='IVF-PQ benchmark {}'.format(version))
+    _init_()
+    main()
+    logger.info('...done')
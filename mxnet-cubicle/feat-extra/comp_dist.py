@@ -4,23 +4,25 @@ import numpy.linalg as linalg
 
 
 def euclid(target,source):
-    result = list()
-    for s in source:
-            result.append(linalg.norm(target-s))
-    _ = zip(xrange(len(result)),result)
-    return sorted(_,key=lambda x:x[1])
+    '''
+    distances from target to all source vectors, list of (index, distance) in ascending order
+    for top-k retrieval over large corpus, use feat_search.FeatureSearcher instead
+    '''
+    result = linalg.norm(np.asarray(source) - target, axis=1)
+    order = np.argsort(result, kind='mergesort')
+    return zip(order.tolist(), result[order])
 
 def cosine(target,source):
-    result = list()
-    for s in source:
-            d = np.dot(target, s)
-            denom = linalg.norm(target) * linalg.norm(s)
-            if d == 0:
-                    result.append(-1)
-            else:
-                    result.append(d/denom)
-    _ = zip(xrange(len(result)),result)
-    return sorted(_,key=lambda x:x[1])
+    '''
+    cosine similarities of target to all source vectors, list of (index, similarity) in ascending order
+    '''
+    source = np.asarray(source)
+    d = source.dot(target)
+    denom = linalg.norm(target) * linalg.norm(source, axis=1)
+    result = np.full(d.shape, -1, dtype=np.float64)
+    np.divide(d, denom, out=result, where=d != 0)
+    order = np.argsort(result, kind='mergesort')
+    return zip(order.tolist(), result[order])
 
 def main():
     pass
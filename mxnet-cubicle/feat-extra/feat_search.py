@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# created 2026/10/18 @Northrend
+#
+# Exact nearest-neighbour search over extracted features
+#
+
+from __future__ import print_function
+import re
+import time
+import logging
+import docopt
+import numpy as np
+
+
+BLOCK_SIZE = 65536      # corpus rows scored per matrix multiply
+QUERY_BATCH = 256       # queries scored together
+
+# init global logger
+log_format = '%(asctime)s %(levelname)s: %(message)s'
+logging.basicConfig(level=logging.INFO, format=log_format)
+logger = logging.getLogger()
+
+
+def _init_():
+    '''
+    Top-k nearest-neighbour search of query features in a feature corpus
+    Update: 2026/10/18
+    Author: @Northrend
+    Contributor:
+
+    Change log:
+    2026/10/18      v1.0            basic functions
+
+    Usage:
+        feat_search.py      <corpus-npy> <query-npy> <out-prefix>
+                            [--top-k=int --metric=str --dtype=str --chunked]
+                            [--block-size=int --query-batch=int --normalized]
+        feat_search.py      -v | --version
+        feat_search.py      -h | --help
+
+    Arguments:
+        <corpus-npy>        N x D features saved by mxnet_feature_extractor.py
+        <query-npy>         Q x D query features
+        <out-prefix>        <out-prefix>_index.npy and <out-prefix>_score.npy will be saved
+
+    Options:
+        -h --help           show this help screen
+        -v --version        show current version
+        ---------------------------------------------------------------------------
+        --top-k=int         number of neighbours per query [default: 10]
+        --metric=str        cosine or euclid [default: cosine]
+        --dtype=str         dtype of corpus held in memory, float32 or float16 [default: float32]
+        --chunked           keep corpus memory-mapped on disk, for corpora larger than RAM
+        --block-size=int    corpus rows per matrix multiply [default: 65536]
+        --query-batch=int   queries per matrix multiply [default: 256]
+        --normalized        corpus rows are already l2-normalized, e.g. by normalize_features()
+    '''
+    logger.info('=' * 80 + '\nArguments submitted:')
+    for key in sorted(args.keys()):
+        logger.info('{:<20}= {}'.format(key.replace('--', ''), args[key]))
+    logger.info('=' * 80)
+
+
+def _load_features(features):
+    '''
+    accept ndarray or path to .npy, which is memory-mapped
+    '''
+    if isinstance(features, np.ndarray):
+        return features
+    return np.load(features, mmap_mode='r')
+
+
+def _row_norms(features, block_size=BLOCK_SIZE):
+    '''
+    l2 norms of all rows, computed block by block
+    '''
+    norms = np.empty(features.shape[0], dtype=np.float32)
+    for start in range(0, features.shape[0], block_size):
+        block = np.asarray(features[start:start + block_size], dtype=np.float32)
+        norms[start:start + block_size] = np.sqrt(np.einsum('ij,ij->i', block, block))
+    return norms
+
+
+def _safe_inverse(norms):
+    inv = np.zeros_like(norms)
+    np.divide(1, norms, out=inv, where=norms > 0)
+    return inv
+
+
+def _block_topk(scores, k):
+    '''
+    column indices and values of the k largest scores in each row, unordered
+    '''
+    rows = np.arange(scores.shape[0])[:, np.newaxis]
+    if scores.shape[1] > k:
+        cols = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        cols = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    return cols, scores[rows, cols]
+
+
+def _merge_topk(best_idx, best_score, scores, offset, k):
+    '''
+    merge top-k of one block of scores into running top-k
+    '''
+    cols, values = _block_topk(scores, k)
+    cols += offset
+    if best_idx is None:
+        return cols, values
+    cand_idx, cand_score = np.hstack([best_idx, cols]), np.hstack([best_score, values])
+    sel, best_score = _block_topk(cand_score, k)
+    return cand_idx[np.arange(cand_idx.shape[0])[:, np.newaxis], sel], best_score
+
+
+def normalize_features(src, dst, dtype='float16', block_size=BLOCK_SIZE):
+    '''
+    write l2-normalized copy of features into .npy file block by block,
+    which could be searched with normalized=True in chunked mode
+    '''
+    features = _load_features(src)
+    out = np.lib.format.open_memmap(dst, mode='w+', dtype=dtype, shape=features.shape)
+    for start in range(0, features.shape[0], block_size):
+        block = np.asarray(features[start:start + block_size], dtype=np.float32)
+        out[start:start + block_size] = block * _safe_inverse(np.sqrt(np.einsum('ij,ij->i', block, block)))[:, np.newaxis]
+    out.flush()
+    return out
+
+
+class FeatureSearcher(object):
+    '''
+    Exact top-k search of queries in an N x D feature corpus with blocked matrix multiplies.
+
+    In memory mode, the corpus is loaded as dtype (float16 halves memory), and for cosine
+    rows are normalized in advance. In chunked mode, the corpus stays memory-mapped and is
+    read block by block on each search, only per-row norms are held in memory.
+    Scores are always computed in float32.
+    '''
+    def __init__(self, features, metric='cosine', dtype='float32', chunked=False, normalized=False, block_size=BLOCK_SIZE):
+        assert metric in ('cosine', 'euclid'), logger.error('metric should be cosine or euclid')
+        features = _load_features(features)
+        assert features.ndim == 2, logger.error('features should be a N x D matrix')
+        self.metric = metric
+        self.chunked = chunked
+        self.block_size = block_size
+        self.num, self.dim = features.shape
+        norms = np.ones(self.num, dtype=np.float32) if normalized else _row_norms(features, block_size)
+        self._sq_norms = np.square(norms)
+        self._inv_norms = None
+        if chunked:
+            self.features = features
+            if metric == 'cosine' and not normalized:
+                self._inv_norms = _safe_inverse(norms)
+        else:
+            self.features = np.empty(features.shape, dtype=dtype)
+            inv_norms = _safe_inverse(norms)
+            for start in range(0, self.num, block_size):
+                block = np.asarray(features[start:start + block_size], dtype=np.float32)
+                if metric == 'cosine':
+                    block = block * inv_norms[start:start + block_size, np.newaxis]
+                self.features[start:start + block_size] = block
+            if metric == 'euclid':
+                # norms of rows actually stored
+                self._sq_norms = np.square(_row_norms(self.features, block_size))
+
+    def search(self, queries, k=10, query_batch=QUERY_BATCH):
+        '''
+        return Q x k indices and scores, sorted from the nearest:
+        cosine similarity in descending order, or euclidean distance in ascending order
+        '''
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        assert queries.shape[1] == self.dim, logger.error('dimension of queries mismatch')
+        k = min(k, self.num)
+        indices = np.empty((queries.shape[0], k), dtype=np.int64)
+        scores = np.empty((queries.shape[0], k), dtype=np.float32)
+        for q_start in range(0, queries.shape[0], query_batch):
+            query = queries[q_start:q_start + query_batch]
+            q_sq_norms = np.einsum('ij,ij->i', query, query)
+            if self.metric == 'cosine':
+                query = query * _safe_inverse(np.sqrt(q_sq_norms))[:, np.newaxis]
+            best_idx, best_score = None, None
+            for start in range(0, self.num, self.block_size):
+                stop = min(start + self.block_size, self.num)
+                block_scores = query.dot(np.asarray(self.features[start:stop], dtype=np.float32).T)
+                if self.metric == 'cosine' and self._inv_norms is not None:
+                    block_scores *= self._inv_norms[start:stop]
+                elif self.metric == 'euclid':
+                    # -|q-x|^2 without the constant |q|^2
+                    block_scores = 2 * block_scores - self._sq_norms[start:stop]
+                best_idx, best_score = _merge_topk(best_idx, best_score, block_scores, start, k)
+            order = np.argsort(-best_score, axis=1, kind='mergesort')
+            rows = np.arange(order.shape[0])[:, np.newaxis]
+            best_idx, best_score = best_idx[rows, order], best_score[rows, order]
+            if self.metric == 'euclid':
+                best_score = np.sqrt(np.maximum(q_sq_norms[:, np.newaxis] - best_score, 0))
+            indices[q_start:q_start + query_batch] = best_idx
+            scores[q_start:q_start + query_batch] = best_score
+        return indices, scores
+
+
+def main():
+    tic = time.time()
+    searcher = FeatureSearcher(args['<corpus-npy>'], metric=args['--metric'], dtype=args['--dtype'], chunked=args['--chunked'],
+                               normalized=args['--normalized'], block_size=int(args['--block-size']))
+    logger.info('Corpus of {} x {} prepared in {:.3f}s'.format(searcher.num, searcher.dim, time.time() - tic))
+    queries = np.load(args['<query-npy>'], mmap_mode='r')
+    tic = time.time()
+    indices, scores = searcher.search(queries, k=int(args['--top-k']), query_batch=int(args['--query-batch']))
+    logger.info('{} queries searched in {:.3f}s'.format(len(queries), time.time() - tic))
+    np.save(args['<out-prefix>'] + '_index.npy', indices)
+    np.save(args['<out-prefix>'] + '_score.npy', scores)
+
+
+if __name__ == '__main__':
+    version = re.compile('.*\d+/\d+\s+(v[\d.]+)').findall(_init_.__doc__)[0]
+    args = docopt.docopt(
+        _init_.__doc__, version='Feature search {}'.format(version))
+    _init_()
+    logger.info('Start searching...')
+    main()
+    logger.info('...done')
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# created 2026/10/18 @Northrend
+#
+# Inverted-file index with product-quantized residuals over extracted features
+#
+
+from __future__ import print_function
+import os
+import json
+import logging
+import numpy as np
+
+
+INDEX_VERSION = 1
+BLOCK_SIZE = 65536          # vectors assigned per matrix multiply
+TRAIN_PER_CENTROID = 256    # max training vectors sampled per centroid
+
+
+def _normalize(data):
+    norms = np.sqrt(np.einsum('ij,ij->i', data, data))
+    norms[norms == 0] = 1
+    return data / norms[:, np.newaxis]
+
+
+def assign_nearest(data, centroids, block_size=BLOCK_SIZE):
+    '''
+    index of the nearest centroid and the squared distance to it, for each row of data
+    '''
+    c_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assign = np.empty(len(data), dtype=np.int64)
+    dists = np.empty(len(data), dtype=np.float32)
+    for start in range(0, len(data), block_size):
+        block = np.asarray(data[start:start + block_size], dtype=np.float32)
+        # |x-c|^2 = |x|^2 - 2x.c + |c|^2
+        block_dists = c_sq_norms - 2 * block.dot(centroids.T)
+        assign[start:start + block_size] = np.argmin(block_dists, axis=1)
+        dists[start:start + block_size] = block_dists[np.arange(len(block)), assign[start:start + block_size]] + \
+            np.einsum('ij,ij->i', block, block)
+    return assign, np.maximum(dists, 0)
+
+
+def kmeans(data, k, niter=20, seed=0, block_size=BLOCK_SIZE):
+    '''
+    lloyd's k-means, empty clusters are re-seeded with random vectors
+    '''
+    data = np.asarray(data, dtype=np.float32)
+    assert len(data) >= k, logging.error('At least {} training vectors are needed, got {}'.format(k, len(data)))
+    rng = np.random.RandomState(seed)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(niter):
+        assign, _ = assign_nearest(data, centroids, block_size)
+        counts = np.bincount(assign, minlength=k)
+        nonempty = np.flatnonzero(counts)
+        starts = (np.cumsum(counts) - counts)[nonempty]
+        sums = np.add.reduceat(data[np.argsort(assign, kind='mergesort')], starts, axis=0)
+        centroids[nonempty] = sums / counts[nonempty, np.newaxis]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+class IVFPQIndex(object):
+    '''
+    Approximate nearest-neighbour index:
+    coarse k-means quantizer of nlist centroids, one inverted list per centroid,
+    residuals to centroids encoded by m sub-quantizers of 2^nbits centroids each.
+
+    Files sharing one prefix, written by save():
+    <prefix>.meta               json header
+    <prefix>.coarse.npy         nlist x d coarse centroids
+    <prefix>.pq.npy             m x 2^nbits x d/m sub-quantizer centroids
+    <prefix>.offsets.npy        nlist+1 int64, list l takes rows offsets[l]:offsets[l+1]
+    <prefix>.ids.npy            N int64 ids grouped by list
+    <prefix>.codes.npy          N x m uint8 codes grouped by list
+    ids and codes are memory-mapped by load(), vectors added afterwards are
+    kept in memory until next save().
+    '''
+    def __init__(self, dim, nlist=1024, m=16, nbits=8, metric='euclid'):
+        assert metric in ('cosine', 'euclid'), logging.error('metric should be cosine or euclid')
+        assert dim % m == 0, logging.error('dim {} should be divisible by m {}'.format(dim, m))
+        assert 0 < nbits <= 8, logging.error('nbits should be in [1, 8]')
+        self.dim, self.nlist, self.m, self.nbits, self.metric = dim, nlist, m, nbits, metric
+        self.ksub, self.dsub = 1 << nbits, dim // m
+        self.coarse_centroids = None
+        self.pq_centroids = None
+        self._offsets = np.zeros(nlist + 1, dtype=np.int64)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._codes = np.zeros((0, m), dtype=np.uint8)
+        self._pending_ids = [list() for _ in range(nlist)]
+        self._pending_codes = [list() for _ in range(nlist)]
+        self._num_pending = 0
+
+    @property
+    def is_trained(self):
+        return self.coarse_centroids is not None
+
+    @property
+    def ntotal(self):
+        return len(self._ids) + self._num_pending
+
+    def _prepare(self, data):
+        data = np.atleast_2d(np.asarray(data, dtype=np.float32))
+        assert data.shape[1] == self.dim, logging.error('dimension mismatch: {} vs {}'.format(data.shape[1], self.dim))
+        return _normalize(data) if self.metric == 'cosine' else data
+
+    def train(self, data, niter=20, max_train=None, seed=0):
+        '''
+        train coarse and sub-quantizers on a random sample of data
+        '''
+        max_train = max_train or TRAIN_PER_CENTROID * max(self.nlist, self.ksub)
+        rng = np.random.RandomState(seed)
+        if len(data) > max_train:
+            sample = self._prepare(data[np.sort(rng.choice(len(data), max_train, replace=False))])
+        else:
+            sample = self._prepare(data[:])
+        logging.info('Training coarse quantizer with {} vectors...'.format(len(sample)))
+        self.coarse_centroids = kmeans(sample, self.nlist, niter=niter, seed=seed)
+        assign, _ = assign_nearest(sample, self.coarse_centroids)
+        residuals = sample - self.coarse_centroids[assign]
+        self.pq_centroids = np.empty((self.m, self.ksub, self.dsub), dtype=np.float32)
+        for j in range(self.m):
+            logging.info('Training sub-quantizer {}/{}...'.format(j + 1, self.m))
+            self.pq_centroids[j] = kmeans(residuals[:, j * self.dsub:(j + 1) * self.dsub], self.ksub, niter=niter, seed=seed + j + 1)
+
+    def encode(self, residuals):
+        '''
+        n x d residuals to n x m uint8 codes
+        '''
+        codes = np.empty((len(residuals), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j], _ = assign_nearest(residuals[:, j * self.dsub:(j + 1) * self.dsub], self.pq_centroids[j])
+        return codes
+
+    def add(self, data, ids=None, block_size=BLOCK_SIZE):
+        '''
+        add vectors into inverted lists, ids are sequential from ntotal if not given
+        '''
+        assert self.is_trained, logging.error('Index should be trained before adding vectors')
+        if ids is None:
+            ids = np.arange(self.ntotal, self.ntotal + len(data), dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+        assert len(ids) == len(data), logging.error('Number of ids and vectors mismatch')
+        for start in range(0, len(data), block_size):
+            block = self._prepare(data[start:start + block_size])
+            block_ids = ids[start:start + block_size]
+            assign, _ = assign_nearest(block, self.coarse_centroids)
+            codes = self.encode(block - self.coarse_centroids[assign])
+            order = np.argsort(assign, kind='mergesort')
+            counts = np.bincount(assign, minlength=self.nlist)
+            bounds = np.concatenate([[0], np.cumsum(counts)])
+            for l in np.flatnonzero(counts):
+                sel = order[bounds[l]:bounds[l + 1]]
+                self._pending_ids[l].append(block_ids[sel])
+                self._pending_codes[l].append(codes[sel])
+            self._num_pending += len(block)
+
+    def _inverted_list(self, l):
+        ids, codes = self._ids[self._offsets[l]:self._offsets[l + 1]], self._codes[self._offsets[l]:self._offsets[l + 1]]
+        if self._pending_ids[l]:
+            ids = np.concatenate([ids] + self._pending_ids[l])
+            codes = np.concatenate([codes] + self._pending_codes[l])
+        return ids, codes
+
+    def search(self, queries, k=10, nprobe=8):
+        '''
+        return Q x k ids and scores, sorted from the nearest:
+        approximate cosine similarity in descending order, or euclidean distance in ascending order
+        missing results are filled with id -1
+        '''
+        assert self.is_trained, logging.error('Index should be trained before searching')
+        queries = self._prepare(queries)
+        nprobe = min(nprobe, self.nlist)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), np.inf, dtype=np.float32)
+        c_sq_norms = np.einsum('ij,ij->i', self.coarse_centroids, self.coarse_centroids)
+        coarse_dists = c_sq_norms - 2 * queries.dot(self.coarse_centroids.T)
+        probes = np.argpartition(coarse_dists, nprobe - 1, axis=1)[:, :nprobe] if nprobe < self.nlist else \
+            np.tile(np.arange(self.nlist), (len(queries), 1))
+        # offsets of each sub-quantizer in flattened distance table
+        table_offsets = np.arange(self.m, dtype=np.int64) * self.ksub
+        for q, query in enumerate(queries):
+            cand_ids, cand_dists = list(), list()
+            for l in probes[q]:
+                ids, codes = self._inverted_list(l)
+                if not len(ids):
+                    continue
+                residual = (query - self.coarse_centroids[l]).reshape(self.m, 1, self.dsub)
+                # m x ksub squared distances from residual to sub-quantizer centroids
+                table = np.square(self.pq_centroids - residual).sum(axis=2)
+                cand_ids.append(ids)
+                cand_dists.append(np.take(table.ravel(), codes + table_offsets).sum(axis=1))
+            if not cand_ids:
+                continue
+            cand_ids, cand_dists = np.concatenate(cand_ids), np.concatenate(cand_dists)
+            if len(cand_ids) > k:
+                sel = np.argpartition(cand_dists, k - 1)[:k]
+                cand_ids, cand_dists = cand_ids[sel], cand_dists[sel]
+            order = np.argsort(cand_dists, kind='mergesort')
+            indices[q, :len(order)] = cand_ids[order]
+            scores[q, :len(order)] = cand_dists[order]
+        if self.metric == 'cosine':
+            # |a-b|^2 = 2 - 2cos(a,b) for unit vectors
+            scores = np.where(indices >= 0, 1 - scores / 2, -np.inf).astype(np.float32)
+        else:
+            scores = np.sqrt(np.maximum(scores, 0))
+        return indices, scores
+
+    def save(self, prefix):
+        '''
+        write index files, inverted lists are merged list by list into memmaps
+        '''
+        assert self.is_trained, logging.error('Index should be trained before saving')
+        np.save(prefix + '.coarse.npy', self.coarse_centroids)
+        np.save(prefix + '.pq.npy', self.pq_centroids)
+        offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        for l in range(self.nlist):
+            offsets[l + 1] = offsets[l] + self._offsets[l + 1] - self._offsets[l] + sum(len(x) for x in self._pending_ids[l])
+        # written aside first, since current lists may be memory-mapped from the same files
+        ids = np.lib.format.open_memmap(prefix + '.ids.npy.tmp', mode='w+', dtype=np.int64, shape=(int(offsets[-1]),))
+        codes = np.lib.format.open_memmap(prefix + '.codes.npy.tmp', mode='w+', dtype=np.uint8, shape=(int(offsets[-1]), self.m))
+        for l in range(self.nlist):
+            ids[offsets[l]:offsets[l + 1]], codes[offsets[l]:offsets[l + 1]] = self._inverted_list(l)
+        ids.flush()
+        codes.flush()
+        del ids, codes
+        os.rename(prefix + '.ids.npy.tmp', prefix + '.ids.npy')
+        os.rename(prefix + '.codes.npy.tmp', prefix + '.codes.npy')
+        np.save(prefix + '.offsets.npy', offsets)
+        meta = {
+            'version': INDEX_VERSION,
+            'dim': self.dim,
+            'nlist': self.nlist,
+            'm': self.m,
+            'nbits': self.nbits,
+            'metric': self.metric,
+            'ntotal': int(offsets[-1])
+        }
+        with open(prefix + '.meta', 'w') as f:
+            json.dump(meta, f, indent=2)
+        self._load_lists(prefix)
+        logging.info('Index of {} vectors saved: {}.*'.format(self.ntotal, prefix))
+
+    def _load_lists(self, prefix):
+        self._offsets = np.load(prefix + '.offsets.npy')
+        if self._offsets[-1]:
+            self._ids = np.load(prefix + '.ids.npy', mmap_mode='r')
+            self._codes = np.load(prefix + '.codes.npy', mmap_mode='r')
+        else:
+            self._ids = np.zeros(0, dtype=np.int64)
+            self._codes = np.zeros((0, self.m), dtype=np.uint8)
+        self._pending_ids = [list() for _ in range(self.nlist)]
+        self._pending_codes = [list() for _ in range(self.nlist)]
+        self._num_pending = 0
+
+    @classmethod
+    def load(cls, prefix):
+        with open(prefix + '.meta', 'r') as f:
+            meta = json.load(f)
+        assert meta['version'] == INDEX_VERSION, logging.error('Unsupported index version: {}'.format(meta['version']))
+        index = cls(meta['dim'], nlist=meta['nlist'], m=meta['m'], nbits=meta['nbits'], metric=meta['metric'])
+        index.coarse_centroids = np.load(prefix + '.coarse.npy')
+        index.pq_centroids = np.load(prefix + '.pq.npy')
+        index._load_lists(prefix)
+        return index
@@ -2,9 +2,13 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import print_function
-import sys
 import os
+import re
 import time
+import json
+import functools
+import threading
+import multiprocessing
 import cv2
 import mxnet as mx
 import pprint
@@ -13,6 +17,53 @@ import numpy as np
 import docopt
 
 
+Batch = namedtuple('Batch', ['data'])
+
+
+def _init_():
+    '''
+    Extract features of images from internal layers of a model, streamed into .npy files
+    Update: 2026/10/18
+    Author: @Northrend
+    Contributor:
+
+    Change log:
+    2026/10/18      v2.0            batched extraction with parallel decoding,
+                                    streaming output and resuming
+    earlier         v1.0            one image per forward, sys.argv interface
+
+    Usage:
+        mxnet_feature_extractor.py  <model-prefix> <epoch> <image-list> <output-prefix> <image-root>
+                                    [--gpu=int --batch-size=int --workers=int --layers=str]
+                                    [--img-width=int --save-interval=int --resume]
+        mxnet_feature_extractor.py  -v | --version
+        mxnet_feature_extractor.py  -h | --help
+
+    Arguments:
+        <model-prefix>      prefix of mxnet checkpoint
+        <epoch>             epoch of mxnet checkpoint
+        <image-list>        one image path per line, relative to image-root
+        <output-prefix>     <output-prefix>_<layer>.npy will be saved for each layer
+        <image-root>        prefix of image paths
+
+    Options:
+        -h --help           show this help screen
+        -v --version        show current version
+        ---------------------------------------------------------------------------
+        --gpu=int           gpu id [default: 0]
+        --batch-size=int    images per forward [default: 32]
+        --workers=int       number of image decoding processes [default: 8]
+        --layers=str        comma-separated internal layers to extract [default: flatten0_output]
+        --img-width=int     input width and height [default: 224]
+        --save-interval=int flush outputs and record progress every n batches [default: 20]
+        --resume            continue a partially finished run from its last recorded row
+    '''
+    print('=' * 80 + '\nArguments submitted:')
+    for key in sorted(args.keys()):
+        print('{:<20}= {}'.format(key.replace('--', ''), args[key]))
+    print('=' * 80)
+
+
 def net_init(model_prefix,model_epoch,gpu=0,feature_layers=['flatten0_output'],batch_size=1,image_width=224):
     '''
     initialize mxnet model
@@ -29,88 +80,176 @@ def net_init(model_prefix,model_epoch,gpu=0,feature_layers=['flatten0_output'],b
     return model
 
 
-def extra_feature(model, image_path):
-    resize_width = 224
+def preprocess(image_path, resize_width=224):
+    '''
+    read and normalize one image into 3 x w x w float32 array, None if reading failed
+    '''
     mean_r, mean_g, mean_b = 123.68, 116.779, 103.939
     std_r, std_g, std_b = 58.395, 57.12, 57.375
-    Batch = namedtuple('Batch', ['data'])
     img_read = cv2.imread(image_path)
     if np.shape(img_read) == tuple():
         return None
     img = cv2.cvtColor(img_read, cv2.COLOR_BGR2RGB)
-    img = img.astype(float)
+    img = img.astype(np.float32)
     img = cv2.resize(img, (resize_width, resize_width))
     img -= [mean_r, mean_g, mean_b]
     img /= [std_r, std_g, std_b]
-    img = np.swapaxes(img, 0, 2)
-    img = np.swapaxes(img, 1, 2)
-    img_batch = mx.nd.array(np.zeros((1,3,224,224)))
-    img_batch[0] = mx.nd.array(img)
-    
-    model.forward(Batch([img_batch]))
-    # output = model.get_outputs()[0].asnumpy()
-    _output = [x.asnumpy() for x in model.get_outputs()]
+    return img.transpose(2, 0, 1)
+
+
+def extract_batch(model, img_batch):
+    '''
+    forward n x 3 x w x w batch, return list of n x d features, one for each layer
+    outputs with spatial dimensions are averaged over them
+    '''
+    model.forward(Batch([mx.nd.array(img_batch)]))
     output = list()
-    for op in _output:
+    for op in model.get_outputs():
+        op = op.asnumpy()
         assert len(op.shape) > 1, 'output shape error!'
-        # print(op.shape)
         if len(op.shape) > 2:
             output.append(np.mean(op,axis=(2,3)))
         else:
             output.append(op)
-    # print('len(output):',len(output))
-    # print('output.shape:',output[0].shape,output[1].shape)
     return output
 
-def main():
+
+def extra_feature(model, image_path):
+    img = preprocess(image_path)
+    if img is None:
+        return None
+    return extract_batch(model, img[np.newaxis])
+
+
+def _progress_path(output_prefix):
+    return output_prefix + '.progress'
+
+
+def _read_progress(output_prefix):
     '''
-    :inputs: /path/to/model/prefix epoch /path/to/images.lst /path/to/prefix/of/result.npy /path/to/image/prefix
+    return number of rows already on disk and indices of failed images
     '''
-    # root_path = './test-images/'
-    root_path = sys.argv[5] 
-    with open(sys.argv[3],'r') as f:
-        images = [os.path.join(root_path,x.strip()) for x in f.readlines()]
-    image_number = len(images)
-    # feature_dim = 3
-    # feature_dim_1 = [64,112,112]
-    # feature_dim_2 = [256,56,56]
-    # feature_dim_3 = [512,28,28]
-    # feature_dim_4 = [1024]    # 1024,14,14 
-    # feature_dim_5 = [2048]    # 2048,7,7
-    feature_dim_6 = [2048]
-    feature_dims = [[image_number]]
-    feature_dims[0].extend(feature_dim_6)
-    # feature_dims = [[image_number], [image_number]]
-    # feature_dims[0].extend(feature_dim_4)
-    # feature_dims[1].extend(feature_dim_5)
-    features = [np.zeros([x for x in y]) for y in feature_dims]
-    # feature_layers = ['_plus12_output','flatten0_output']
-    feature_layers = ['flatten0_output']
-    # model = net_init(sys.argv[1],int(sys.argv[2]),gpu=7)
-    model = net_init(sys.argv[1],int(sys.argv[2]),gpu=7,feature_layers=feature_layers)
-    # model = net_init(sys.argv[1],int(sys.argv[2]),gpu=7,feature_layers=['fc-3_output'])
+    if not os.path.isfile(_progress_path(output_prefix)):
+        return 0, list()
+    with open(_progress_path(output_prefix), 'r') as f:
+        progress = json.load(f)
+    return progress['rows'], progress['failed']
+
+
+def _write_progress(output_prefix, rows, failed):
+    # written after flushing features, so recorded rows are always on disk
+    tmp_path = _progress_path(output_prefix) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'rows': rows, 'failed': failed}, f)
+    os.rename(tmp_path, _progress_path(output_prefix))
+
+
+def open_outputs(output_prefix, feature_layers, feature_dims, image_number, resume=False):
+    '''
+    create or reopen one n x d .npy memmap for each layer
+    '''
+    features = list()
+    for layer, dim in zip(feature_layers, feature_dims):
+        path = output_prefix + '_{}.npy'.format(layer)
+        if resume:
+            feat = np.lib.format.open_memmap(path, mode='r+')
+            assert feat.shape == (image_number, dim), 'shape of {} mismatch: {} vs {}'.format(path, feat.shape, (image_number, dim))
+        else:
+            feat = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(image_number, dim))
+        features.append(feat)
+    return features
+
+
+def _throttled(items, semaphore):
+    # blocks pool's task feeder, so decoded images waiting in memory are bounded
+    for item in items:
+        semaphore.acquire()
+        yield item
+
+
+def _iter_batches(images, batch_size, workers, resize_width, prefetch=4):
+    '''
+    decode images in worker processes, yield list of images for each batch in order
+    at most prefetch batches are decoded ahead of the forward
+    '''
+    semaphore = threading.Semaphore(batch_size * prefetch)
+    proc_pool = multiprocessing.Pool(workers)
+    try:
+        loaded = proc_pool.imap(functools.partial(preprocess, resize_width=resize_width), _throttled(images, semaphore),
+                                chunksize=max(1, batch_size // workers))
+        for start in range(0, len(images), batch_size):
+            imgs = [next(loaded) for _ in range(min(batch_size, len(images) - start))]
+            for _ in imgs:
+                semaphore.release()
+            yield imgs
+    finally:
+        proc_pool.terminate()
+
+
+def extract_features(model, images, features, start=0, batch_size=32, workers=8, resize_width=224,
+                     output_prefix=None, save_interval=20, failed=None):
+    '''
+    extract features of images[start:] batch by batch, rows are written into features as they are ready
+    rows of unreadable images are left as zeros and their indices collected into failed
+    '''
+    failed = list() if failed is None else failed
+    img_batch = np.zeros((batch_size, 3, resize_width, resize_width), dtype=np.float32)
     tic_0 = time.time()
-    for i in xrange(image_number):
+    for idx_batch, imgs in enumerate(_iter_batches(images[start:], batch_size, workers, resize_width)):
         tic = time.time()
-        output = extra_feature(model, images[i])
-        print('Batch [{}]: {:.4f}s'.format(i, time.time()-tic))
-        for j in xrange(len(features)):
-            if np.shape(output[j]) != tuple():
-                features[j][i] = output[j]
-    print('Total time: {:.4f}s'.format(time.time()-tic_0))
-    for idx,feat in enumerate(features): 
-        try:
-            np.save(sys.argv[4]+'_{}.npy'.format(feature_layers[idx]), feat)
-        except:
-            np.save('./tmp_{}.npy'.format(feature_layers[idx]), feat)
-            print('Saving failed, result file saved to ./tmp.npy')
+        batch_failed = [i for i, img in enumerate(imgs) if img is None]
+        for i, img in enumerate(imgs):
+            if img is not None:
+                img_batch[i] = img
+        output = extract_batch(model, img_batch)
+        for feat, op in zip(features, output):
+            op[batch_failed] = 0
+            feat[start:start + len(imgs)] = op[:len(imgs)]
+        for i in batch_failed:
+            failed.append(start + i)
+            print('Reading image failed: {}'.format(images[start + i]))
+        start += len(imgs)
+        print('Batch [{}]: {} rows done, {:.4f}s'.format(idx_batch, start, time.time() - tic))
+        if output_prefix and ((idx_batch + 1) % save_interval == 0 or start == len(images)):
+            for feat in features:
+                feat.flush()
+            _write_progress(output_prefix, start, failed)
+    print('Total time: {:.4f}s'.format(time.time() - tic_0))
+    return failed
+
+
+def main():
+    feature_layers = args['--layers'].split(',')
+    batch_size = int(args['--batch-size'])
+    image_width = int(args['--img-width'])
+    with open(args['<image-list>'],'r') as f:
+        images = [os.path.join(args['<image-root>'],x.strip()) for x in f.readlines() if x.strip()]
+    image_number = len(images)
+    model = net_init(args['<model-prefix>'],int(args['<epoch>']),gpu=int(args['--gpu']),feature_layers=feature_layers,
+                     batch_size=batch_size,image_width=image_width)
+    # (batch, channel, ...) of each output
+    feature_dims = [x[1][1] for x in model.output_shapes]
+
+    start, failed = 0, list()
+    resume = args['--resume'] and os.path.isfile(_progress_path(args['<output-prefix>']))
+    if resume:
+        start, failed = _read_progress(args['<output-prefix>'])
+        print('Resuming from row {}/{}'.format(start, image_number))
+    features = open_outputs(args['<output-prefix>'], feature_layers, feature_dims, image_number, resume=resume)
+    if start < image_number:
+        extract_features(model, images, features, start=start, batch_size=batch_size, workers=int(args['--workers']),
+                         resize_width=image_width, output_prefix=args['<output-prefix>'],
+                         save_interval=int(args['--save-interval']), failed=failed)
+    for layer, feat in zip(feature_layers, features):
+        print('Features of {} saved: {}'.format(layer, feat.filename))
+    if failed:
+        print('{} images failed to read, their features are zeros'.format(len(failed)))
     print('...done')
-    # print('==> Original params:')
-    # pprint.pprint(zip(sym.list_arguments(), sym.infer_shape(data=(1, 3, 224, 224))[0]))
-    # sym_new, arg_new = modify_net(sym, arg_params)
-    # mx.model.save_checkpoint(sys.argv[1] + '-modified', 0, sym_new, arg_new, aux_params)
-    # print('New model saved at: {}'.format(sys.argv[1] + '-modified'))
 
 
 if __name__ == '__main__':
+    version = re.compile('.*\d+/\d+\s+(v[\d.]+)').findall(_init_.__doc__)[0]
+    args = docopt.docopt(
+        _init_.__doc__, version='Feature extractor {}'.format(version))
+    _init_()
     main()
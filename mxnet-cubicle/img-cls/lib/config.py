@@ -264,12 +264,19 @@ __C.TEST.INPUT_IMG_LST = ""
 __C.TEST.INPUT_IMG_PREFIX = ""
 __C.TEST.INPUT_CAT_FILE = ""
 __C.TEST.OUTPUT_JSON_PATH = ""
+__C.TEST.OUTPUT_FORMAT = "json"     # json, binary
+__C.TEST.OUTPUT_BIN_PREFIX = ""     # prefix of binary result files
+__C.TEST.OUTPUT_BIN_DTYPE = "float16"   # float16, float32
 __C.TEST.MODEL_PREFIX = ""
 __C.TEST.MODEL_EPOCH = 0
 __C.TEST.KV_STORE = b"device" 
 __C.TEST.USE_GPU = True 
 __C.TEST.GPU_IDX = [0]     # only single gpu supported for now
 __C.TEST.PROCESS_NUM = 1 
+__C.TEST.PROCESS_CHUNK_SIZE = 4     # images sent to one worker per task
+__C.TEST.PREFETCH_NUM = 2   # ready batches queued ahead of forward
+__C.TEST.SHARED_MEMORY_BATCH = False    # workers write batches into shared memory, PROCESS_NUM > 1 only
+__C.TEST.FUSED_PREPROCESSING = False    # resize in uint8 and normalize into float32 in one step
 __C.TEST.MUTABLE_IMAGES_TEST = False
 __C.TEST.BATCH_SIZE = 1 
 __C.TEST.INPUT_SHAPE = (3, 224, 224)
@@ -282,6 +289,7 @@ __C.TEST.CENTER_CROP = False
 __C.TEST.MULTI_CROP = False
 __C.TEST.MULTI_CROP_NUM = 3
 __C.TEST.HORIZENTAL_FLIP = False
+__C.TEST.TTA_REDUCE = "mean"    # mean, max; reduce predictions of crops/flips of one image
 __C.TEST.USE_BASENAME = True
 __C.TEST.FNAME_PARENT_LEVEL = 1 
 __C.TEST.TOP_K = 1 
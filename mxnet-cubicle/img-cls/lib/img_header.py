@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+import numpy as np
+
+
+JPEG_SOF_MARKERS = set([0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF])
+JPEG_STANDALONE_MARKERS = set([0x01] + list(range(0xD0, 0xD8)))
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+TAIL_SIZE = 32      # bytes searched for end marker, some encoders append padding
+
+
+def _slice(buf, start, stop):
+    '''
+    bytes of buf[start:stop], buf could be bytes or uint8 array
+    '''
+    part = buf[start:stop]
+    return part.tobytes() if isinstance(part, np.ndarray) else part
+
+
+def jpeg_header(buf):
+    '''
+    walk jpeg markers until SOF, return (width, height, channels)
+    raise ValueError if broken or truncated
+    '''
+    size = len(buf)
+    if _slice(buf, 0, 2) != b'\xff\xd8':
+        raise ValueError('no jpeg SOI')
+    pos = 2
+    while True:
+        if pos + 4 > size:
+            raise ValueError('truncated before SOF')
+        prefix, marker = struct.unpack('BB', _slice(buf, pos, pos + 2))
+        if prefix != 0xFF:
+            raise ValueError('broken marker at {}'.format(pos))
+        if marker == 0xFF:
+            # fill byte
+            pos += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            raise ValueError('no SOF before scan')
+        seg_len, = struct.unpack('>H', _slice(buf, pos + 2, pos + 4))
+        if marker in JPEG_SOF_MARKERS:
+            if pos + 10 > size:
+                raise ValueError('truncated SOF')
+            _, height, width, channels = struct.unpack('>BHHB', _slice(buf, pos + 4, pos + 10))
+            break
+        pos += 2 + seg_len
+    if not width or not height:
+        raise ValueError('zero image size')
+    if b'\xff\xd9' not in _slice(buf, max(0, size - TAIL_SIZE), size):
+        raise ValueError('missing jpeg EOI, truncated')
+    return width, height, channels
+
+
+def png_header(buf):
+    '''
+    read IHDR, return (width, height, channels)
+    raise ValueError if broken or truncated
+    '''
+    size = len(buf)
+    if size < 33 or _slice(buf, 12, 16) != b'IHDR':
+        raise ValueError('no png IHDR')
+    width, height, _, color_type = struct.unpack('>IIBB', _slice(buf, 16, 26))
+    if not width or not height:
+        raise ValueError('zero image size')
+    if b'IEND' not in _slice(buf, max(0, size - TAIL_SIZE), size):
+        raise ValueError('missing png IEND, truncated')
+    return width, height, PNG_CHANNELS.get(color_type, 0)
+
+
+def parse_header(buf):
+    '''
+    header-only check of encoded image, return (format, width, height, channels)
+    raise ValueError with reason if not a valid jpeg or png
+    '''
+    head = _slice(buf, 0, 8)
+    if head[:2] == b'\xff\xd8':
+        return ('jpeg',) + jpeg_header(buf)
+    if head == PNG_SIGNATURE:
+        return ('png',) + png_header(buf)
+    raise ValueError('unknown image format')
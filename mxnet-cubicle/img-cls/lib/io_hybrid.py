@@ -206,6 +206,28 @@ def inst_iterators(data_train, data_dev, batch_size=1, data_shape=(3,224,224), r
     return train, dev 
 
 
+def _get_resize_w_h(height, width, **kwargs):
+    '''
+    target (w,h) of np_img_preprocessing, None if no resizing is needed
+    '''
+    if 'resize_w_h' in kwargs and not kwargs['keep_aspect_ratio']:
+        return kwargs['resize_w_h'][0], kwargs['resize_w_h'][1]
+    if 'resize_min_max' in kwargs and kwargs['keep_aspect_ratio']: 
+        ratio = float(max(height, width))/min(height, width)
+        min_len, max_len = kwargs['resize_min_max']
+        if min_len*ratio <= max_len or max_len == 0:    # resize by min
+            if height > width:     # h > w
+                return min_len, int(min_len*ratio)
+            elif height <= width:   # h <= w
+                return int(min_len*ratio), min_len 
+        elif min_len*ratio > max_len:   # resize by max
+            if height > width:     # h > w
+                return int(max_len/ratio), max_len
+            elif height <= width:   # h <= w
+                return max_len, int(max_len/ratio) 
+    return None
+
+
 def np_img_preprocessing(img, as_float=True, **kwargs):
     '''
     '''
@@ -214,21 +236,9 @@ def np_img_preprocessing(img, as_float=True, **kwargs):
     if as_float:
         img = img.astype(float)
     # reshape
-    if 'resize_w_h' in kwargs and not kwargs['keep_aspect_ratio']:
-        img = cv2.resize(img, (kwargs['resize_w_h'][0], kwargs['resize_w_h'][1]))
-    if 'resize_min_max' in kwargs and kwargs['keep_aspect_ratio']: 
-        ratio = float(max(img.shape[:2]))/min(img.shape[:2])
-        min_len, max_len = kwargs['resize_min_max']
-        if min_len*ratio <= max_len or max_len == 0:    # resize by min
-            if img.shape[0] > img.shape[1]:     # h > w
-                img = cv2.resize(img, (min_len, int(min_len*ratio)))
-            elif img.shape[0] <= img.shape[1]:   # h <= w
-                img = cv2.resize(img, (int(min_len*ratio), min_len)) 
-        elif min_len*ratio > max_len:   # resize by max
-            if img.shape[0] > img.shape[1]:     # h > w
-                img = cv2.resize(img, (int(max_len/ratio), max_len))
-            elif img.shape[0] <= img.shape[1]:   # h <= w
-                img = cv2.resize(img, (max_len, int(max_len/ratio))) 
+    resize_w_h = _get_resize_w_h(img.shape[0], img.shape[1], **kwargs)
+    if resize_w_h:
+        img = cv2.resize(img, resize_w_h)
     # normalization
     if 'mean_rgb' in kwargs:
         img -= kwargs['mean_rgb'][:]
@@ -241,6 +251,49 @@ def np_img_preprocessing(img, as_float=True, **kwargs):
     return img
 
 
+_norm_luts = dict()     # cached lookup tables of np_img_preprocessing_fused
+
+
+def _get_norm_lut(mean_rgb, std_rgb, dtype):
+    '''
+    3x256 table of (value - mean) / std for every uint8 value of R, G, B channels
+    '''
+    key = (tuple(mean_rgb), tuple(std_rgb), np.dtype(dtype).name)
+    if key not in _norm_luts:
+        values = np.arange(256, dtype=np.float64)[np.newaxis, :]
+        lut = (values - np.array(mean_rgb, dtype=np.float64)[:, np.newaxis]) / np.array(std_rgb, dtype=np.float64)[:, np.newaxis]
+        _norm_luts[key] = lut.astype(dtype)
+    return _norm_luts[key]
+
+
+def np_img_preprocessing_fused(img, out=None, dtype=np.float32, **kwargs):
+    '''
+    Same as np_img_preprocessing within tolerance of uint8 resizing, but faster:
+    BGR uint8 image is resized in uint8, then BGR->RGB, normalization, HWC->CHW and
+    casting are done in one table lookup per channel, written into out
+    :params:
+    img         BGR uint8 image in (h,w,c), as read by cv2.imread
+    out         optional caller-provided (c,h,w) float32/float16 buffer, e.g. one row of a batch
+    dtype       dtype of output if out is not given
+    kwargs      same as np_img_preprocessing
+    :return:
+    out         preprocessed image in (c,h,w)
+    '''
+    assert isinstance(img, np.ndarray) and img.dtype == np.uint8, logging.error("Input images should be uint8 numpy.ndarray")
+    resize_w_h = _get_resize_w_h(img.shape[0], img.shape[1], **kwargs)
+    if resize_w_h:
+        img = cv2.resize(img, resize_w_h)
+    height, width = img.shape[:2]
+    if out is None:
+        out = np.empty((3, height, width), dtype=dtype)
+    assert out.shape == (3, height, width), logging.error('Shape of output buffer {} mismatches image {}'.format(out.shape, (3, height, width)))
+    lut = _get_norm_lut(kwargs.get('mean_rgb', [0, 0, 0]), kwargs.get('std_rgb', [1, 1, 1]), out.dtype)
+    for channel in range(3):
+        # channel 0 of output is R, which is channel 2 of BGR input
+        np.take(lut[channel], img[:, :, 2 - channel], out=out[channel])
+    return out
+
+
 def np_img_center_crop(img, crop_width):
     '''
     '''
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+import os
+import mmap
+import struct
+import multiprocessing
+from collections import namedtuple
+import numpy as np
+
+
+# same layout as mx.recordio
+IRHeader = namedtuple('HEADER', ['flag', 'label', 'id', 'id2'])
+_IR_FORMAT = 'IfQQ'
+_IR_SIZE = struct.calcsize(_IR_FORMAT)
+RECORD_MAGIC = 0xced7230a
+LENGTH_MASK = (1 << 29) - 1
+PARALLEL_CHUNK_SIZE = 4096  # records processed per task in parallel_map
+
+
+def _pad4(length):
+    return (length + 3) // 4 * 4
+
+
+def get_idx_path(rec_path):
+    return os.path.splitext(rec_path)[0] + '.idx'
+
+
+def unpack(buf):
+    '''
+    split record payload into IRHeader and image bytes, same as mx.recordio.unpack
+    buf is an uint8 array and image bytes are returned as a view of it
+    '''
+    flag, label, id, id2 = struct.unpack(_IR_FORMAT, buf[:_IR_SIZE].tobytes())
+    offset = _IR_SIZE
+    if flag > 0:
+        label = np.frombuffer(buf[offset:offset + 4 * flag].tobytes(), dtype=np.float32)
+        offset += 4 * flag
+    return IRHeader(flag, label, id, id2), buf[offset:]
+
+
+class RecordReader(object):
+    '''
+    Memory-mapped random access reader of .rec files, no mxnet needed.
+    Payloads are returned as uint8 views of the mapped file, which could be passed
+    to cv2.imdecode directly, and are only valid while the reader is open.
+    Records are located by .idx if it exists, otherwise by a header-only scan.
+    '''
+    def __init__(self, path_rec, path_idx=None, offsets=None, keys=None):
+        self.path_rec = path_rec
+        self._file = open(path_rec, 'rb')
+        size = os.path.getsize(path_rec)
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.data = np.frombuffer(self._mmap, dtype=np.uint8) if size else np.zeros(0, dtype=np.uint8)
+        path_idx = path_idx or get_idx_path(path_rec)
+        if offsets is not None:
+            self.offsets = np.asarray(offsets, dtype=np.int64)
+            self.keys = np.asarray(keys, dtype=np.int64) if keys is not None else np.arange(len(self.offsets))
+        elif os.path.isfile(path_idx):
+            with open(path_idx, 'r') as f:
+                entries = np.array(f.read().split(), dtype=np.int64).reshape(-1, 2)
+            self.keys, self.offsets = entries[:, 0].copy(), entries[:, 1].copy()
+        else:
+            self.offsets = self.scan_offsets()
+            self.keys = np.arange(len(self.offsets))
+        self._key_to_index = None
+
+    def close(self):
+        self.data = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # payload views still held outside, mapping is released with them
+                pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _frame(self, pos):
+        '''
+        return (cflag, payload length, position of payload) of the record part at pos
+        '''
+        assert 0 <= pos and pos + 8 <= len(self.data), 'record header out of file at offset {}'.format(pos)
+        magic, lrecord = struct.unpack('<II', self.data[pos:pos + 8].tobytes())
+        assert magic == RECORD_MAGIC, 'invalid magic number at offset {}'.format(pos)
+        assert pos + 8 + (lrecord & LENGTH_MASK) <= len(self.data), 'truncated record at offset {}'.format(pos)
+        return lrecord >> 29, lrecord & LENGTH_MASK, pos + 8
+
+    def scan_offsets(self):
+        '''
+        offsets of all records found by walking headers only
+        '''
+        offsets, pos, end = list(), 0, len(self.data)
+        while pos < end:
+            cflag, length, start = self._frame(pos)
+            if cflag in (0, 1):
+                offsets.append(pos)
+            pos = start + _pad4(length)
+        return np.array(offsets, dtype=np.int64)
+
+    def record_size(self, pos):
+        '''
+        bytes of the whole framed record at pos, including headers and paddings
+        '''
+        size = 0
+        while True:
+            cflag, length, _ = self._frame(pos + size)
+            size += 8 + _pad4(length)
+            if cflag in (0, 3):
+                return size
+
+    def raw(self, index):
+        '''
+        payload of index-th record, a zero-copy view unless the record is split into parts
+        '''
+        pos = int(self.offsets[index])
+        cflag, length, start = self._frame(pos)
+        if cflag == 0:
+            return self.data[start:start + length]
+        # split record, parts are joined by the magic number itself as mxnet does
+        parts = [self.data[start:start + length]]
+        while cflag != 3:
+            pos = start + _pad4(length)
+            cflag, length, start = self._frame(pos)
+            parts.append(np.frombuffer(struct.pack('<I', RECORD_MAGIC), dtype=np.uint8))
+            parts.append(self.data[start:start + length])
+        return np.concatenate(parts)
+
+    def framed(self, index):
+        '''
+        whole framed bytes of index-th record as a view, which could be copied into another .rec as it is
+        '''
+        pos = int(self.offsets[index])
+        return self.data[pos:pos + self.record_size(pos)]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return unpack(self.raw(index))
+
+    def read_key(self, key):
+        if self._key_to_index is None:
+            self._key_to_index = dict((int(k), i) for i, k in enumerate(self.keys))
+        return self[self._key_to_index[key]]
+
+    def iter_records(self, start=0, stop=None):
+        '''
+        yield (index, header, image bytes)
+        '''
+        stop = len(self) if stop is None else min(stop, len(self))
+        for index in range(start, stop):
+            header, img = self[index]
+            yield index, header, img
+
+    def sample(self, num, seed=0):
+        '''
+        indices of num random records, sorted for sequential disk access
+        '''
+        rng = np.random.RandomState(seed)
+        return np.sort(rng.choice(len(self), min(num, len(self)), replace=False))
+
+    def write_shards(self, prefix, num_shards, indices=None):
+        '''
+        copy records into num_shards <prefix>.partXXX.rec/.idx without re-encoding,
+        records are dealt round-robin so shards are balanced
+        '''
+        indices = np.arange(len(self)) if indices is None else indices
+        shards = list()
+        for shard in range(num_shards):
+            path_rec, path_idx = '{}.part{:03d}.rec'.format(prefix, shard), '{}.part{:03d}.idx'.format(prefix, shard)
+            with open(path_rec, 'wb') as frec, open(path_idx, 'w') as fidx:
+                for index in indices[shard::num_shards]:
+                    fidx.write('{}\t{}\n'.format(int(self.keys[index]), frec.tell()))
+                    frec.write(self.framed(index).tobytes())
+            shards.append((path_idx, path_rec))
+        return shards
+
+
+_worker_reader = None
+
+
+def _init_worker(path_rec, offsets, keys):
+    global _worker_reader
+    _worker_reader = RecordReader(path_rec, offsets=offsets, keys=keys)
+
+
+def _run_chunk(task):
+    func, start, stop = task
+    return func(_worker_reader, start, stop)
+
+
+def parallel_map(reader, func, num_proc=8, chunk_size=PARALLEL_CHUNK_SIZE):
+    '''
+    yield func(reader, start, stop) over chunks of records in order, computed by num_proc processes
+    each process maps the file by itself, func should be a module-level function
+    '''
+    tasks = [(func, start, min(start + chunk_size, len(reader))) for start in range(0, len(reader), chunk_size)]
+    if num_proc <= 1:
+        for task in tasks:
+            yield task[0](reader, task[1], task[2])
+        return
+    pool = multiprocessing.Pool(num_proc, initializer=_init_worker, initargs=(reader.path_rec, reader.offsets, reader.keys))
+    try:
+        for result in pool.imap(_run_chunk, tasks):
+            yield result
+    finally:
+        pool.terminate()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+import os
+import re
+import json
+import logging
+import numpy as np
+
+
+BIN_VERSION = 1
+JSON_READ_SIZE = 1 << 20    # bytes read from json file per step
+CONVERT_CHUNK_SIZE = 4096   # records converted per step
+
+
+def _strip_meta(path):
+    return path[:-len('.meta')] if path.endswith('.meta') else path
+
+
+def _to_bytes(name):
+    return name if isinstance(name, bytes) else name.encode('utf-8')
+
+
+def is_binary_result(path):
+    '''
+    check whether path is the prefix or the .meta file of a binary result
+    '''
+    return os.path.isfile(_strip_meta(path) + '.meta')
+
+
+class BinaryResultWriter(object):
+    '''
+    Columnar binary writer of inference results, files sharing one prefix:
+    <prefix>.meta           json header, written on close
+    <prefix>.names          utf-8 file names, concatenated
+    <prefix>.names.idx      uint64 offsets of file names, N+1 items
+    <prefix>.conf           N x C confidences in float16 or float32,
+                            N x k top-k confidences if not all_confidence
+    <prefix>.topk           N x k int32 top-k indices
+    '''
+    def __init__(self, prefix, top_k=1, dtype='float16', all_confidence=True, categories=None):
+        self.prefix = _strip_meta(prefix)
+        self.top_k = top_k
+        self.dtype = np.dtype(dtype)
+        assert self.dtype in (np.float16, np.float32), logging.error('Only float16 and float32 confidences are supported')
+        self.all_confidence = all_confidence
+        self.categories = list(categories) if categories is not None else None
+        self.num, self.num_cls, self.name_offset = 0, None, 0
+        self.f_names = open(self.prefix + '.names', 'wb')
+        self.f_idx = open(self.prefix + '.names.idx', 'wb')
+        self.f_conf = open(self.prefix + '.conf', 'wb')
+        self.f_topk = open(self.prefix + '.topk', 'wb')
+        np.zeros(1, dtype=np.uint64).tofile(self.f_idx)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, names, confidence, top_k_index=None):
+        '''
+        append results of n images
+        names           n file names
+        confidence      n x C probabilities, top-k indices are computed from it
+                        if top_k_index is not given
+        top_k_index     n x k indices, confidence is then stored as it is
+        '''
+        confidence = np.asarray(confidence)
+        assert len(names) == confidence.shape[0], logging.error('Number of names and results mismatch')
+        if not len(names):
+            return
+        if top_k_index is None:
+            # same order as argsort()[-k:][::-1] on each row
+            top_k_index = np.argsort(confidence, axis=1)[:, ::-1][:, :self.top_k]
+            if not self.all_confidence:
+                confidence = confidence[np.arange(len(names))[:, np.newaxis], top_k_index]
+        if self.num_cls is None:
+            self.num_cls = confidence.shape[1]
+        assert confidence.shape[1] == self.num_cls, logging.error('Width of confidence changed while writing')
+        encoded = [_to_bytes(name) for name in names]
+        offsets = self.name_offset + np.cumsum([len(name) for name in encoded], dtype=np.uint64)
+        self.f_names.write(b''.join(encoded))
+        offsets.astype(np.uint64).tofile(self.f_idx)
+        self.name_offset = int(offsets[-1])
+        np.ascontiguousarray(confidence, dtype=self.dtype).tofile(self.f_conf)
+        np.ascontiguousarray(top_k_index, dtype=np.int32).tofile(self.f_topk)
+        self.num += len(names)
+
+    def close(self):
+        for f in (self.f_names, self.f_idx, self.f_conf, self.f_topk):
+            f.close()
+        meta = {
+            'version': BIN_VERSION,
+            'num': self.num,
+            'num_classes': self.num_cls or 0,
+            'top_k': self.top_k,
+            'dtype': self.dtype.name,
+            'all_confidence': self.all_confidence,
+            'categories': self.categories
+        }
+        with open(self.prefix + '.meta', 'w') as f:
+            json.dump(meta, f, indent=2)
+        logging.info('{} results written into binary files: {}.*'.format(self.num, self.prefix))
+
+
+class BinaryResult(object):
+    '''
+    Zero-copy reader of results written by BinaryResultWriter,
+    confidence and top_k are read-only memmaps
+    '''
+    def __init__(self, path):
+        self.prefix = _strip_meta(path)
+        with open(self.prefix + '.meta', 'r') as f:
+            self.meta = json.load(f)
+        assert self.meta['version'] == BIN_VERSION, logging.error('Unsupported binary result version: {}'.format(self.meta['version']))
+        self.num = self.meta['num']
+        self.top_k_width = self.meta['top_k']
+        self.categories = self.meta['categories']
+        self.all_confidence = self.meta['all_confidence']
+        conf_width = self.meta['num_classes']
+        self.num_cls = conf_width if self.all_confidence else None
+        self._offsets = self._memmap('.names.idx', np.uint64, (self.num + 1,))
+        self._names = self._memmap('.names', np.uint8, (int(self._offsets[-1]),))
+        self.confidence = self._memmap('.conf', self.meta['dtype'], (self.num, conf_width))
+        self.top_k = self._memmap('.topk', np.int32, (self.num, self.top_k_width))
+
+    def _memmap(self, suffix, dtype, shape):
+        if not np.prod(shape):
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.prefix + suffix, dtype=dtype, mode='r', shape=shape)
+
+    def __len__(self):
+        return self.num
+
+    def name(self, index):
+        return self._names[int(self._offsets[index]):int(self._offsets[index + 1])].tobytes().decode('utf-8')
+
+    def names(self, start=0, stop=None):
+        stop = self.num if stop is None else min(stop, self.num)
+        offsets = self._offsets[start:stop + 1].astype(np.int64)
+        blob = self._names[offsets[0]:offsets[-1]].tobytes() if stop > start else b''
+        offsets -= offsets[0]
+        return [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(stop - start)]
+
+    def record(self, index):
+        '''
+        json-style record of one image, same syntax as test_util.infer_one_batch
+        '''
+        k = self.top_k_width
+        index_list = self.top_k[index].tolist()
+        result = dict()
+        result['File Name'] = self.name(index)
+        result['Top-{} Index'.format(k)] = index_list
+        if self.categories:
+            result['Top-{} Class'.format(k)] = [self.categories[int(x)] for x in index_list]
+        result['Confidence'] = [str(x) for x in self.confidence[index].astype(np.float32)]
+        return result
+
+    def iter_records(self):
+        for index in range(self.num):
+            yield self.record(index)
+
+
+class JsonStream(object):
+    '''
+    Buffered reader decoding json values one by one from a file object
+    '''
+    def __init__(self, file_obj, read_size=JSON_READ_SIZE):
+        self.file_obj = file_obj
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buff = ''
+        self.pos = 0
+
+    def _fill(self):
+        chunk = self.file_obj.read(self.read_size)
+        if not chunk:
+            return False
+        self.buff = self.buff[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''
+        skip whitespaces and return next char, empty string means eof
+        '''
+        while True:
+            while self.pos < len(self.buff) and self.buff[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buff):
+                return self.buff[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        assert char and char in chars, 'broken json log, expecting {} but got {}'.format(chars, repr(char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buff, self.pos)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise
+            # a value ending at buffer end (e.g. number) may be truncated
+            if end == len(self.buff) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_json_records(json_path):
+    '''
+    incrementally parse inference log, yield (file name, record) one by one
+    two syntaxes are supported:
+    {"image1.jpg": {record}, "image2.jpg": {record}, ...}  by mxnet_image_classifier.py
+    {"File Name": "image1.jpg", ...}\n{"File Name": "image2.jpg", ...}  json-lines
+    '''
+    with open(json_path, 'r') as file_log:
+        stream = JsonStream(file_log)
+        if not stream.peek():
+            return
+        if re.match(r'\s*\{\s*(?:\}|"(?:[^"\\]|\\.)*"\s*:\s*\{)', stream.buff[stream.pos:]):
+            stream.expect('{')
+            if stream.peek() == '}':
+                return
+            while True:
+                image = stream.value()
+                stream.expect(':')
+                yield image, stream.value()
+                if stream.expect(',}') == '}':
+                    break
+        else:
+            while stream.peek():
+                record = stream.value()
+                yield record['File Name'], record
+
+
+def json_to_binary(json_path, prefix, dtype='float16', chunk_size=CONVERT_CHUNK_SIZE):
+    '''
+    convert json inference log into binary result files
+    '''
+    writer, key_top_k = None, None
+    names, confidence, top_k_index = list(), list(), list()
+    for image, record in iter_json_records(json_path):
+        if writer is None:
+            key_top_k = [key for key in record if re.match(r'Top-\d+ Index$', key)][0]
+            top_k = int(re.findall(r'\d+', key_top_k)[0])
+            key_top_k_cls = 'Top-{} Class'.format(top_k)
+            writer = BinaryResultWriter(prefix, top_k=top_k, dtype=dtype, all_confidence=len(record['Confidence']) > top_k)
+            categories = dict()
+        index_list = record[key_top_k] if isinstance(record[key_top_k], list) else [record[key_top_k]]
+        for index, cls in zip(index_list, record.get(key_top_k_cls) or list()):
+            categories[index] = cls
+        names.append(image)
+        confidence.append([float(x) for x in record['Confidence']])
+        top_k_index.append(index_list)
+        if len(names) == chunk_size:
+            writer.write(names, confidence, top_k_index=top_k_index)
+            names, confidence, top_k_index = list(), list(), list()
+    assert writer, logging.error('Empty json log: {}'.format(json_path))
+    if names:
+        writer.write(names, confidence, top_k_index=top_k_index)
+    # only categories showing up in top-k could be recovered
+    if categories and writer.all_confidence and len(categories) == writer.num_cls:
+        writer.categories = [categories[x] for x in range(writer.num_cls)]
+    writer.close()
+
+
+def binary_to_json(path, json_path):
+    '''
+    convert binary result files into json inference log, written record by record
+    '''
+    result = BinaryResult(path)
+    with open(json_path, 'w') as f:
+        f.write('{')
+        for index, record in enumerate(result.iter_records()):
+            f.write(',\n' if index else '\n')
+            f.write('  {}: {}'.format(json.dumps(record['File Name']), json.dumps(record)))
+        f.write('\n}\n')
+    logging.info('{} results written into json file: {}'.format(len(result), json_path))
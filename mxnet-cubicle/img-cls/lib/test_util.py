@@ -10,11 +10,18 @@ import cv2
 import mxnet as mx
 import numpy as np
 from collections import namedtuple
-from io_hybrid import np_img_preprocessing,np_img_center_crop,np_img_multi_crop
+from io_hybrid import empty_image,np_img_preprocessing,np_img_preprocessing_fused,np_img_center_crop,np_img_multi_crop
 from config import cfg
+import ctypes
 import multiprocessing
+import threading
+import itertools
 import functools
 import random
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 
 
 def _get_filename_with_parents(filepath, level=1):
@@ -24,7 +31,10 @@ def _get_filename_with_parents(filepath, level=1):
     return os.path.relpath(filepath, common)
 
 
-def _image_processor(img, ex):
+def _read_one_image(img, ex):
+    '''
+    read one image, return it and error image name, which is None if image is read successfully
+    '''
     error_img = None
     try:
         img_read = cv2.imread(img)
@@ -37,43 +47,177 @@ def _image_processor(img, ex):
         else:
             error_img = _get_filename_with_parents(img, level=ex['level'])
         logging.error('Image error: {}, result will be deprecated!'.format(img))
-    img_tmp = np_img_preprocessing(img_read, **ex['img_preproc_kwargs'])
+    return img_read, error_img
+
+
+def _num_views(multi_crop=None, h_flip=False):
+    '''
+    number of test-time augmented views of one image
+    '''
+    return (multi_crop or 1) * (2 if h_flip else 1)
 
+
+def _tta_views(img_tmp, ex):
+    '''
+    list of CHW views of one preprocessed image fed to network: crops, followed by 
+    their horizontal flips if h_flip, all as strided views without copying
+    '''
     if ex['center_crop']:
-        img_ccr = np_img_ex['center_crop'](img_tmp, ex['input_shape'][1]) 
-        if np.__version__.startswith('1.15'):
-            return mx.nd.array(img_ccr), error_img
-        else:
-            return mx.nd.array(img_ccr[np.newaxis, :]), error_img
+        crops = [np_img_center_crop(img_tmp, ex['input_shape'][1])]
     elif ex['multi_crop']:
-        img_crs = np_img_ex['multi_crop'](img_tmp, ex['input_shape'][1], crop_number=ex['multi_crop'])
-        for idx_crop,crop in enumerate(img_crs):
-            if np.__version__.startswith('1.15'):
-                return [mx.nd.array(crop) for crop in img_crs], error_img 
-            else:
-                return [mx.nd.array(crop[np.newaxis, :]) for crop in img_crs], error_img 
+        crops = np_img_multi_crop(img_tmp, ex['input_shape'][1], crop_number=ex['multi_crop'])
     else:
-        if np.__version__.startswith('1.15'):
-            return mx.nd.array(img_tmp), error_img
-        else:
-            return mx.nd.array(img_tmp[np.newaxis, :]), error_img
+        crops = [img_tmp]
+    if ex.get('h_flip'):
+        crops = crops + [crop[:, :, ::-1] for crop in crops]
+    return crops
+
+
+def _reduce_views(output_prob_batch, num_img, views_per_img=1, mode='mean'):
+    '''
+    segment-reduce predictions of every views_per_img consecutive rows into one row per image
+    '''
+    if views_per_img == 1:
+        return output_prob_batch[:num_img]
+    output_prob_batch = output_prob_batch[:num_img * views_per_img].reshape(num_img, views_per_img, -1)
+    if mode == 'max':
+        return output_prob_batch.max(axis=1)
+    return output_prob_batch.mean(axis=1)
+
+
+def _load_one_image(img, ex):
+    '''
+    read and preprocess one image, return list of CHW views and error image name
+    '''
+    img_read, error_img = _read_one_image(img, ex)
+    if ex.get('fused'):
+        img_tmp = np_img_preprocessing_fused(img_read, **ex['img_preproc_kwargs'])
+    else:
+        img_tmp = np_img_preprocessing(img_read, **ex['img_preproc_kwargs'])
+    logging.debug('img_tmp.shape:{}'.format(img_tmp.shape))
+    return _tta_views(img_tmp, ex), error_img
+
+
+_shared_ring = None     # batch ring buffer view in worker processes
 
 
-def infer_one_batch(model, categories, data_batch, img_list, base_name=True, multi_crop_ave=False):
+def _init_shared_ring(shared_array, ring_shape):
     '''
+    worker pool initializer, map shared array as ring of float32 NCHW batches 
+    '''
+    global _shared_ring
+    _shared_ring = np.frombuffer(shared_array, dtype=np.float32).reshape(ring_shape)
+
+
+def _load_into_ring(task, ex):
+    '''
+    load one image and write its views straight into rows of one ring slot,
+    only slot index and error image name are sent back
+    '''
+    img, slot, row = task
+    if ex.get('fused') and not (ex['center_crop'] or ex['multi_crop'] or ex['h_flip']):
+        # preprocessed right into the ring slot
+        img_read, error_img = _read_one_image(img, ex)
+        np_img_preprocessing_fused(img_read, out=_shared_ring[slot, row], **ex['img_preproc_kwargs'])
+        return slot, error_img
+    crops, error_img = _load_one_image(img, ex)
+    for idx, crop in enumerate(crops):
+        _shared_ring[slot, row + idx] = crop
+    return slot, error_img
+
+
+def _ring_tasks(buff_lists, free_slots, views_per_img=1):
+    '''
+    attach (slot, row) to every path, a slot is taken for each batch and 
+    blocks until consumer gives one back, None given back stops the tasks
+    '''
+    for buff_list in buff_lists:
+        slot = free_slots.get()
+        if slot is None:
+            return
+        for idx, img in enumerate(buff_list):
+            yield img, slot, idx * views_per_img
+
+
+def _throttled(paths, throttle, stop=None):
+    '''
+    hold back paths fed into worker pool until throttle is released by consumer,
+    stops once stop is set
+    '''
+    for path in paths:
+        throttle.acquire()
+        if stop is not None and stop.is_set():
+            return
+        yield path
+
+
+def _iter_buff_lists(img_list, buff_size, img_prefix=None):
+    for start in range(0, len(img_list), buff_size):
+        buff_list = img_list[start:start + buff_size]
+        yield [img_prefix + x for x in buff_list] if img_prefix else buff_list
+
+
+def _batch_producer(buff_lists, loaded_imgs, batch_queue, batch_shape, stage_timer, throttle=None, ring=None, stop=None):
+    '''
+    assemble batches from ordered stream of loaded images and push them into bounded batch_queue,
+    None is pushed at the end, or the exception if anything goes wrong.
+    if ring is given, images are already in place and the ring slot is pushed as batch.
+    stops early once stop is set by the consumer
+    '''
+    try:
+        for buff_list in buff_lists:
+            if stop is not None and stop.is_set():
+                return
+            tic = time.time()
+            loaded = [next(loaded_imgs) for _ in buff_list]
+            if throttle:
+                for _ in buff_list:
+                    throttle.release()
+            tic_asm = time.time()
+            slot = None
+            if ring is not None:
+                slot = loaded[0][0]
+                img_batch = ring[slot]
+            else:
+                img_batch = np.zeros(batch_shape, dtype=np.float32)
+                row = 0
+                for crops, _ in loaded:
+                    for crop in crops:
+                        img_batch[row] = crop
+                        row += 1
+            error_list = [x[1] for x in loaded if x[1]]
+            stage_timer['load'] += tic_asm - tic
+            stage_timer['assemble'] += time.time() - tic_asm
+            batch_queue.put((buff_list, img_batch, error_list, slot))
+        batch_queue.put(None)
+    except Exception as e:
+        logging.exception('Batch producer failed')
+        batch_queue.put(e)
+
+
+def infer_one_batch(model, categories, data_batch, img_list, base_name=True, views_per_img=1, tta_reduce='mean', result_writer=None, error_list=None):
+    '''
+    rows of data_batch are views_per_img consecutive views of each image, reduced by 
+    mean or max of predictions.
+    return list of result dictionaries, or if result_writer is given, 
+    append results except error images into binary files and return written file names
     '''
     Batch = namedtuple('Batch', ['data'])
     results_one_batch = list() 
     k = cfg.TEST.TOP_K
     level = cfg.TEST.FNAME_PARENT_LEVEL 
     model.forward(Batch([data_batch]))
-    output_prob_batch = model.get_outputs()[0].asnumpy()
-    for idx, img_name in enumerate(img_list):
-        if multi_crop_ave:
-            # 3x3:[[cls_0],[cls_1],[cls_2]] -> 3x1:[cls_0_avg,cls_1_avg,cls_2_avg]
-            output_prob = np.average(output_prob_batch,axis=0)
+    output_prob_batch = _reduce_views(model.get_outputs()[0].asnumpy(), len(img_list), views_per_img, tta_reduce)
+    if result_writer is not None:
+        if base_name:
+            names = [os.path.basename(x) for x in img_list]
         else:
-            output_prob = output_prob_batch[idx]
+            names = [_get_filename_with_parents(x, level=level) for x in img_list]
+        keep = [idx for idx, name in enumerate(names) if not error_list or name not in error_list]
+        result_writer.write([names[idx] for idx in keep], output_prob_batch[keep])
+        return [names[idx] for idx in keep]
+    for idx, img_name in enumerate(img_list):
+        output_prob = output_prob_batch[idx]
         
         # sort index-list and create sorted rate-list
         index_list = output_prob.argsort()
@@ -99,118 +243,122 @@ def infer_one_batch(model, categories, data_batch, img_list, base_name=True, mul
     return results_one_batch
     
 
-def generic_multi_gpu_test(model, img_list, categories, batch_size, input_shape, img_preproc_kwargs, center_crop=False, multi_crop=None, h_flip=False, img_prefix=None, base_name=True):
+def generic_multi_gpu_test(model, img_list, categories, batch_size, input_shape, img_preproc_kwargs, center_crop=False, multi_crop=None, h_flip=False, img_prefix=None, base_name=True, result_writer=None):
     '''
+    images are read and preprocessed by a producer thread (with a persistent worker pool 
+    if PROCESS_NUM > 1) while forward runs on the previous batches, at most PREFETCH_NUM 
+    ready batches are queued.
+    with multi_crop and/or h_flip, views of as many images as fit are packed into one batch 
+    and predictions are reduced per image by TTA_REDUCE.
+    with SHARED_MEMORY_BATCH, workers write float32 CHW crops directly into a shared ring of
+    PREFETCH_NUM + 2 batch slots, so no image array is pickled back to the parent.
+    results are written by result_writer and an empty dict is returned, if it is given
     '''
     timer = 0
     level = cfg.TEST.FNAME_PARENT_LEVEL 
     result = dict()
     count = 0 
     err_num = 0
-    multi_crop_ave = True if multi_crop else False
+    views_per_img = _num_views(multi_crop, h_flip)
+    assert batch_size >= views_per_img, logging.error('Batch size should be no less than {} views per image'.format(views_per_img))
     img_num = len(img_list)
-    proc_pool = multiprocessing.Pool(cfg.TEST.PROCESS_NUM)
-    logging.info("Processing images with {} procs".format(cfg.TEST.PROCESS_NUM))
-    while(img_list):
-        count += 1
-        # list of one batch data
-        buff_list = list()
-        error_list = list()
-        buff_size = 1 if multi_crop else batch_size
-        for i in range(buff_size):
-            if not img_list:
-                logging.debug("current list empty")
+    buff_size = batch_size // views_per_img
+    extra_args = {
+        'input_shape': input_shape, 
+        'img_preproc_kwargs': img_preproc_kwargs, 
+        'level': level, 
+        'base_name': base_name, 
+        'center_crop': center_crop, 
+        'multi_crop': multi_crop,
+        'h_flip': h_flip,
+        'fused': cfg.TEST.FUSED_PREPROCESSING
+    }
+    load_func = functools.partial(_load_one_image, ex=extra_args)
+    all_paths = itertools.chain.from_iterable(_iter_buff_lists(img_list, buff_size, img_prefix))
+    batch_shape = (batch_size, input_shape[0], input_shape[1], input_shape[2])
+    proc_pool, throttle, ring, free_slots = None, None, None, None
+    stop = threading.Event()
+    if cfg.TEST.PROCESS_NUM > 1 and cfg.TEST.SHARED_MEMORY_BATCH:
+        # slots: one being filled by workers, PREFETCH_NUM queued, one being copied by forward
+        ring_shape = (max(1, cfg.TEST.PREFETCH_NUM) + 2,) + batch_shape
+        shared_array = multiprocessing.RawArray(ctypes.c_float, int(np.prod(ring_shape)))
+        ring = np.frombuffer(shared_array, dtype=np.float32).reshape(ring_shape)
+        free_slots = queue.Queue()
+        for slot in range(ring_shape[0]):
+            free_slots.put(slot)
+        proc_pool = multiprocessing.Pool(cfg.TEST.PROCESS_NUM, initializer=_init_shared_ring, initargs=(shared_array, ring_shape))
+        # imap dispatches a chunk only when it is full, a chunk spanning more slots than the ring
+        # has would wait for a slot held by its own unfinished batch
+        chunk_size = min(cfg.TEST.PROCESS_CHUNK_SIZE, buff_size)
+        assert (ring_shape[0] - 1) * buff_size >= chunk_size, logging.error('Ring of {} slots is too small for chunks of {} images'.format(ring_shape[0], chunk_size))
+        ring_tasks = _ring_tasks(_iter_buff_lists(img_list, buff_size, img_prefix), free_slots, views_per_img=views_per_img)
+        loaded_imgs = proc_pool.imap(functools.partial(_load_into_ring, ex=extra_args), ring_tasks, chunksize=chunk_size)
+    elif cfg.TEST.PROCESS_NUM > 1:
+        # bound images in flight, or workers would run arbitrarily ahead of forward
+        chunk_size = cfg.TEST.PROCESS_CHUNK_SIZE
+        throttle = threading.Semaphore((cfg.TEST.PREFETCH_NUM + 1) * buff_size + chunk_size)
+        proc_pool = multiprocessing.Pool(cfg.TEST.PROCESS_NUM)
+        loaded_imgs = proc_pool.imap(load_func, _throttled(all_paths, throttle, stop), chunksize=chunk_size)
+    else:
+        loaded_imgs = (load_func(path) for path in all_paths)
+    logging.info("Processing images with {} procs, {} batches prefetched, shared memory batch: {}".format(
+        cfg.TEST.PROCESS_NUM, cfg.TEST.PREFETCH_NUM, ring is not None))
+    stage_timer = {'load': 0., 'assemble': 0., 'wait': 0., 'forward': 0.}
+    batch_queue = queue.Queue(maxsize=max(1, cfg.TEST.PREFETCH_NUM))
+    producer = threading.Thread(target=_batch_producer, args=(_iter_buff_lists(img_list, buff_size, img_prefix), loaded_imgs, batch_queue, 
+                                batch_shape, stage_timer, throttle, ring, stop))
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            tic = time.time()
+            batch = batch_queue.get()
+            tic_fwd = time.time()
+            if batch is None:
                 break
-            elif img_prefix:
-                buff_list.append(img_prefix + img_list.pop(0))
-            else:
-                buff_list.append(img_list.pop(0))
-        # process one data batch
-        tic = time.time()
-        img_batch = mx.nd.array(np.zeros((batch_size, input_shape[0], input_shape[1], input_shape[2]))) 
-        # timers = [0 for x in range(3)]
-        # tic_0 = time.time()
-        # -------------- single proc --------------
-        if cfg.TEST.PROCESS_NUM == 1:
-            for idx,img in enumerate(buff_list):
-                # tic_1 = time.time()
-                try:
-                    img_read = cv2.imread(img)
-                    if np.shape(img_read) == tuple():
-                        raise empty_image
-                except:
-                    img_read = np.zeros((input_shape[1], input_shape[2], input_shape[0]), dtype=np.uint8)
-                    if base_name:
-                        error_list.append(os.path.basename(img))
-                    else:
-                        error_list.append(_get_filename_with_parents(img, level=level))
-                    logging.error('Image error: {}, result will be deprecated!'.format(img))
-                # timers[0]+=(time.time()-tic_1)
-                # tic_2 = time.time()
-                img_tmp = np_img_preprocessing(img_read, **img_preproc_kwargs)
-                # print('improc:',time.time()-tic_2)
-                # timers[1]+=(time.time()-tic_2)
-                logging.debug('img_tmp.shape:{}'.format(img_tmp.shape))
-                # tic_3 = time.time()
-                if center_crop:
-                    img_ccr = np_img_center_crop(img_tmp, input_shape[1]) 
-                    if np.__version__.startswith('1.15'):
-                        img_batch[idx] = mx.nd.array(img_ccr)
-                    else:
-                        img_batch[idx] = mx.nd.array(img_ccr[np.newaxis, :])
-                elif multi_crop:
-                    img_crs = np_img_multi_crop(img_tmp, input_shape[1], crop_number=multi_crop)
-                    for idx_crop,crop in enumerate(img_crs):
-                        if np.__version__.startswith('1.15'):
-                            img_batch[idx_crop] = mx.nd.array(crop)
-                        else:
-                            img_batch[idx_crop] = mx.nd.array(crop[np.newaxis, :])
-                else:
-                    if np.__version__.startswith('1.15'):
-                        img_batch[idx] = mx.nd.array(img_tmp)
-                    else:
-                        img_batch[idx] = mx.nd.array(img_tmp[np.newaxis, :])
-                # timers[2]+=(time.time()-tic_3)
-            # print('batch_timer:',timers)
-            # print('batch:',time.time()-tic_0)
-
-        # -------------- multi proc ---------------
-        elif cfg.TEST.PROCESS_NUM > 1:
-            extra_args = {
-                'input_shape': input_shape, 
-                'img_preproc_kwargs': img_preproc_kwargs, 
-                'level': level, 
-                'base_name': base_name, 
-                'center_crop': center_crop, 
-                'multi_crop': multi_crop
-            }
-            # tic_1 = time.time()
-            processed_tuples = proc_pool.map(functools.partial(_image_processor, ex=extra_args), buff_list)
-            # timers[0]+=(time.time()-tic_1)
-            # tic_2 = time.time()
-            processed_imgs = [x[0] for x in processed_tuples]
-            error_list = [x[1] for x in processed_tuples if x[1]]
-            for idx,img in enumerate(processed_imgs):
-                img_batch[idx] = img
-            # timers[1]+=(time.time()-tic_2)
-        # print('batch_timer:',timers)
-        # -----------------------------------------
-        # tic_4 = time.time()
-        buff_result = infer_one_batch(model, categories, img_batch, buff_list, base_name=True, multi_crop_ave=multi_crop_ave)
-        toc = time.time()
-        # timers[2]+=(time.time()-tic_4)
-        # print('batch_infer:',time.time()-tic_4)
-        # print('FLAG:{},{},{}'.format(timers[0],timers[1],timers[2]))
-        timer+=(toc-tic)
-        for buff in buff_result:
-            result[buff["File Name"]] = buff
-        for img in error_list:
-            del result[img]
-        err_num += len(error_list)
-        logging.info("Batch [{}]:\tgpu_number={}\tbatch_size={}\terror_number={}\tbatch_time={:.3f}s".format(count, len(cfg.TEST.GPU_IDX), len(buff_result), len(error_list),toc-tic))
+            elif isinstance(batch, Exception):
+                raise batch
+            count += 1
+            buff_list, img_batch, error_list, slot = batch
+            data_batch = mx.nd.array(img_batch)
+            if slot is not None:
+                # batch is copied into ndarray, ring slot could be refilled now
+                free_slots.put(slot)
+            buff_result = infer_one_batch(model, categories, data_batch, buff_list, base_name=True, views_per_img=views_per_img, tta_reduce=cfg.TEST.TTA_REDUCE, result_writer=result_writer, error_list=error_list)
+            toc = time.time()
+            stage_timer['wait'] += tic_fwd - tic
+            stage_timer['forward'] += toc - tic_fwd
+            timer+=(toc-tic)
+            if result_writer is None:
+                for buff in buff_result:
+                    result[buff["File Name"]] = buff
+                for img in error_list:
+                    del result[img]
+            err_num += len(error_list)
+            logging.info("Batch [{}]:\tgpu_number={}\tbatch_size={}\terror_number={}\tbatch_time={:.3f}s".format(count, len(cfg.TEST.GPU_IDX), len(buff_result), len(error_list),toc-tic))
+        producer.join()
+        if proc_pool:
+            proc_pool.close()
+            proc_pool.join()
+    finally:
+        # if forward failed, producer may wait on a full batch queue and task feeder of pool
+        # on a ring slot or the throttle, pool could not be terminated then
+        stop.set()
+        while not batch_queue.empty():
+            batch_queue.get_nowait()
+        if free_slots is not None:
+            free_slots.put(None)
+        if throttle is not None:
+            throttle.release()
+        if proc_pool:
+            proc_pool.terminate()
+    count = max(count, 1)
     logging.info("Tocal error image number={}".format(err_num))
     logging.info("Average time per batch(with preprocessing)={:.3f}s".format(timer/count))
-    logging.info("Average time per image(with preprocessing)={:.3f}s".format(timer/img_num))
+    logging.info("Average time per image(with preprocessing)={:.3f}s".format(timer/max(img_num, 1)))
+    logging.info("Average stage time per batch: load={:.3f}s\tassemble={:.3f}s\twait={:.3f}s\tforward={:.3f}s".format(
+        *[stage_timer[x]/count for x in ['load', 'assemble', 'wait', 'forward']]))
+    logging.info("Bottleneck: {}".format('data loading' if stage_timer['wait'] > stage_timer['forward'] else 'forward'))
     return result
 
 
@@ -220,7 +368,6 @@ def single_image_test(model, image_path, categories, input_shape, img_preproc_kw
     Batch = namedtuple('Batch', ['data'])
     k = cfg.TEST.TOP_K
     level = cfg.TEST.FNAME_PARENT_LEVEL 
-    multi_crop_ave = True if multi_crop else False
     try:
         img_read = cv2.imread(image_path)
         if np.shape(img_read) == tuple():
@@ -233,25 +380,8 @@ def single_image_test(model, image_path, categories, input_shape, img_preproc_kw
     logging.info('Shape of image after preprocessing: {}'.format(img_tmp.shape))
 
     # input data batch 
-    if center_crop:
-        img_ccr = np_img_center_crop(img_tmp, input_shape[1]) 
-        if np.__version__.startswith('1.15'):
-            img_batch = mx.nd.array(img_ccr)
-        else:
-            img_batch = mx.nd.array(img_ccr[np.newaxis, :])
-    elif multi_crop:
-        img_batch = mx.nd.array(np.zeros((multi_crop, input_shape[0], input_shape[1], input_shape[2])))
-        img_crs = np_img_multi_crop(img_tmp, input_shape[1], crop_number=multi_crop)
-        for idx_crop,crop in enumerate(img_crs):
-            if np.__version__.startswith('1.15'):
-                img_batch[idx_crop] = mx.nd.array(crop)
-            else:
-                img_batch[idx_crop] = mx.nd.array(crop[np.newaxis, :])
-    else:
-        if np.__version__.startswith('1.15'):
-            img_batch = mx.nd.array(img_tmp)
-        else:
-            img_batch = mx.nd.array(img_tmp[np.newaxis, :])
+    views = _tta_views(img_tmp, {'input_shape': input_shape, 'center_crop': center_crop, 'multi_crop': multi_crop, 'h_flip': h_flip})
+    img_batch = mx.nd.array(np.stack(views))
     logging.info('Shape of data fed to model: {}'.format(img_batch.shape))
 
     # forward
@@ -264,12 +394,7 @@ def single_image_test(model, image_path, categories, input_shape, img_preproc_kw
     #     if ("0" in layer or "bn_data" in layer) and "flatten" not in layer: 
     #         logging.debug('==> [{}]:{} {}\n{}'.format(idx, layer, layer_output.shape, layer_output[0,0,:10,:10]))
     # ===============
-    output_prob_batch = model.get_outputs()[0].asnumpy()
-    if multi_crop_ave:
-        # 3x3:[[cls_0],[cls_1],[cls_2]] -> 3x1:[cls_0_avg,cls_1_avg,cls_2_avg]
-        output_prob = np.average(output_prob_batch,axis=0)
-    else:
-        output_prob = output_prob_batch[0]
+    output_prob = _reduce_views(model.get_outputs()[0].asnumpy(), 1, len(views), cfg.TEST.TTA_REDUCE)[0]
     
     # sort index-list and create sorted rate-list
     index_list = output_prob.argsort()
@@ -306,12 +431,13 @@ def mutable_images_test(model, image_list, categories, input_shape, img_preproc_
     return results
 
 
-def test_wrapper(model, image_or_list, categories, batch_size, input_shape, kwargs, center_crop=False, multi_crop=None, h_flip=False, img_prefix=None, base_name=True, single_img_test=False, mutable_img_test=False):
+def test_wrapper(model, image_or_list, categories, batch_size, input_shape, kwargs, center_crop=False, multi_crop=None, h_flip=False, img_prefix=None, base_name=True, single_img_test=False, mutable_img_test=False, result_writer=None):
     '''
     '''
+    assert result_writer is None or not (single_img_test or mutable_img_test), logging.error('Binary result output is only supported under generic testing')
     if single_img_test:
         return single_image_test(model, image_or_list, categories, input_shape, kwargs, center_crop=center_crop, multi_crop=multi_crop, h_flip=h_flip)
     elif mutable_img_test:
         return mutable_images_test(model, image_or_list, categories, input_shape, kwargs, center_crop=center_crop, h_flip=h_flip, img_prefix=img_prefix, base_name=base_name)
     else:
-        return generic_multi_gpu_test(model, image_or_list, categories, batch_size, input_shape, kwargs, center_crop=center_crop, multi_crop=multi_crop, h_flip=h_flip, img_prefix=img_prefix, base_name=base_name) 
+        return generic_multi_gpu_test(model, image_or_list, categories, batch_size, input_shape, kwargs, center_crop=center_crop, multi_crop=multi_crop, h_flip=h_flip, img_prefix=img_prefix, base_name=base_name, result_writer=result_writer) 
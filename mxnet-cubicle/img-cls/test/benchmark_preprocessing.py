@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# created 2026/10/18 @Northrend
+#
+# Micro-benchmark of image pre-processing
+# On MXNet
+#
+
+from __future__ import print_function
+import os
+import sys
+import re
+import time
+import cv2
+import docopt
+import logging
+import numpy as np
+
+cur_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(cur_path,'../lib'))
+from io_hybrid import np_img_preprocessing, np_img_preprocessing_fused
+
+# init global logger
+log_format = '%(asctime)s %(levelname)s: %(message)s'
+logging.basicConfig(level=logging.INFO, format=log_format)
+logger = logging.getLogger()
+
+
+def _init_():
+    '''
+    Compare np_img_preprocessing with np_img_preprocessing_fused on speed and results
+    Update: 2026/10/18
+    Author: @Northrend
+    Contributor:
+
+    Change log:
+    2026/10/18  v1.0                basic functions
+
+    Usage:
+        benchmark_preprocessing.py  <input-img> [--loops=int --resize-w-h=str]
+                                    [--resize-min-max=str --half]
+        benchmark_preprocessing.py  -v | --version
+        benchmark_preprocessing.py  -h | --help
+
+    Arguments:
+        <input-img>                 path to one image file
+
+    Options:
+        -h --help                   show this help screen
+        -v --version                show current version
+        -------------------------------------------------------
+        --loops=int                 number of calls to time [default: 500]
+        --resize-w-h=str            resize to w,h [default: 224,224]
+        --resize-min-max=str        set to keep aspect ratio and resize by min,max
+        --half                      set to write float16 output with fused function
+    '''
+    logger.info('=' * 80 + '\nCalled with arguments:')
+    for key in sorted(args.keys()):
+        logger.info('{:<20}= {}'.format(key.replace('--', ''), args[key]))
+    logger.info('=' * 80)
+
+
+def _time_per_call(func, loops):
+    tic = time.time()
+    for _ in range(loops):
+        func()
+    return (time.time() - tic) / loops
+
+
+def main():
+    img = cv2.imread(args['<input-img>'])
+    assert img is not None, logger.error('Reading image failed')
+    loops = int(args['--loops'])
+    kwargs = {'mean_rgb': [123.68, 116.779, 103.939], 'std_rgb': [58.395, 57.12, 57.375]}
+    if args['--resize-min-max']:
+        kwargs['keep_aspect_ratio'] = True
+        kwargs['resize_min_max'] = [int(x) for x in args['--resize-min-max'].split(',')]
+    else:
+        kwargs['keep_aspect_ratio'] = False
+        kwargs['resize_w_h'] = [int(x) for x in args['--resize-w-h'].split(',')]
+    dtype = np.float16 if args['--half'] else np.float32
+
+    reference = np_img_preprocessing(img, **kwargs)
+    out = np.empty(reference.shape, dtype=dtype)
+    np_img_preprocessing_fused(img, out=out, **kwargs)
+    logger.info('Image shape: {} => {}'.format(img.shape, reference.shape))
+    logger.info('Max absolute difference: {:.6f}'.format(np.abs(reference - out).max()))
+
+    # reference is copied into contiguous float32 as it is when fed to mxnet
+    time_ref = _time_per_call(lambda: np.ascontiguousarray(np_img_preprocessing(img, **kwargs), dtype=np.float32), loops)
+    time_fused = _time_per_call(lambda: np_img_preprocessing_fused(img, out=out, **kwargs), loops)
+    logger.info('np_img_preprocessing:       {:.3f}ms per image'.format(time_ref * 1000))
+    logger.info('np_img_preprocessing_fused: {:.3f}ms per image'.format(time_fused * 1000))
+    logger.info('Speed-up: {:.2f}x'.format(time_ref / time_fused))
+
+
+if __name__ == "__main__":
+    version = re.compile('.*\d+/\d+\s+(v[\d.]+)').findall(_init_.__doc__)[0]
+    args = docopt.docopt(
+        _init_.__doc__, version='Pre-processing benchmark {}'.format(version))
+    _init_()
+    main()
+    logger.info('...done')
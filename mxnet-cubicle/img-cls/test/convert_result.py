@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# created 2026/10/18 @Northrend
+#
+# Converter between json inference log and binary result files
+# On MXNet
+#
+
+from __future__ import print_function
+import os
+import sys
+import re
+import docopt
+import logging
+
+cur_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(cur_path,'../lib'))
+from result_util import json_to_binary, binary_to_json, is_binary_result
+
+# init global logger
+log_format = '%(asctime)s %(levelname)s: %(message)s'
+logging.basicConfig(level=logging.INFO, format=log_format)
+logger = logging.getLogger()
+
+
+def _init_():
+    '''
+    Convert inference results between json log and columnar binary files
+    Update: 2026/10/18
+    Author: @Northrend
+    Contributor:
+
+    Change log:
+    2026/10/18  v1.0                basic functions
+
+    Usage:
+        convert_result.py           <input> <output> [--dtype=str]
+        convert_result.py           -v | --version
+        convert_result.py           -h | --help
+
+    Arguments:
+        <input>                     json log, or prefix of binary result files
+        <output>                    prefix of binary result files if input is json,
+                                    or path to json log if input is binary
+
+    Options:
+        -h --help                   show this help screen
+        -v --version                show current version
+        -------------------------------------------------------
+        --dtype=str                 confidence dtype of binary result files,
+                                    float16 or float32 [default: float16]
+    '''
+    logger.info('=' * 80 + '\nCalled with arguments:')
+    for key in sorted(args.keys()):
+        logger.info('{:<20}= {}'.format(key.replace('--', ''), args[key]))
+    logger.info('=' * 80)
+
+
+def main():
+    if is_binary_result(args['<input>']):
+        logger.info('Converting binary result files into json log...')
+        binary_to_json(args['<input>'], args['<output>'])
+    else:
+        logger.info('Converting json log into binary result files...')
+        json_to_binary(args['<input>'], args['<output>'], dtype=args['--dtype'])
+
+
+if __name__ == "__main__":
+    version = re.compile('.*\d+/\d+\s+(v[\d.]+)').findall(_init_.__doc__)[0]
+    args = docopt.docopt(
+        _init_.__doc__, version='Inference result converter {}'.format(version))
+    _init_()
+    main()
+    logger.info('...done')
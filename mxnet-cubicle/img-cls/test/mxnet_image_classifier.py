@@ -26,6 +26,7 @@ sys.path.append(os.path.join(cur_path,'../lib'))
 from io_hybrid import load_model, load_image_list, load_category_list 
 from net_util import init_forward_net 
 from test_util import test_wrapper 
+from result_util import BinaryResultWriter
 from config import merge_cfg_from_file
 from config import cfg as _
 cfg = _.TEST
@@ -40,11 +41,13 @@ fhandler = None     # log to file
 def _init_():
     '''
     Inference script for image-classification task on mxnet
-    Update: 2019-01-03 
+    Update: 2026-10-18 
     Author: @Northrend
     Contributor: 
 
     Change log:
+    2026/10/18  v3.7                pack multi-crop and flip views of many images into one batch
+    2026/10/18  v3.6                support columnar binary result output
     2019/01/03  v3.5                fix category list sort bug 
     2018/09/30  v3.4                support parallelized image pre-processing
     2018/07/23  v3.3                fix testing bug caused by mxnet v1.0.0
@@ -105,9 +108,8 @@ def main():
     # init
     devices = [mx.gpu(x) for x in cfg.GPU_IDX]
     img_prefix = cfg.INPUT_IMG_PREFIX if cfg.INPUT_IMG_PREFIX else None
-    if cfg.MULTI_CROP:
-        assert len(devices)==1, logger.error('Only single gpu mode is supported under multi-crop testintg') 
-    batch_size_per_gpu = cfg.MULTI_CROP_NUM if cfg.MULTI_CROP else cfg.BATCH_SIZE
+    # under multi-crop or flip testing, views of BATCH_SIZE/views images per gpu are packed into one batch
+    batch_size_per_gpu = cfg.BATCH_SIZE
     batch_size = len(devices)*batch_size_per_gpu
     input_shape = cfg.INPUT_SHAPE
     center_crop = cfg.CENTER_CROP
@@ -145,11 +147,19 @@ def main():
         logger.info('Result:\n{}'.format(pprint.pformat(result)))
     else:
         logger.info('List of images testing mode...')
-        result = test_wrapper(model, image_list, categories, batch_size, input_shape, kwargs, center_crop=center_crop, multi_crop=multi_crop_num, h_flip=h_flip, img_prefix=img_prefix, base_name=True, single_img_test=False, mutable_img_test=cfg.MUTABLE_IMAGES_TEST)
-        # write json file
-        logger.info('Writing result into json file: {}'.format(cfg.OUTPUT_JSON_PATH))
-        with open(cfg.OUTPUT_JSON_PATH,'w') as f:
-            json.dump(result, f, indent=2)
+        result_writer = None
+        if cfg.OUTPUT_FORMAT == 'binary':
+            assert cfg.OUTPUT_BIN_PREFIX, logger.error('Missing OUTPUT_BIN_PREFIX!')
+            logger.info('Writing result into binary files: {}.*'.format(cfg.OUTPUT_BIN_PREFIX))
+            result_writer = BinaryResultWriter(cfg.OUTPUT_BIN_PREFIX, top_k=cfg.TOP_K, dtype=cfg.OUTPUT_BIN_DTYPE, all_confidence=cfg.LOG_ALL_CONFIDENCE, categories=categories)
+        result = test_wrapper(model, image_list, categories, batch_size, input_shape, kwargs, center_crop=center_crop, multi_crop=multi_crop_num, h_flip=h_flip, img_prefix=img_prefix, base_name=True, single_img_test=False, mutable_img_test=cfg.MUTABLE_IMAGES_TEST, result_writer=result_writer)
+        if result_writer is not None:
+            result_writer.close()
+        else:
+            # write json file
+            logger.info('Writing result into json file: {}'.format(cfg.OUTPUT_JSON_PATH))
+            with open(cfg.OUTPUT_JSON_PATH,'w') as f:
+                json.dump(result, f, indent=2)
 
 
 if __name__ == "__main__":
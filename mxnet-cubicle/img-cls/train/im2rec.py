@@ -13,6 +13,9 @@ import random
 import argparse
 import cv2
 import time
+import shutil
+import struct
+import hashlib
 import traceback
 
 try:
@@ -79,9 +82,13 @@ def make_list(args):
                 write_list(args.prefix + str_chunk + '_val.lst', chunk[sep_test + sep:])
             write_list(args.prefix + str_chunk + '_train.lst', chunk[sep_test:sep_test + sep])
 
-def read_list(path_in):
+def read_list(path_in, start=0, stop=None):
+    '''
+    parse items of list path_in, only lines starting in byte range [start, stop) if given
+    '''
     with open(path_in) as fin:
-        while True:
+        fin.seek(start)
+        while stop is None or fin.tell() < stop:
             line = fin.readline()
             if not line:
                 break
@@ -97,7 +104,10 @@ def read_list(path_in):
                 continue
             yield item
 
-def image_encode(args, i, item, q_out):
+def encode_item(args, item):
+    '''
+    return packed record of one list item, None if failed
+    '''
     fullpath = os.path.join(args.root, item[1])
 
     if len(item) > 3 and args.pack_label:
@@ -109,25 +119,21 @@ def image_encode(args, i, item, q_out):
         try:
             with open(fullpath) as fin:
                 img = fin.read()
-            s = mx.recordio.pack(header, img)
-            q_out.put((i, s, item))
+            return mx.recordio.pack(header, img)
         except Exception, e:
             traceback.print_exc()
             print('pack_img error:', item[1], e)
-            q_out.put((i, None, item))
-        return
+            return None
 
     try:
         img = cv2.imread(fullpath, args.color)
     except:
         traceback.print_exc()
         print('imread error trying to load file: %s ' % fullpath)
-        q_out.put((i, None, item))
-        return
+        return None
     if img is None:
         print('imread read blank (None) image for file: %s' % fullpath)
-        q_out.put((i, None, item))
-        return
+        return None
     if args.center_crop:
         if img.shape[0] > img.shape[1]:
             margin = int(float(img.shape[0] - img.shape[1]) / 2);
@@ -147,13 +153,14 @@ def image_encode(args, i, item, q_out):
                 newsize = (img.shape[1] * args.resize / img.shape[0], args.resize)
         img = cv2.resize(img, newsize)
     try:
-        s = mx.recordio.pack_img(header, img, quality=args.quality, img_fmt=args.encoding)
-        q_out.put((i, s, item))
+        return mx.recordio.pack_img(header, img, quality=args.quality, img_fmt=args.encoding)
     except Exception, e:
         traceback.print_exc()
         print('pack_img error on file: %s' % fullpath, e)
-        q_out.put((i, None, item))
-        return
+        return None
+
+def image_encode(args, i, item, q_out):
+    q_out.put((i, encode_item(args, item), item))
 
 def read_worker(args, q_in, q_out):
     while True:
@@ -192,6 +199,267 @@ def write_worker(q_out, fname, working_dir):
                 pre_time = cur_time
             count += 1
 
+def shard_paths(fname, working_dir, shard_index, tag='part'):
+    '''
+    .idx and .rec paths of one shard of list fname
+    '''
+    name = os.path.splitext(os.path.basename(fname))[0] + '.%s%03d' % (tag, shard_index)
+    return os.path.join(working_dir, name + '.idx'), os.path.join(working_dir, name + '.rec')
+
+def write_items(args, items, path_idx, path_rec, shard_index=0):
+    '''
+    encode items into one indexed record, in the given order
+    '''
+    record = mx.recordio.MXIndexedRecordIO(path_idx, path_rec, 'w')
+    pre_time = time.time()
+    count = 0
+    for item in items:
+        s = encode_item(args, item)
+        if s is not None:
+            record.write_idx(item[0], s)
+        count += 1
+        if count % 1000 == 0:
+            cur_time = time.time()
+            print('shard:', shard_index, ' time:', cur_time - pre_time, ' count:', count)
+            pre_time = cur_time
+    record.close()
+    return path_idx, path_rec
+
+def split_list(path_in, num_parts):
+    '''
+    split list path_in into num_parts contiguous byte ranges of similar size, each starting at a line
+    only num_parts seeks, so no shard has to parse the list before its own part
+    '''
+    size = os.path.getsize(path_in)
+    bounds = [0]
+    with open(path_in, 'rb') as fin:
+        for i in range(1, num_parts):
+            pos = max(size * i // num_parts, bounds[-1])
+            if pos > 0:
+                # skip to the start of next line, unless pos already is one
+                fin.seek(pos - 1)
+                fin.readline()
+                pos = fin.tell()
+            bounds.append(min(pos, size))
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def write_shard(args, fname, working_dir, shard_index, start, stop):
+    '''
+    encode items of list fname in byte range [start, stop) into their own shard, in list order
+    '''
+    path_idx, path_rec = shard_paths(fname, working_dir, shard_index)
+    return write_items(args, read_list(fname, start, stop), path_idx, path_rec, shard_index)
+
+def merge_shards(shards, path_idx, path_rec, buffer_size=16 << 20, append=False):
+    '''
+    concatenate shards into one indexed record, rewriting offsets in .idx
+    shards is a list of (.idx path, .rec path), merged in the given order
+    if append, shards are appended to existing path_rec and path_idx
+    '''
+    offset = os.path.getsize(path_rec) if append else 0
+    with open(path_rec, 'ab' if append else 'wb') as frec, open(path_idx, 'a' if append else 'w') as fidx:
+        for shard_idx, shard_rec in shards:
+            with open(shard_rec, 'rb') as fin:
+                shutil.copyfileobj(fin, frec, buffer_size)
+            with open(shard_idx) as fin:
+                for line in fin:
+                    key, pos = line.strip().split('\t')
+                    fidx.write('%s\t%d\n' % (key, int(pos) + offset))
+            # records are padded to 4 bytes, so shards stay aligned after concatenation
+            offset += os.path.getsize(shard_rec)
+
+def write_sharded(args, fname, working_dir):
+    '''
+    split list fname into args.shards contiguous parts, each encoded by a worker process into its own shard,
+    then merge shards into one record in list order unless args.keep_shards
+    '''
+    pool = multiprocessing.Pool(max(1, min(args.num_thread, args.shards)))
+    results = [pool.apply_async(write_shard, (args, fname, working_dir, i, start, stop))
+               for i, (start, stop) in enumerate(split_list(fname, args.shards))]
+    pool.close()
+    shards = [res.get() for res in results]
+    pool.join()
+    if args.keep_shards:
+        print('%d shards written:' % len(shards), ', '.join(x[1] for x in shards))
+        return
+    fname = os.path.basename(fname)
+    path_idx = os.path.join(working_dir, os.path.splitext(fname)[0] + '.idx')
+    path_rec = os.path.join(working_dir, os.path.splitext(fname)[0] + '.rec')
+    tic = time.time()
+    merge_shards(shards, path_idx, path_rec)
+    print('%d shards merged into %s in %.2fs' % (len(shards), path_rec, time.time() - tic))
+    for shard in shards:
+        for path in shard:
+            os.remove(path)
+
+def read_idx(path_idx):
+    '''
+    list of (key, offset) in .idx order
+    '''
+    entries = list()
+    if os.path.isfile(path_idx):
+        with open(path_idx) as fin:
+            for line in fin:
+                key, pos = line.strip().split('\t')
+                entries.append((int(key), int(pos)))
+    return entries
+
+def write_idx(path_idx, entries):
+    with open(path_idx + '.tmp', 'w') as fout:
+        for key, pos in entries:
+            fout.write('%d\t%d\n' % (key, pos))
+    os.rename(path_idx + '.tmp', path_idx)
+
+def fingerprint(fullpath, method='stat'):
+    '''
+    size and mtime of source file, or md5 of its content
+    '''
+    if method == 'md5':
+        md5 = hashlib.md5()
+        with open(fullpath, 'rb') as fin:
+            for chunk in iter(lambda: fin.read(1 << 20), b''):
+                md5.update(chunk)
+        return md5.hexdigest()
+    stat = os.stat(fullpath)
+    return '%d-%d' % (stat.st_size, int(stat.st_mtime))
+
+def read_manifest(path_manifest):
+    '''
+    manifest of an incremental record, one line for each live record:
+    key \t fingerprint \t labels \t path
+    '''
+    manifest = dict()
+    with open(path_manifest) as fin:
+        for line in fin:
+            key, fp, label, path = line.rstrip('\n').split('\t', 3)
+            manifest[path] = (int(key), fp, label)
+    return manifest
+
+def write_manifest(path_manifest, manifest):
+    with open(path_manifest + '.tmp', 'w') as fout:
+        for path, (key, fp, label) in sorted(manifest.items(), key=lambda x: x[1][0]):
+            fout.write('%d\t%s\t%s\t%s\n' % (key, fp, label, path))
+    os.rename(path_manifest + '.tmp', path_manifest)
+
+def _record_size(frec, pos):
+    '''
+    bytes taken by the record at pos, including headers, paddings and continued parts
+    '''
+    size = 0
+    while True:
+        frec.seek(pos + size)
+        magic, lrecord = struct.unpack('<II', frec.read(8))
+        assert magic == 0xced7230a, 'invalid record at offset %d' % (pos + size)
+        cflag, length = lrecord >> 29, lrecord & ((1 << 29) - 1)
+        size += 8 + (length + 3) // 4 * 4
+        # 0: whole record, 3: last part of a split record
+        if cflag in (0, 3):
+            return size
+
+def compact_record(path_idx, path_rec, buffer_size=16 << 20):
+    '''
+    rewrite .rec with only records indexed in .idx, raw bytes are copied without re-encoding.
+    both files are written aside and renamed at the end, so offsets of .idx always match .rec
+    '''
+    entries = read_idx(path_idx)
+    with open(path_rec, 'rb') as fin, open(path_rec + '.tmp', 'wb') as fout, \
+            open(path_idx + '.tmp', 'w') as fidx:
+        for key, pos in entries:
+            size = _record_size(fin, pos)
+            fin.seek(pos)
+            fidx.write('%d\t%d\n' % (key, fout.tell()))
+            fout.write(fin.read(size))
+    os.rename(path_idx + '.tmp', path_idx)
+    os.rename(path_rec + '.tmp', path_rec)
+
+def _label_str(item):
+    return ','.join('%f' % x for x in item[2:])
+
+def write_incremental(args, fname, working_dir):
+    '''
+    update <name>.rec/.idx built from an earlier version of list fname:
+    unchanged images (same path, fingerprint and labels) are kept as they are,
+    new or changed ones are encoded and appended with new keys,
+    removed or changed ones are tombstoned by dropping them from .idx.
+    .rec is compacted whenever records are tombstoned, as sequential readers would still
+    see them; with args.keep_tombstones compaction waits until they exceed args.compact_ratio
+    of all records, and only readers given path_imgidx skip them meanwhile
+    '''
+    name = os.path.splitext(os.path.basename(fname))[0]
+    path_idx = os.path.join(working_dir, name + '.idx')
+    path_rec = os.path.join(working_dir, name + '.rec')
+    path_manifest = os.path.join(working_dir, name + '.manifest')
+    path_tombstones = os.path.join(working_dir, name + '.tombstones')
+    if os.path.isfile(path_manifest) and os.path.isfile(path_rec):
+        manifest = read_manifest(path_manifest)
+    else:
+        print('No manifest of %s found, building from scratch' % path_rec)
+        manifest = dict()
+        for path in (path_idx, path_rec, path_tombstones):
+            if os.path.isfile(path):
+                os.remove(path)
+        open(path_rec, 'wb').close()
+        open(path_idx, 'w').close()
+    entries = read_idx(path_idx)
+    tombstones = read_idx(path_tombstones)
+    next_key = max([x[0] for x in entries + tombstones] or [-1]) + 1
+
+    live, new_items = dict(), list()
+    for item in read_list(fname):
+        fp = fingerprint(os.path.join(args.root, item[1]), args.fingerprint) \
+            if os.path.isfile(os.path.join(args.root, item[1])) else ''
+        label = _label_str(item)
+        old = manifest.get(item[1])
+        if old and old[1] == fp and old[2] == label and item[1] not in live:
+            live[item[1]] = old
+        else:
+            # keys of appended records continue from the largest key ever written
+            item[0] = next_key
+            next_key += 1
+            new_items.append((item, fp, label))
+    live_keys = set(x[0] for x in live.values())
+    removed = [x for x in entries if x[0] not in live_keys]
+    print('kept: %d, appending: %d, tombstoning: %d' % (len(live), len(new_items), len(removed)))
+    if removed:
+        tombstones.extend(removed)
+        write_idx(path_tombstones, tombstones)
+        write_idx(path_idx, [x for x in entries if x[0] in live_keys])
+
+    if new_items:
+        num_shards = max(1, min(args.num_thread, len(new_items)))
+        shard_size = (len(new_items) + num_shards - 1) // num_shards
+        tasks = [([x[0] for x in new_items[i * shard_size:(i + 1) * shard_size]],) + shard_paths(fname, working_dir, i, 'append')
+                 for i in range(num_shards)]
+        if num_shards > 1 and multiprocessing is not None:
+            pool = multiprocessing.Pool(num_shards)
+            results = [pool.apply_async(write_items, (args,) + task + (i,)) for i, task in enumerate(tasks)]
+            pool.close()
+            shards = [res.get() for res in results]
+            pool.join()
+        else:
+            shards = [write_items(args, *task) for task in tasks]
+        written = set(x[0] for shard in shards for x in read_idx(shard[0]))
+        merge_shards(shards, path_idx, path_rec, append=True)
+        for shard in shards:
+            for path in shard:
+                os.remove(path)
+        for item, fp, label in new_items:
+            if item[0] in written:
+                live[item[1]] = (item[0], fp, label)
+    write_manifest(path_manifest, live)
+
+    num_records = len(live) + len(tombstones)
+    if tombstones and (not args.keep_tombstones or float(len(tombstones)) / num_records > args.compact_ratio):
+        tic = time.time()
+        compact_record(path_idx, path_rec)
+        os.remove(path_tombstones)
+        print('%d tombstoned records compacted in %.2fs' % (len(tombstones), time.time() - tic))
+    elif tombstones:
+        print('WARNING: %d removed or replaced records are still in %s, read it with path_imgidx=%s '
+              'or they are seen again' % (len(tombstones), path_rec, path_idx))
+    print('%s: %d live records' % (path_rec, len(live)))
+
 def parse_args():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
@@ -242,6 +510,25 @@ def parse_args():
                         help='specify the encoding of the images.')
     rgroup.add_argument('--pack-label', type=bool, default=False,
         help='Whether to also pack multi dimensional label in the record file')
+    rgroup.add_argument('--shards', type=int, default=0,
+                        help='If > 0, split the list into this many contiguous parts, each encoded by a worker process\
+        into its own <name>.partXXX.rec/.idx shard, then merge shards into <name>.rec/.idx in list order.\
+        Up to --num-thread shards are written at the same time.')
+    rgroup.add_argument('--keep-shards', type=bool, default=False,
+                        help='If this is set as True with --shards, shards are kept instead of merged, e.g. one shard\
+        for each of num_parts distributed readers.')
+    rgroup.add_argument('--incremental', type=bool, default=False,
+                        help='If this is set as True, update existing <name>.rec/.idx instead of rebuilding it:\
+        only new or changed images in the list are encoded and appended, removed ones are tombstoned.\
+        Source files are tracked in <name>.manifest. Rebuild from scratch after changing encoding options.')
+    rgroup.add_argument('--fingerprint', type=str, default='stat', choices=['stat', 'md5'],
+                        help='how --incremental detects changed source files, by size and mtime or by content md5.')
+    rgroup.add_argument('--keep-tombstones', type=bool, default=False,
+                        help='with --incremental, leave removed or replaced records in .rec instead of compacting\
+        it on every update, until they exceed --compact-ratio. Readers must then pass path_imgidx=<name>.idx,\
+        e.g. to mx.io.ImageRecordIter, or they still read the tombstoned records.')
+    rgroup.add_argument('--compact-ratio', type=float, default=0.2,
+                        help='with --keep-tombstones, compact .rec when tombstoned records exceed this ratio.')
     cgroup.add_argument('--force-resize', type=bool, default=False, help='If this is set as True, \
         image will be resized to size: (--resize,--resize)')
 
@@ -271,7 +558,11 @@ if __name__ == '__main__':
                 print('resize:',args.resize)
                 print('force_resize:',args.force_resize)
                 # -- write_record -- #
-                if args.num_thread > 1 and multiprocessing is not None:
+                if args.incremental:
+                    write_incremental(args, fname, working_dir)
+                elif args.shards > 0 and multiprocessing is not None:
+                    write_sharded(args, fname, working_dir)
+                elif args.num_thread > 1 and multiprocessing is not None:
                     q_in = [multiprocessing.Queue(1024) for i in range(args.num_thread)]
                     q_out = multiprocessing.Queue(1024)
                     read_process = [multiprocessing.Process(target=read_worker, args=(args, q_in[i], q_out)) \
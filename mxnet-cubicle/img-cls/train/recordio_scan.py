@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# created 2026/10/18 @Northrend
+#
+# Integrity and statistics scanner of RecordIO files
+#
+
+from __future__ import print_function
+import os
+import sys
+import re
+import json
+import time
+import struct
+import logging
+import functools
+import docopt
+from collections import Counter
+
+cur_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(cur_path,'../lib'))
+from recordio_reader import RecordReader, parallel_map, unpack
+from img_header import parse_header
+
+# init global logger
+log_format = '%(asctime)s %(levelname)s: %(message)s'
+logging.basicConfig(level=logging.INFO, format=log_format)
+logger = logging.getLogger()
+
+
+def _init_():
+    '''
+    Verify every record of a .rec file and collect label and image-size histograms,
+    images are checked by header-only parsing without decoding
+    Update: 2026/10/18
+    Author: @Northrend
+    Contributor:
+
+    Change log:
+    2026/10/18      v1.0            basic functions
+
+    Usage:
+        recordio_scan.py        <rec> [--idx=str --workers=int --chunk-size=int --size-bin=int]
+                                [--report=str --bad-list=str]
+        recordio_scan.py        -v | --version
+        recordio_scan.py        -h | --help
+
+    Arguments:
+        <rec>                   path to .rec file
+
+    Options:
+        -h --help               show this help screen
+        -v --version            show current version
+        ---------------------------------------------------------------------------
+        --idx=str               path to .idx file, <rec>.idx is used if exists,
+                                otherwise records are located by walking headers
+        --workers=int           number of scanning processes [default: 8]
+        --chunk-size=int        records per task [default: 4096]
+        --size-bin=int          bin width in pixels of image-size histograms [default: 64]
+        --report=str            json report path, <rec>.scan.json by default
+        --bad-list=str          bad record list path, <rec>.bad.lst by default
+    '''
+    logger.info('=' * 80 + '\nArguments submitted:')
+    for key in sorted(args.keys()):
+        logger.info('{:<20}= {}'.format(key.replace('--', ''), args[key]))
+    logger.info('=' * 80)
+
+
+def _label_key(label):
+    try:
+        return ','.join('{:g}'.format(x) for x in label)
+    except TypeError:
+        return '{:g}'.format(label)
+
+
+def scan_chunk(reader, start, stop, size_bin=64):
+    '''
+    check records [start, stop), return partial statistics
+    '''
+    stat = {'num': 0, 'bytes': 0, 'formats': Counter(), 'labels': Counter(),
+            'widths': Counter(), 'heights': Counter(), 'bad': list()}
+    for index in range(start, stop):
+        stat['num'] += 1
+        try:
+            header, img = unpack(reader.raw(index))
+        except (AssertionError, ValueError, struct.error) as e:
+            stat['bad'].append((index, int(reader.keys[index]), 'bad record: {}'.format(e)))
+            continue
+        stat['bytes'] += len(img)
+        stat['labels'][_label_key(header.label)] += 1
+        try:
+            fmt, width, height, _ = parse_header(img)
+        except (ValueError, struct.error) as e:
+            stat['bad'].append((index, int(reader.keys[index]), str(e)))
+            continue
+        stat['formats'][fmt] += 1
+        stat['widths'][width // size_bin * size_bin] += 1
+        stat['heights'][height // size_bin * size_bin] += 1
+    return stat
+
+
+def _merge_stat(total, stat):
+    for key in ('num', 'bytes', 'bad'):
+        total[key] += stat[key]
+    for key in ('formats', 'labels', 'widths', 'heights'):
+        total[key].update(stat[key])
+
+
+def _sorted_hist(counter, numeric=True):
+    return [[k, counter[k]] for k in sorted(counter, key=float if numeric else str)]
+
+
+def main():
+    path_rec = args['<rec>']
+    path_report = args['--report'] or path_rec + '.scan.json'
+    path_bad = args['--bad-list'] or path_rec + '.bad.lst'
+    tic = time.time()
+    reader = RecordReader(path_rec, args['--idx'])
+    logger.info('{} records located in {:.2f}s'.format(len(reader), time.time() - tic))
+
+    total = {'num': 0, 'bytes': 0, 'formats': Counter(), 'labels': Counter(),
+             'widths': Counter(), 'heights': Counter(), 'bad': list()}
+    func = functools.partial(scan_chunk, size_bin=int(args['--size-bin']))
+    for idx_chunk, stat in enumerate(parallel_map(reader, func, num_proc=int(args['--workers']), chunk_size=int(args['--chunk-size']))):
+        _merge_stat(total, stat)
+        if (idx_chunk + 1) % 100 == 0:
+            logger.info('{}/{} records scanned, {} bad'.format(total['num'], len(reader), len(total['bad'])))
+    elapsed = time.time() - tic
+
+    report = {
+        'rec': os.path.abspath(path_rec),
+        'num_records': total['num'],
+        'num_bad': len(total['bad']),
+        'bad_reasons': Counter(re.sub(r'\d+', 'N', x[2]) for x in total['bad']),
+        'image_bytes': total['bytes'],
+        'formats': total['formats'],
+        'labels': _sorted_hist(total['labels'], numeric=False),
+        'width_hist': _sorted_hist(total['widths']),
+        'height_hist': _sorted_hist(total['heights']),
+        'size_bin': int(args['--size-bin']),
+        'elapsed': round(elapsed, 3)
+    }
+    with open(path_report, 'w') as f:
+        json.dump(report, f, indent=2)
+    with open(path_bad, 'w') as f:
+        for index, key, reason in total['bad']:
+            f.write('{}\t{}\t{}\n'.format(index, key, reason))
+    logger.info('{} records, {} bad, {:.1f} MB/s'.format(total['num'], len(total['bad']),
+                                                       os.path.getsize(path_rec) / 1e6 / max(elapsed, 1e-6)))
+    logger.info('Report saved: {}'.format(path_report))
+    logger.info('Bad records saved: {}'.format(path_bad))
+
+
+if __name__ == '__main__':
+    version = re.compile('.*\d+/\d+\s+(v[\d.]+)').findall(_init_.__doc__)[0]
+    args = docopt.docopt(
+        _init_.__doc__, version='RecordIO scanner {}'.format(version))
+    _init_()
+    main()
+    logger.info('...done')
@@ -1,7 +1,20 @@
-import mxnet as mx
+import os
 import sys
 
 # reccordio_traverse.py /path/to/test.rec 16
+# reccordio_traverse.py /path/to/test.rec raw       walk raw records without decoding
+if sys.argv[2] == 'raw':
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../lib'))
+    from recordio_reader import RecordReader
+    reader = RecordReader(sys.argv[1])
+    for i, header, img in reader.iter_records():
+        if (i + 1) % 100000 == 0:
+            print '{}th record: {} bytes'.format(i + 1, len(img))
+    print 'traverse success: {} records'.format(len(reader))
+    reader.close()
+    sys.exit(0)
+
+import mxnet as mx
 data_iter = mx.io.ImageRecordIter(
   path_imgrec=sys.argv[1], # The target record file.
   preprocess_threads=32,
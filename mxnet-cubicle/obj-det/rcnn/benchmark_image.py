@@ -0,0 +1,86 @@
+import argparse
+import time
+import cv2
+import numpy as np
+
+from rcnn.logger import logger
+from rcnn.io.image import resize_transform, tensor_vstack, BufferPool
+
+
+def legacy_resize_transform(im, target_size, max_size, pixel_means, stride=0):
+    """ float64 resize padding and per-channel transform, as before fused path """
+    im_shape = im.shape
+    im_size_min = np.min(im_shape[0:2])
+    im_size_max = np.max(im_shape[0:2])
+    im_scale = float(target_size) / float(im_size_min)
+    if np.round(im_scale * im_size_max) > max_size:
+        im_scale = float(max_size) / float(im_size_max)
+    im = cv2.resize(im, None, None, fx=im_scale, fy=im_scale, interpolation=cv2.INTER_LINEAR)
+    if stride:
+        im_height = int(np.ceil(im.shape[0] / float(stride)) * stride)
+        im_width = int(np.ceil(im.shape[1] / float(stride)) * stride)
+        padded_im = np.zeros((im_height, im_width, im.shape[2]))
+        padded_im[:im.shape[0], :im.shape[1], :] = im
+        im = padded_im
+    im_tensor = np.zeros((1, 3, im.shape[0], im.shape[1]))
+    for i in range(3):
+        im_tensor[0, i, :, :] = im[:, :, 2 - i] - pixel_means[2 - i]
+    return im_tensor, im_scale
+
+
+def benchmark(func, images, batch_images, repeat):
+    tic = time.time()
+    for _ in range(repeat):
+        for i in range(0, len(images), batch_images):
+            func(images[i:i + batch_images])
+    return (time.time() - tic) / (repeat * len(images)) * 1000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark image transform of rcnn loader')
+    parser.add_argument('--num-images', help='number of synthetic images', default=16, type=int)
+    parser.add_argument('--height', help='synthetic image height', default=600, type=int)
+    parser.add_argument('--width', help='synthetic image width', default=900, type=int)
+    parser.add_argument('--target-size', help='short side after resize', default=800, type=int)
+    parser.add_argument('--max-size', help='max long side after resize', default=1200, type=int)
+    parser.add_argument('--stride', help='pad to stride', default=32, type=int)
+    parser.add_argument('--batch-images', help='images stacked per batch', default=2, type=int)
+    parser.add_argument('--repeat', help='passes over images', default=3, type=int)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    logger.info('Called with argument: %s' % args)
+    rng = np.random.RandomState(0)
+    pixel_means = np.array([103.939, 116.779, 123.68])
+    # jitter sizes so padded batches differ like a real roidb
+    images = [(rng.rand(args.height + rng.randint(-64, 64), args.width + rng.randint(-64, 64), 3) * 255).astype(np.uint8)
+              for _ in range(args.num_images)]
+
+    # check fused path against legacy one
+    for im in images[:2]:
+        ref, ref_scale = legacy_resize_transform(im, args.target_size, args.max_size, pixel_means, args.stride)
+        out, scale = resize_transform(im, args.target_size, args.max_size, pixel_means, args.stride)
+        assert ref_scale == scale and ref.shape == out.shape and np.allclose(ref, out, atol=1e-3), 'fused result differs'
+
+    def legacy(batch):
+        return tensor_vstack([legacy_resize_transform(im, args.target_size, args.max_size, pixel_means, args.stride)[0]
+                              for im in batch])
+
+    pool = BufferPool()
+
+    def fused(batch):
+        return tensor_vstack([resize_transform(im, args.target_size, args.max_size, pixel_means, args.stride,
+                                               pool=pool, key='im_{}'.format(i))[0] for i, im in enumerate(batch)],
+                             pool=pool, key='data')
+
+    legacy_ms = benchmark(legacy, images, args.batch_images, args.repeat)
+    fused_ms = benchmark(fused, images, args.batch_images, args.repeat)
+    logger.info('legacy float64 path: %.2f ms/image' % legacy_ms)
+    logger.info('fused float32 pooled path: %.2f ms/image, %.1fx' % (fused_ms, legacy_ms / fused_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import time
+import numpy as np
+
+from rcnn.logger import logger
+from rcnn.processing.nms import nms, cpu_nms, tiled_nms, batched_nms, soft_nms
+
+
+def synthetic_dets(rng, num_boxes, num_classes=1, im_size=1000):
+    """ boxes jittered around a few objects like detector outputs, with class of each box """
+    centers = rng.rand(max(num_boxes // 20, 1), 2) * im_size
+    ctr = centers[rng.randint(0, len(centers), num_boxes)] + rng.randn(num_boxes, 2) * 15
+    wh = rng.rand(num_boxes, 2) * 150 + 20
+    dets = np.hstack((ctr - wh / 2, ctr + wh / 2, rng.rand(num_boxes, 1))).astype(np.float32)
+    return dets, rng.randint(1, num_classes + 1, num_boxes)
+
+
+def timeit(func, repeat):
+    tic = time.time()
+    for _ in range(repeat):
+        result = func()
+    return (time.time() - tic) / repeat * 1000, result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark nms implementations on synthetic boxes')
+    parser.add_argument('--num-boxes', help='comma separated box numbers', default='300,1000,3000,6000', type=str)
+    parser.add_argument('--num-classes', help='classes of class aware nms', default=20, type=int)
+    parser.add_argument('--threshold', help='nms threshold', default=0.3, type=float)
+    parser.add_argument('--max-keep', help='top k kept of early exit', default=100, type=int)
+    parser.add_argument('--repeat', help='calls timed per implementation', default=5, type=int)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    logger.info('Called with argument: %s' % args)
+    rng = np.random.RandomState(0)
+    thresh = args.threshold
+
+    for num_boxes in [int(n) for n in args.num_boxes.split(',')]:
+        dets, classes = synthetic_dets(rng, num_boxes, args.num_classes)
+        py_ms, py_keep = timeit(lambda: nms(dets, thresh), args.repeat)
+        cy_ms, cy_keep = timeit(lambda: cpu_nms(dets, thresh), args.repeat)
+        tiled_ms, tiled_keep = timeit(lambda: tiled_nms(dets, thresh), args.repeat)
+        topk_ms, topk_keep = timeit(lambda: tiled_nms(dets, thresh, args.max_keep), args.repeat)
+        assert tiled_keep == list(py_keep), 'tiled nms differs from py nms'
+        assert topk_keep == tiled_keep[:args.max_keep], 'top k differs from nms'
+        logger.info('%d boxes, %d kept: py %.2f ms, cython %.2f ms, tiled %.2f ms, tiled top %d %.2f ms' %
+                    (num_boxes, len(py_keep), py_ms, cy_ms, tiled_ms, args.max_keep, topk_ms))
+
+        # class aware nms, one call per class as pred_eval did against one batched call
+        def per_class():
+            keep = []
+            for j in range(1, args.num_classes + 1):
+                indexes = np.where(classes == j)[0]
+                keep.extend(indexes[nms(dets[indexes], thresh)])
+            return keep
+
+        per_class_ms, per_class_keep = timeit(per_class, args.repeat)
+        batched_ms, batched_keep = timeit(lambda: batched_nms(dets, classes, thresh), args.repeat)
+        assert sorted(batched_keep) == sorted(per_class_keep), 'batched nms differs from per class nms'
+        soft_ms, soft_keep = timeit(lambda: soft_nms(dets, thresh, classes=classes)[0], args.repeat)
+        logger.info('%d boxes of %d classes: py per class %.2f ms, batched %.2f ms, soft nms %.2f ms (%d kept)' %
+                    (num_boxes, args.num_classes, per_class_ms, batched_ms, soft_ms, len(soft_keep)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import time
+import mxnet as mx
+import numpy as np
+
+from rcnn.logger import logger
+from rcnn.processing.bbox_transform import bbox_pred, clip_boxes
+from rcnn.processing.generate_anchor import generate_anchors
+from rcnn.processing.nms import cpu_nms_wrapper
+from rcnn.symbol.proposal import ProposalOperator
+
+
+def legacy_proposal(scores, bbox_deltas, im_info, feat_stride, scales, ratios, pre_nms_topN, post_nms_topN,
+                    nms, min_size):
+    """ single image proposal as before batched operator, one image per call """
+    anchors = generate_anchors(base_size=feat_stride, scales=scales, ratios=ratios)
+    num_anchors = anchors.shape[0]
+    scores = scores[:, num_anchors:, :, :]
+    height, width = int(im_info[0] / feat_stride), int(im_info[1] / feat_stride)
+    shift_x, shift_y = np.meshgrid(np.arange(0, width) * feat_stride, np.arange(0, height) * feat_stride)
+    shifts = np.vstack((shift_x.ravel(), shift_y.ravel(), shift_x.ravel(), shift_y.ravel())).transpose()
+    K = shifts.shape[0]
+    anchors = (anchors.reshape((1, num_anchors, 4)) + shifts.reshape((1, K, 4)).transpose((1, 0, 2)))
+    anchors = anchors.reshape((K * num_anchors, 4))
+    bbox_deltas = bbox_deltas[:, :, :height, :width].transpose((0, 2, 3, 1)).reshape((-1, 4))
+    scores = scores[:, :, :height, :width].transpose((0, 2, 3, 1)).reshape((-1, 1))
+    proposals = clip_boxes(bbox_pred(anchors, bbox_deltas), im_info[:2])
+    ws = proposals[:, 2] - proposals[:, 0] + 1
+    hs = proposals[:, 3] - proposals[:, 1] + 1
+    keep = np.where((ws >= min_size * im_info[2]) & (hs >= min_size * im_info[2]))[0]
+    proposals = proposals[keep, :]
+    scores = scores[keep]
+    order = scores.ravel().argsort()[::-1][:pre_nms_topN]
+    proposals = proposals[order, :]
+    scores = scores[order]
+    keep = nms(np.hstack((proposals, scores)).astype(np.float32))[:post_nms_topN]
+    return proposals[keep, :], scores[keep]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark batched proposal operator on cpu')
+    parser.add_argument('--batch-images', help='images per batch', default=4, type=int)
+    parser.add_argument('--height', help='padded image height', default=608, type=int)
+    parser.add_argument('--width', help='padded image width', default=1008, type=int)
+    parser.add_argument('--feat-stride', help='feature map stride', default=16, type=int)
+    parser.add_argument('--pre-nms-top-n', help='proposals before nms', default=6000, type=int)
+    parser.add_argument('--post-nms-top-n', help='proposals after nms', default=300, type=int)
+    parser.add_argument('--threshold', help='nms threshold', default=0.7, type=float)
+    parser.add_argument('--repeat', help='batches timed', default=5, type=int)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parse_args()
+    logger.info('Called with argument: %s' % args)
+    rng = np.random.RandomState(0)
+    scales, ratios = (8, 16, 32), (0.5, 1, 2)
+    num_anchors = len(scales) * len(ratios)
+    n = args.batch_images
+    feat_height, feat_width = args.height // args.feat_stride, args.width // args.feat_stride
+    cls_prob = rng.rand(n, 2 * num_anchors, feat_height, feat_width).astype(np.float32)
+    bbox_deltas = (rng.randn(n, 4 * num_anchors, feat_height, feat_width) * 0.2).astype(np.float32)
+    # images of a padded batch have different real sizes
+    im_info = np.array([[args.height - rng.randint(0, 96), args.width - rng.randint(0, 96), 1.0]
+                        for _ in range(n)], dtype=np.float32)
+
+    op = ProposalOperator(args.feat_stride, str(scales), str(ratios), True, args.pre_nms_top_n,
+                          args.post_nms_top_n, args.threshold, 16)
+    in_data = [mx.nd.array(cls_prob), mx.nd.array(bbox_deltas), mx.nd.array(im_info)]
+    out_data = [mx.nd.zeros((n * args.post_nms_top_n, 5)), mx.nd.zeros((n * args.post_nms_top_n, 1))]
+    nms = cpu_nms_wrapper(args.threshold)
+
+    def legacy():
+        return [legacy_proposal(cls_prob[i:i + 1], bbox_deltas[i:i + 1], im_info[i], args.feat_stride,
+                                np.array(scales), list(ratios), args.pre_nms_top_n, args.post_nms_top_n, nms, 16)
+                for i in range(n)]
+
+    def batched():
+        op.forward(False, ['write', 'write'], in_data, out_data, [])
+
+    # check batched operator against legacy one, rois without padding must match
+    batched()
+    rois = out_data[0].asnumpy()
+    for i, (proposals, _) in enumerate(legacy()):
+        rois_i = rois[i * args.post_nms_top_n:(i + 1) * args.post_nms_top_n]
+        assert np.all(rois_i[:, 0] == i), 'wrong batch index'
+        # nms may order proposals of equal score differently
+        rois_i = np.sort(rois_i[:len(proposals), 1:].view('f4,f4,f4,f4'), axis=0).view(np.float32)
+        proposals = np.sort(proposals.astype(np.float32).view('f4,f4,f4,f4'), axis=0).view(np.float32)
+        assert np.allclose(rois_i, proposals, atol=1e-3), 'batched result differs'
+
+    timings = []
+    for func in (legacy, batched):
+        tic = time.time()
+        for _ in range(args.repeat):
+            func()
+        timings.append((time.time() - tic) / args.repeat * 1000)
+    logger.info('legacy per image proposal: %.2f ms/batch' % timings[0])
+    logger.info('batched proposal: %.2f ms/batch, %.1fx' % (timings[1], timings[0] / timings[1]))
+
+
+if __name__ == '__main__':
+    main()
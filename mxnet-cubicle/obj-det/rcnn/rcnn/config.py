@@ -69,6 +69,8 @@ config.TRAIN.RPN_CLOBBER_POSITIVES = False
 # rpn bounding box regression params
 config.TRAIN.RPN_BBOX_WEIGHTS = (1.0, 1.0, 1.0, 1.0)
 config.TRAIN.RPN_POSITIVE_WEIGHT = -1.0
+# worker processes preparing anchor loader batches ahead, 0 to load in training thread
+config.TRAIN.PREFETCH_WORKERS = 4
 
 # used for end2end training
 # RPN proposal
@@ -105,6 +107,10 @@ config.TEST.PROPOSAL_MIN_SIZE = config.RPN_FEAT_STRIDE
 
 # RCNN nms
 config.TEST.NMS = 0.3
+# decay scores of overlapping detections instead of removing them
+config.TEST.SOFT_NMS = False
+config.TEST.SOFT_NMS_METHOD = 'linear'
+config.TEST.SOFT_NMS_SIGMA = 0.5
 
 # default settings
 default = edict()
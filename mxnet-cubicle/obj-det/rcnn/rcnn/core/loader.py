@@ -15,12 +15,14 @@
 # specific language governing permissions and limitations
 # under the License.
 
+import collections
+import multiprocessing
 import mxnet as mx
 import numpy as np
 from mxnet.executor_manager import _split_input_slice
 
 from rcnn.config import config
-from rcnn.io.image import tensor_vstack
+from rcnn.io.image import tensor_vstack, BufferPool
 from rcnn.io.rpn import get_rpn_testbatch, get_rpn_batch, assign_anchor
 from rcnn.io.rcnn import get_rcnn_testbatch, get_rcnn_batch
 
@@ -237,6 +239,98 @@ class ROIIter(mx.io.DataIter):
         self.label = [mx.nd.array(all_label[name]) for name in self.label_name]
 
 
+class AnchorBatcher(object):
+    def __init__(self, feat_sym, data_name, label_name, feat_stride=16, anchor_scales=(8, 16, 32),
+                 anchor_ratios=(0.5, 1, 2), allowed_border=0):
+        """
+        Build numpy data and label of one AnchorLoader batch, picklable to run in loader workers
+        :param feat_sym: to infer shape of assign_output, memoized per padded data shape
+        :param data_name: names of data to provide
+        :param label_name: names of label to provide
+        :return: AnchorBatcher
+        """
+        self.feat_sym = feat_sym
+        self.data_name = data_name
+        self.label_name = label_name
+        self.feat_stride = feat_stride
+        self.anchor_scales = anchor_scales
+        self.anchor_ratios = anchor_ratios
+        self.allowed_border = allowed_border
+        self.feat_shapes = dict()
+        # image tensors are copied out by mx.nd.array or pickling before the next batch
+        self.pool = BufferPool()
+
+    def feat_shape(self, data_shape):
+        key = tuple(sorted(data_shape.items()))
+        if key not in self.feat_shapes:
+            _, feat_shape, _ = self.feat_sym.infer_shape(**data_shape)
+            self.feat_shapes[key] = [int(i) for i in feat_shape[0]]
+        return self.feat_shapes[key]
+
+    def __call__(self, roidb_slices):
+        """
+        :param roidb_slices: roidb of each device
+        :return: dict of data, dict of label
+        """
+        # get testing data for multigpu
+        data_list = []
+        label_list = []
+        for dev, iroidb in enumerate(roidb_slices):
+            data, label = get_rpn_batch(iroidb, self.pool, 'im_{}'.format(dev))
+            data_list.append(data)
+            label_list.append(label)
+
+        # pad data first and then assign anchor (read label)
+        data_tensor = tensor_vstack([batch['data'] for batch in data_list], pool=self.pool, key='data_pad')
+        for data, data_pad in zip(data_list, data_tensor):
+            data['data'] = data_pad[np.newaxis, :]
+
+        new_label_list = []
+        for data, label in zip(data_list, label_list):
+            # infer label shape
+            data_shape = {k: v.shape for k, v in data.items()}
+            del data_shape['im_info']
+            feat_shape = self.feat_shape(data_shape)
+
+            # add gt_boxes to data for e2e
+            data['gt_boxes'] = label['gt_boxes'][np.newaxis, :, :]
+
+            # assign anchor for label
+            label = assign_anchor(feat_shape, label['gt_boxes'], data['im_info'],
+                                  self.feat_stride, self.anchor_scales,
+                                  self.anchor_ratios, self.allowed_border)
+            new_label_list.append(label)
+
+        all_data = dict()
+        for key in self.data_name:
+            all_data[key] = tensor_vstack([batch[key] for batch in data_list],
+                                          pool=self.pool if key == 'data' else None, key=key)
+
+        all_label = dict()
+        for key in self.label_name:
+            pad = -1 if key == 'label' else 0
+            all_label[key] = tensor_vstack([batch[key] for batch in new_label_list], pad=pad)
+        return all_data, all_label
+
+
+# batcher of each loader worker process, and epoch shared with loader
+_worker_batcher = None
+_worker_epoch = None
+
+
+def _init_anchor_worker(batcher, epoch):
+    global _worker_batcher, _worker_epoch
+    _worker_batcher = batcher
+    _worker_epoch = epoch
+
+
+def _anchor_worker(epoch, roidb_slices):
+    # batch of an epoch already reset, skip it instead of delaying batches of new epoch
+    if epoch != _worker_epoch.value:
+        return None
+    return _worker_batcher(roidb_slices)
+
+
 class AnchorLoader(mx.io.DataIter):
     def __init__(self, feat_sym, roidb, batch_size=1, shuffle=False, ctx=None, work_load_list=None,
                  feat_stride=16, anchor_scales=(8, 16, 32), anchor_ratios=(0.5, 1, 2), allowed_border=0,
@@ -279,6 +373,8 @@ class AnchorLoader(mx.io.DataIter):
         else:
             self.data_name = ['data']
         self.label_name = ['label', 'bbox_target', 'bbox_weight']
+        self.batcher = AnchorBatcher(feat_sym, self.data_name, self.label_name, feat_stride,
+                                     anchor_scales, anchor_ratios, allowed_border)
 
         # status variable for synchronization between get_data and get_label
         self.cur = 0
@@ -355,9 +451,9 @@ class AnchorLoader(mx.io.DataIter):
         label_shape = [(k, tuple([input_batch_size] + list(v.shape[1:]))) for k, v in zip(self.label_name, label)]
         return max_data_shape, label_shape
 
-    def get_batch(self):
+    def slice_roidb(self, cur_from):
+        """ Return roidb of each device for batch starting at cur_from """
         # slice roidb
-        cur_from = self.cur
         cur_to = min(cur_from + self.batch_size, self.size)
         roidb = [self.roidb[self.index[i]] for i in range(cur_from, cur_to)]
 
@@ -369,46 +465,76 @@ class AnchorLoader(mx.io.DataIter):
         assert isinstance(work_load_list, list) and len(work_load_list) == len(ctx), \
             "Invalid settings for work load. "
         slices = _split_input_slice(self.batch_size, work_load_list)
+        return [[roidb[i] for i in range(islice.start, islice.stop)] for islice in slices]
 
-        # get testing data for multigpu
-        data_list = []
-        label_list = []
-        for islice in slices:
-            iroidb = [roidb[i] for i in range(islice.start, islice.stop)]
-            data, label = get_rpn_batch(iroidb)
-            data_list.append(data)
-            label_list.append(label)
-
-        # pad data first and then assign anchor (read label)
-        data_tensor = tensor_vstack([batch['data'] for batch in data_list])
-        for data, data_pad in zip(data_list, data_tensor):
-            data['data'] = data_pad[np.newaxis, :]
-
-        new_label_list = []
-        for data, label in zip(data_list, label_list):
-            # infer label shape
-            data_shape = {k: v.shape for k, v in data.items()}
-            del data_shape['im_info']
-            _, feat_shape, _ = self.feat_sym.infer_shape(**data_shape)
-            feat_shape = [int(i) for i in feat_shape[0]]
+    def get_batch(self):
+        all_data, all_label = self.batcher(self.slice_roidb(self.cur))
+        self.data = [mx.nd.array(all_data[key]) for key in self.data_name]
+        self.label = [mx.nd.array(all_label[key]) for key in self.label_name]
 
-            # add gt_boxes to data for e2e
-            data['gt_boxes'] = label['gt_boxes'][np.newaxis, :, :]
+    def close(self):
+        """ Release loader resources, nothing held without worker processes """
+        pass
 
-            # assign anchor for label
-            label = assign_anchor(feat_shape, label['gt_boxes'], data['im_info'],
-                                  self.feat_stride, self.anchor_scales,
-                                  self.anchor_ratios, self.allowed_border)
-            new_label_list.append(label)
 
-        all_data = dict()
-        for key in self.data_name:
-            all_data[key] = tensor_vstack([batch[key] for batch in data_list])
+class PrefetchAnchorLoader(AnchorLoader):
+    def __init__(self, feat_sym, roidb, batch_size=1, shuffle=False, ctx=None, work_load_list=None,
+                 feat_stride=16, anchor_scales=(8, 16, 32), anchor_ratios=(0.5, 1, 2), allowed_border=0,
+                 aspect_grouping=False, num_workers=4, prefetch=None):
+        """
+        AnchorLoader preparing batches ahead in worker processes, image reading, resizing,
+        transform and anchor assignment all run off the training thread
+        :param num_workers: number of worker processes
+        :param prefetch: number of batches in flight, 2 * num_workers by default
+        :return: PrefetchAnchorLoader
+        """
+        self.num_workers = num_workers
+        self.prefetch = prefetch or 2 * num_workers
+        self.pending = collections.deque()
+        self.pool = None
+        # bumped by reset, tasks of previous epochs are skipped by workers
+        self.epoch = multiprocessing.Value('i', 0)
+        super(PrefetchAnchorLoader, self).__init__(feat_sym, roidb, batch_size, shuffle, ctx, work_load_list,
+                                                   feat_stride, anchor_scales, anchor_ratios, allowed_border,
+                                                   aspect_grouping)
+        # each worker gets a copy of batcher, with infer_shape result of the first batch
+        self.pool = multiprocessing.Pool(self.num_workers, initializer=_init_anchor_worker,
+                                         initargs=(self.batcher, self.epoch))
 
-        all_label = dict()
-        for key in self.label_name:
-            pad = -1 if key == 'label' else 0
-            all_label[key] = tensor_vstack([batch[key] for batch in new_label_list], pad=pad)
+    def reset(self):
+        # batches of last epoch still in flight are dropped, workers return at once
+        # for those not started yet, so they only delay new epoch by batches being built
+        with self.epoch.get_lock():
+            self.epoch.value += 1
+        self.pending.clear()
+        super(PrefetchAnchorLoader, self).reset()
+
+    def prefetch_batches(self):
+        """ Keep batches after current one in flight """
+        if self.pending:
+            cur_next = self.pending[-1][0] + self.batch_size
+        else:
+            cur_next = self.cur
+        while len(self.pending) < self.prefetch and cur_next + self.batch_size <= self.size:
+            result = self.pool.apply_async(_anchor_worker, (self.epoch.value, self.slice_roidb(cur_next)))
+            self.pending.append((cur_next, result))
+            cur_next += self.batch_size
 
+    def get_batch(self):
+        if self.pool is None:
+            # first batch to fill in provide_data and provide_label
+            return super(PrefetchAnchorLoader, self).get_batch()
+        self.prefetch_batches()
+        cur_from, result = self.pending.popleft()
+        assert cur_from == self.cur, 'prefetched batch {} is not current batch {}'.format(cur_from, self.cur)
+        all_data, all_label = result.get()
+        self.prefetch_batches()
         self.data = [mx.nd.array(all_data[key]) for key in self.data_name]
         self.label = [mx.nd.array(all_label[key]) for key in self.label_name]
+
+    def close(self):
+        """ Terminate worker processes, loader falls back to building batches in place """
+        self.pending.clear()
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
@@ -30,7 +30,7 @@ from rcnn.logger import logger
 from rcnn.config import config
 from rcnn.io import image
 from rcnn.processing.bbox_transform import bbox_pred, clip_boxes
-from rcnn.processing.nms import py_nms_wrapper, cpu_nms_wrapper, gpu_nms_wrapper
+from rcnn.processing.nms import batched_nms, soft_nms
 
 
 class Predictor(object):
@@ -163,8 +163,6 @@ def pred_eval(predictor, test_data, imdb, vis=False, thresh=1e-3):
     assert vis or not test_data.shuffle
     data_names = [k[0] for k in test_data.provide_data]
 
-    nms = py_nms_wrapper(config.TEST.NMS)
-
     # limit detections to max_per_image over all classes
     max_per_image = -1
 
@@ -187,22 +185,24 @@ def pred_eval(predictor, test_data, imdb, vis=False, thresh=1e-3):
         t2 = time.time() - t
         t = time.time()
 
+        # nms of all classes in one call, kept boxes are ordered by score
+        # so that max_per_image is an early exit
+        indexes, classes = np.where(scores[:, 1:] > thresh)
+        classes += 1
+        dets = np.hstack((boxes.reshape((len(boxes), -1, 4))[indexes, classes],
+                          scores[indexes, classes, np.newaxis])).astype(np.float32)
+        max_keep = max(max_per_image, 0)
+        if config.TEST.SOFT_NMS:
+            keep, keep_scores = soft_nms(dets, config.TEST.NMS, config.TEST.SOFT_NMS_SIGMA,
+                                         thresh, config.TEST.SOFT_NMS_METHOD, max_keep, classes)
+            dets = dets[keep, :]
+            dets[:, 4] = keep_scores
+        else:
+            keep = batched_nms(dets, classes, config.TEST.NMS, max_keep)
+            dets = dets[keep, :]
+        classes = classes[keep]
         for j in range(1, imdb.num_classes):
-            indexes = np.where(scores[:, j] > thresh)[0]
-            cls_scores = scores[indexes, j, np.newaxis]
-            cls_boxes = boxes[indexes, j * 4:(j + 1) * 4]
-            cls_dets = np.hstack((cls_boxes, cls_scores))
-            keep = nms(cls_dets)
-            all_boxes[j][i] = cls_dets[keep, :]
-
-        if max_per_image > 0:
-            image_scores = np.hstack([all_boxes[j][i][:, -1]
-                                      for j in range(1, imdb.num_classes)])
-            if len(image_scores) > max_per_image:
-                image_thresh = np.sort(image_scores)[-max_per_image]
-                for j in range(1, imdb.num_classes):
-                    keep = np.where(all_boxes[j][i][:, -1] >= image_thresh)[0]
-                    all_boxes[j][i] = all_boxes[j][i][keep, :]
+            all_boxes[j][i] = dets[classes == j, :]
 
         if vis:
             boxes_this_image = [[]] + [all_boxes[j][i] for j in range(1, imdb.num_classes)]
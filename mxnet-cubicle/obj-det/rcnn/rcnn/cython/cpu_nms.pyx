@@ -8,10 +8,10 @@
 import numpy as np
 cimport numpy as np
 
-cdef inline np.float32_t max(np.float32_t a, np.float32_t b):
+cdef inline np.float32_t max(np.float32_t a, np.float32_t b) nogil:
     return a if a >= b else b
 
-cdef inline np.float32_t min(np.float32_t a, np.float32_t b):
+cdef inline np.float32_t min(np.float32_t a, np.float32_t b) nogil:
     return a if a <= b else b
 
 def cpu_nms(np.ndarray[np.float32_t, ndim=2] dets, np.float thresh):
@@ -28,6 +28,11 @@ def cpu_nms(np.ndarray[np.float32_t, ndim=2] dets, np.float thresh):
     cdef np.ndarray[np.int_t, ndim=1] suppressed = \
             np.zeros((ndets), dtype=np.int)
 
+    cdef np.ndarray[np.int_t, ndim=1] keep = \
+            np.zeros((ndets), dtype=np.int)
+    cdef int nkeep = 0
+    cdef np.float32_t cthresh = thresh
+
     # nominal indices
     cdef int _i, _j
     # sorted indices
@@ -39,30 +44,32 @@ def cpu_nms(np.ndarray[np.float32_t, ndim=2] dets, np.float thresh):
     cdef np.float32_t w, h
     cdef np.float32_t inter, ovr
 
-    keep = []
-    for _i in range(ndets):
-        i = order[_i]
-        if suppressed[i] == 1:
-            continue
-        keep.append(i)
-        ix1 = x1[i]
-        iy1 = y1[i]
-        ix2 = x2[i]
-        iy2 = y2[i]
-        iarea = areas[i]
-        for _j in range(_i + 1, ndets):
-            j = order[_j]
-            if suppressed[j] == 1:
+    # GIL released, nms of several images could run in threads
+    with nogil:
+        for _i in range(ndets):
+            i = order[_i]
+            if suppressed[i] == 1:
                 continue
-            xx1 = max(ix1, x1[j])
-            yy1 = max(iy1, y1[j])
-            xx2 = min(ix2, x2[j])
-            yy2 = min(iy2, y2[j])
-            w = max(0.0, xx2 - xx1 + 1)
-            h = max(0.0, yy2 - yy1 + 1)
-            inter = w * h
-            ovr = inter / (iarea + areas[j] - inter)
-            if ovr >= thresh:
-                suppressed[j] = 1
+            keep[nkeep] = i
+            nkeep += 1
+            ix1 = x1[i]
+            iy1 = y1[i]
+            ix2 = x2[i]
+            iy2 = y2[i]
+            iarea = areas[i]
+            for _j in range(_i + 1, ndets):
+                j = order[_j]
+                if suppressed[j] == 1:
+                    continue
+                xx1 = max(ix1, x1[j])
+                yy1 = max(iy1, y1[j])
+                xx2 = min(ix2, x2[j])
+                yy2 = min(iy2, y2[j])
+                w = max(0.0, xx2 - xx1 + 1)
+                h = max(0.0, yy2 - yy1 + 1)
+                inter = w * h
+                ovr = inter / (iarea + areas[j] - inter)
+                if ovr >= cthresh:
+                    suppressed[j] = 1
 
-    return keep
+    return keep[:nkeep].tolist()
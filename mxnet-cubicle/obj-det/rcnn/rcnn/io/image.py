@@ -22,10 +22,34 @@ import random
 from ..config import config
 
 
-def get_image(roidb):
+class BufferPool(object):
+    """
+    preallocated arrays reused across batches, grown when a larger shape is asked
+    an array got from pool is only valid until the next get of the same key
+    """
+    def __init__(self):
+        self.buffers = dict()
+
+    def get(self, key, shape, dtype=np.float32):
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+        buf = self.buffers.get(key)
+        if buf is None or buf.dtype != dtype or buf.size < size:
+            buf = np.empty(size, dtype=dtype)
+            self.buffers[key] = buf
+        return buf[:size].reshape(shape)
+
+    def __getstate__(self):
+        # buffers are not sent to worker processes
+        return {'buffers': dict()}
+
+
+def get_image(roidb, pool=None, key='im'):
     """
     preprocess image and return processed roidb
     :param roidb: a list of roidb
+    :param pool: BufferPool to write image tensors into, tensors are overwritten by next call
+    :param key: prefix of pool keys, callers sharing one pool should differ
     :return: list of img as in mxnet format
     roidb add new item['im_info']
     0 --- x (width, second dim of im)
@@ -48,8 +72,8 @@ def get_image(roidb):
         # max_size = config.SCALES[scale_ind][1]
         # # choose a fixed scale
         target_size, max_size = 800, 1200
-        im, im_scale = resize(im, target_size, max_size, stride=config.IMAGE_STRIDE)
-        im_tensor = transform(im, config.PIXEL_MEANS)
+        im_tensor, im_scale = resize_transform(im, target_size, max_size, config.PIXEL_MEANS,
+                                               stride=config.IMAGE_STRIDE, pool=pool, key='{}_{}'.format(key, i))
         processed_ims.append(im_tensor)
         im_info = [im_tensor.shape[2], im_tensor.shape[3], im_scale]
         new_rec['boxes'] = roi_rec['boxes'].copy() * im_scale
@@ -83,11 +107,48 @@ def resize(im, target_size, max_size, stride=0):
         im_height = int(np.ceil(im.shape[0] / float(stride)) * stride)
         im_width = int(np.ceil(im.shape[1] / float(stride)) * stride)
         im_channel = im.shape[2]
-        padded_im = np.zeros((im_height, im_width, im_channel))
+        padded_im = np.zeros((im_height, im_width, im_channel), dtype=im.dtype)
         padded_im[:im.shape[0], :im.shape[1], :] = im
         return padded_im, im_scale
 
 
+def resize_transform(im, target_size, max_size, pixel_means, stride=0, pool=None, key='im'):
+    """
+    fused resize and transform, resize in uint8, then pad and subtract means while writing
+    float32 tensor, same as transform(*resize(im, target_size, max_size, stride)) without temporaries
+    :param im: BGR image input by opencv
+    :param pixel_means: [B, G, R pixel means]
+    :param stride: if given, pad the image to designated stride
+    :param pool: BufferPool to get output tensor from, a new one is allocated if not given
+    :param key: pool key of output tensor
+    :return: [1, channel, height, width] tensor, scale
+    """
+    im, im_scale = resize(im, target_size, max_size)
+    height, width = im.shape[:2]
+    if stride == 0:
+        im_height, im_width = height, width
+    else:
+        im_height = int(np.ceil(height / float(stride)) * stride)
+        im_width = int(np.ceil(width / float(stride)) * stride)
+    shape = (1, 3, im_height, im_width)
+    im_tensor = pool.get(key, shape) if pool is not None else np.empty(shape, dtype=np.float32)
+    # padding is zero before subtracting means
+    for i in range(3):
+        im_tensor[0, i, height:, :] = -pixel_means[2 - i]
+        im_tensor[0, i, :height, width:] = -pixel_means[2 - i]
+    _subtract_means(im, pixel_means, im_tensor[0, :, :height, :width])
+    return im_tensor, im_scale
+
+
+def _subtract_means(im, pixel_means, out):
+    """
+    write im [height, width, BGR] minus means into out [RGB, height, width],
+    channels are split to contiguous planes first, faster than a strided transpose
+    """
+    for i, plane in enumerate(cv2.split(im)[::-1]):
+        np.subtract(plane, np.float32(pixel_means[2 - i]), out=out[i], casting='unsafe')
+
+
 def transform(im, pixel_means):
     """
     transform into mxnet tensor,
@@ -96,9 +157,8 @@ def transform(im, pixel_means):
     :param pixel_means: [B, G, R pixel means]
     :return: [batch, channel, height, width]
     """
-    im_tensor = np.zeros((1, 3, im.shape[0], im.shape[1]))
-    for i in range(3):
-        im_tensor[0, i, :, :] = im[:, :, 2 - i] - pixel_means[2 - i]
+    im_tensor = np.empty((1, 3, im.shape[0], im.shape[1]), dtype=np.float32)
+    _subtract_means(im, pixel_means, im_tensor[0])
     return im_tensor
 
 
@@ -122,11 +182,13 @@ def transform_inverse(im_tensor, pixel_means):
     return im
 
 
-def tensor_vstack(tensor_list, pad=0):
+def tensor_vstack(tensor_list, pad=0, pool=None, key='vstack'):
     """
     vertically stack tensors
     :param tensor_list: list of tensor to be stacked vertically
     :param pad: label to pad with
+    :param pool: BufferPool to get stacked tensor from, a new one is allocated if not given
+    :param key: pool key of stacked tensor
     :return: tensor with max shape
     """
     ndim = len(tensor_list[0].shape)
@@ -137,7 +199,10 @@ def tensor_vstack(tensor_list, pad=0):
     dimensions.append(first_dim)
     for dim in range(1, ndim):
         dimensions.append(max([tensor.shape[dim] for tensor in tensor_list]))
-    if pad == 0:
+    if pool is not None:
+        all_tensor = pool.get(key, tuple(dimensions), dtype)
+        all_tensor.fill(pad)
+    elif pad == 0:
         all_tensor = np.zeros(tuple(dimensions), dtype=dtype)
     elif pad == 1:
         all_tensor = np.ones(tuple(dimensions), dtype=dtype)
@@ -34,7 +34,7 @@ import numpy.random as npr
 from ..logger import logger
 from ..config import config
 from .image import get_image, tensor_vstack
-from ..processing.generate_anchor import generate_anchors
+from ..processing.anchor_cache import get_anchor_grid, get_inside_inds
 from ..processing.bbox_transform import bbox_overlaps, bbox_transform
 
 
@@ -56,14 +56,16 @@ def get_rpn_testbatch(roidb):
     return data, label, im_info
 
 
-def get_rpn_batch(roidb):
+def get_rpn_batch(roidb, pool=None, key='im'):
     """
     prototype for rpn batch: data, im_info, gt_boxes
     :param roidb: ['image', 'flipped'] + ['gt_boxes', 'boxes', 'gt_classes']
+    :param pool: BufferPool to write image tensor into, see get_image
+    :param key: prefix of pool keys
     :return: data, label
     """
     assert len(roidb) == 1, 'Single batch only'
-    imgs, roidb = get_image(roidb)
+    imgs, roidb = get_image(roidb, pool, key)
     im_array = imgs[0]
     im_info = np.array([roidb[0]['im_info']], dtype=np.float32)
 
@@ -113,10 +115,9 @@ def assign_anchor(feat_shape, gt_boxes, im_info, feat_stride=16,
         return ret
 
     im_info = im_info[0]
-    scales = np.array(scales, dtype=np.float32)
-    base_anchors = generate_anchors(base_size=feat_stride, ratios=list(ratios), scales=scales)
-    num_anchors = base_anchors.shape[0]
     feat_height, feat_width = feat_shape[-2:]
+    base_anchors, all_anchors = get_anchor_grid(feat_height, feat_width, feat_stride, scales, ratios)
+    num_anchors = base_anchors.shape[0]
 
     logger.debug('anchors: %s' % base_anchors)
     logger.debug('anchor shapes: %s' % np.hstack((base_anchors[:, 2::4] - base_anchors[:, 0::4],
@@ -127,25 +128,12 @@ def assign_anchor(feat_shape, gt_boxes, im_info, feat_stride=16,
     logger.debug('gt_boxes %s' % gt_boxes)
 
     # 1. generate proposals from bbox deltas and shifted anchors
-    shift_x = np.arange(0, feat_width) * feat_stride
-    shift_y = np.arange(0, feat_height) * feat_stride
-    shift_x, shift_y = np.meshgrid(shift_x, shift_y)
-    shifts = np.vstack((shift_x.ravel(), shift_y.ravel(), shift_x.ravel(), shift_y.ravel())).transpose()
-    # add A anchors (1, A, 4) to
-    # cell K shifts (K, 1, 4) to get
-    # shift anchors (K, A, 4)
-    # reshape to (K*A, 4) shifted anchors
     A = num_anchors
-    K = shifts.shape[0]
-    all_anchors = base_anchors.reshape((1, A, 4)) + shifts.reshape((1, K, 4)).transpose((1, 0, 2))
-    all_anchors = all_anchors.reshape((K * A, 4))
-    total_anchors = int(K * A)
+    total_anchors = int(all_anchors.shape[0])
 
     # only keep anchors inside the image
-    inds_inside = np.where((all_anchors[:, 0] >= -allowed_border) &
-                           (all_anchors[:, 1] >= -allowed_border) &
-                           (all_anchors[:, 2] < im_info[1] + allowed_border) &
-                           (all_anchors[:, 3] < im_info[0] + allowed_border))[0]
+    inds_inside = get_inside_inds(feat_height, feat_width, im_info[0], im_info[1],
+                                  feat_stride, scales, ratios, allowed_border)
     logger.debug('total_anchors %d' % total_anchors)
     logger.debug('inds_inside %d' % len(inds_inside))
 
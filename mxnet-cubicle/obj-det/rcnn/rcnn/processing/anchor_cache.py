@@ -0,0 +1,108 @@
+"""
+Cache of shifted anchor grids shared by anchor assignment and proposal layer.
+A grid only depends on (feat_height, feat_width, feat_stride, scales, ratios), and the anchors
+inside image additionally on im_info, so both are computed once and returned read-only.
+"""
+
+import collections
+import threading
+import numpy as np
+
+from .generate_anchor import generate_anchors
+
+# padded batches and image sizes only yield a limited number of keys
+MAX_GRIDS = 64
+MAX_INSIDE = 512
+
+
+class LRUCache(object):
+    def __init__(self, capacity):
+        """
+        Thread-safe least recently used cache, proposal operators of devices run in different threads
+        :param capacity: max number of items kept
+        """
+        self.capacity = capacity
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, create):
+        """ Return cached item of key, call create() and cache its result if missing """
+        with self.lock:
+            if key in self.items:
+                value = self.items.pop(key)
+                self.items[key] = value
+                return value
+            value = create()
+            self.items[key] = value
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+
+_grids = LRUCache(MAX_GRIDS)
+_inside = LRUCache(MAX_INSIDE)
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+def _grid_key(feat_height, feat_width, feat_stride, scales, ratios):
+    return (int(feat_height), int(feat_width), int(feat_stride),
+            tuple(float(s) for s in scales), tuple(float(r) for r in ratios))
+
+
+def get_anchor_grid(feat_height, feat_width, feat_stride=16, scales=(8, 16, 32), ratios=(0.5, 1, 2)):
+    """
+    base anchors and shifted anchors of a feature map
+    :return: (A, 4) base anchors, (K*A, 4) shifted anchors ordered by (h, w, a), both read-only
+    """
+    key = _grid_key(feat_height, feat_width, feat_stride, scales, ratios)
+
+    def create():
+        base_anchors = generate_anchors(base_size=key[2], ratios=list(key[4]), scales=np.array(key[3]))
+        shift_x = np.arange(0, key[1]) * key[2]
+        shift_y = np.arange(0, key[0]) * key[2]
+        shift_x, shift_y = np.meshgrid(shift_x, shift_y)
+        shifts = np.vstack((shift_x.ravel(), shift_y.ravel(), shift_x.ravel(), shift_y.ravel())).transpose()
+        # add A anchors (1, A, 4) to
+        # cell K shifts (K, 1, 4) to get
+        # shift anchors (K, A, 4)
+        # reshape to (K*A, 4) shifted anchors
+        A = base_anchors.shape[0]
+        K = shifts.shape[0]
+        all_anchors = base_anchors.reshape((1, A, 4)) + shifts.reshape((1, K, 4)).transpose((1, 0, 2))
+        return _readonly(base_anchors), _readonly(all_anchors.reshape((K * A, 4)))
+    return _grids.get(key, create)
+
+
+def get_inside_inds(feat_height, feat_width, im_height, im_width, feat_stride=16, scales=(8, 16, 32),
+                    ratios=(0.5, 1, 2), allowed_border=0):
+    """
+    indices of shifted anchors inside image, with edge overlap <= allowed_border
+    :return: read-only indices into get_anchor_grid anchors
+    """
+    key = _grid_key(feat_height, feat_width, feat_stride, scales, ratios) + \
+        (float(im_height), float(im_width), allowed_border)
+
+    def create():
+        _, all_anchors = get_anchor_grid(feat_height, feat_width, feat_stride, scales, ratios)
+        inds_inside = np.where((all_anchors[:, 0] >= -allowed_border) &
+                               (all_anchors[:, 1] >= -allowed_border) &
+                               (all_anchors[:, 2] < im_width + allowed_border) &
+                               (all_anchors[:, 3] < im_height + allowed_border))[0]
+        return _readonly(inds_inside)
+    return _inside.get(key, create)
+
+
+def clear():
+    _grids.clear()
+    _inside.clear()
@@ -79,3 +79,158 @@ def nms(dets, thresh):
         order = order[inds + 1]
 
     return keep
+
+
+def _pair_iou(boxes, query_boxes):
+    """ overlaps of boxes[i] and query_boxes[i] """
+    w = np.maximum(0.0, np.minimum(boxes[:, 2], query_boxes[:, 2]) - np.maximum(boxes[:, 0], query_boxes[:, 0]) + 1)
+    h = np.maximum(0.0, np.minimum(boxes[:, 3], query_boxes[:, 3]) - np.maximum(boxes[:, 1], query_boxes[:, 1]) + 1)
+    inter = w * h
+    areas = (boxes[:, 2] - boxes[:, 0] + 1) * (boxes[:, 3] - boxes[:, 1] + 1)
+    query_areas = (query_boxes[:, 2] - query_boxes[:, 0] + 1) * (query_boxes[:, 3] - query_boxes[:, 1] + 1)
+    return inter / (areas + query_areas - inter)
+
+
+def overlap_pairs(boxes, query_boxes, thresh):
+    """
+    pairs of boxes overlapping more than thresh, only pairs overlapping along x are computed,
+    found by sorting query boxes by x1, so that far apart boxes cost nothing
+    :param boxes: [N, 4+] array of x1, y1, x2, y2
+    :param query_boxes: [K, 4+] array of x1, y1, x2, y2
+    :return: indexes into boxes, indexes into query_boxes
+    """
+    if len(boxes) == 0 or len(query_boxes) == 0:
+        return np.zeros((0,), dtype=np.int64), np.zeros((0,), dtype=np.int64)
+    order = query_boxes[:, 0].argsort(kind='mergesort')
+    query_x1 = query_boxes[order, 0]
+    max_width = max((query_boxes[:, 2] - query_boxes[:, 0]).max(), 0)
+    # candidates of box i are sorted query boxes lo[i]:hi[i], widths count the +1 pixel
+    lo = np.searchsorted(query_x1, boxes[:, 0] - max_width - 1, 'right')
+    hi = np.searchsorted(query_x1, boxes[:, 2] + 1, 'left')
+    counts = np.maximum(hi - lo, 0)
+    inds = np.repeat(np.arange(len(boxes)), counts)
+    query_inds = order[np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - lo, counts)]
+
+    # inter / (area + query_area - inter) > thresh without division
+    x1, y1, x2, y2 = [np.ascontiguousarray(boxes[:, i]) for i in range(4)]
+    qx1, qy1, qx2, qy2 = [np.ascontiguousarray(query_boxes[:, i]) for i in range(4)]
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1) * thresh
+    query_areas = (qx2 - qx1 + 1) * (qy2 - qy1 + 1) * thresh
+    w = np.minimum(x2[inds], qx2[query_inds]) - np.maximum(x1[inds], qx1[query_inds]) + 1
+    h = np.minimum(y2[inds], qy2[query_inds]) - np.maximum(y1[inds], qy1[query_inds]) + 1
+    inter = np.maximum(w, 0) * np.maximum(h, 0)
+    overlap = inter * (1 + thresh) > areas[inds] + query_areas[query_inds]
+    return inds[overlap], query_inds[overlap]
+
+
+def tiled_nms(dets, thresh, max_keep=0, tile=128):
+    """
+    same result as nms without a loop per box, boxes are taken by tiles in score order and
+    checked against boxes kept from previous tiles and against each other
+    :param dets: [[x1, y1, x2, y2 score]]
+    :param thresh: retain overlap <= thresh
+    :param max_keep: stop once max_keep boxes are kept, 0 for all
+    :param tile: boxes per tile
+    :return: indexes to keep
+    """
+    # stable sort reversed, equal scores are ordered as argsort()[::-1] would
+    order = dets[:, 4].argsort(kind='mergesort')[::-1]
+    boxes = dets[order, :4]
+
+    keep = np.zeros((0,), dtype=np.int64)
+    for start in range(0, len(order), tile):
+        tile_boxes = boxes[start:start + tile]
+        alive = np.ones((len(tile_boxes),), dtype=bool)
+        alive[overlap_pairs(boxes[keep], tile_boxes, thresh)[1]] = False
+        # boxes only suppress lower scored ones
+        inds, query_inds = overlap_pairs(tile_boxes, tile_boxes, thresh)
+        lower = inds < query_inds
+        inds, query_inds = inds[lower], query_inds[lower]
+        # a box is kept if no kept box suppresses it, iterate from all kept until nothing changes,
+        # the greedy result is reached in as many rounds as the longest chain of suppression
+        tile_keep = alive
+        while True:
+            next_keep = alive.copy()
+            next_keep[query_inds[tile_keep[inds]]] = False
+            if np.array_equal(next_keep, tile_keep):
+                break
+            tile_keep = next_keep
+        keep = np.hstack((keep, start + np.where(tile_keep)[0]))
+        if 0 < max_keep <= len(keep):
+            keep = keep[:max_keep]
+            break
+
+    return order[keep].tolist()
+
+
+def _offset_boxes(dets, classes):
+    """ shift boxes of each class apart so that boxes of different classes never overlap """
+    dets = dets.astype(np.float64)
+    offset = dets[:, :4].max() - dets[:, :4].min() + 2
+    dets[:, :4] += (np.asarray(classes, dtype=np.float64) * offset)[:, np.newaxis]
+    return dets
+
+
+def batched_nms(dets, classes, thresh, max_keep=0):
+    """
+    class aware nms of all classes in one call, boxes only suppress boxes of the same class
+    :param dets: [[x1, y1, x2, y2 score]] of all classes
+    :param classes: [N] class of each box
+    :param thresh: retain overlap <= thresh
+    :param max_keep: keep top max_keep boxes over all classes, 0 for all
+    :return: indexes to keep, ordered by score
+    """
+    if len(dets) == 0:
+        return []
+    return tiled_nms(_offset_boxes(dets, classes), thresh, max_keep)
+
+
+def soft_nms(dets, thresh, sigma=0.5, score_thresh=1e-3, method='linear', max_keep=0, classes=None):
+    """
+    decay scores of boxes overlapping current maximum instead of removing them
+    :param dets: [[x1, y1, x2, y2 score]]
+    :param thresh: overlap above which linear method decays scores
+    :param sigma: variance of gaussian method
+    :param score_thresh: rule out boxes whose score decays below score_thresh
+    :param method: 'linear' or 'gaussian'
+    :param max_keep: stop once max_keep boxes are kept, 0 for all
+    :param classes: [N] class of each box to decay only within classes, None for single class
+    :return: indexes to keep, their decayed scores
+    """
+    assert method in ('linear', 'gaussian'), 'unknown soft nms method %s' % method
+    boxes = dets if classes is None else _offset_boxes(dets, classes)
+    scores = dets[:, 4].astype(np.float64)
+
+    # overlapping pairs are found once, grouped by first box
+    inds, query_inds = overlap_pairs(boxes, boxes, thresh if method == 'linear' else 0)
+    order = np.lexsort((query_inds, inds))
+    inds, query_inds = inds[order], query_inds[order]
+    ovr = _pair_iou(boxes[inds], boxes[query_inds])
+    if method == 'linear':
+        decays = 1 - ovr
+    else:
+        decays = np.exp(-(ovr * ovr) / sigma)
+    starts = np.searchsorted(inds, np.arange(len(dets) + 1))
+
+    remain = scores > score_thresh
+    candidates = np.where(remain, scores, -np.inf)
+    keep = []
+    keep_scores = []
+    while len(keep) < len(dets):
+        i = candidates.argmax()
+        if not remain[i]:
+            break
+        keep.append(i)
+        keep_scores.append(scores[i])
+        if 0 < max_keep <= len(keep):
+            break
+        remain[i] = False
+        candidates[i] = -np.inf
+        neighbors = query_inds[starts[i]:starts[i + 1]]
+        decay = decays[starts[i]:starts[i + 1]][remain[neighbors]]
+        neighbors = neighbors[remain[neighbors]]
+        scores[neighbors] *= decay
+        remain[neighbors] = scores[neighbors] > score_thresh
+        candidates[neighbors] = np.where(remain[neighbors], scores[neighbors], -np.inf)
+
+    return keep, np.array(keep_scores)
@@ -20,16 +20,32 @@ Proposal Operator transform anchor coordinates into ROI coordinates with predict
 classification probability and bounding box prediction results, and image size and scale information.
 """
 
+import multiprocessing
+import threading
+from multiprocessing.pool import ThreadPool
 import mxnet as mx
 import numpy as np
 import numpy.random as npr
 from distutils.util import strtobool
 
 from rcnn.logger import logger
-from rcnn.processing.bbox_transform import bbox_pred, clip_boxes
-from rcnn.processing.generate_anchor import generate_anchors
+from rcnn.processing.bbox_transform import bbox_pred
+from rcnn.processing.anchor_cache import get_anchor_grid
 from rcnn.processing.nms import py_nms_wrapper, cpu_nms_wrapper, gpu_nms_wrapper
 
+# operators are created again on every bind, they share one pool instead of leaking their own threads
+_nms_pool = None
+_nms_pool_lock = threading.Lock()
+
+
+def _get_nms_pool():
+    """ Threads running nms of images in parallel, nms implementations release GIL in heavy parts """
+    global _nms_pool
+    with _nms_pool_lock:
+        if _nms_pool is None:
+            _nms_pool = ThreadPool(multiprocessing.cpu_count())
+    return _nms_pool
+
 
 class ProposalOperator(mx.operator.CustomOp):
     def __init__(self, feat_stride, scales, ratios, output_score,
@@ -38,7 +54,7 @@ class ProposalOperator(mx.operator.CustomOp):
         self._feat_stride = feat_stride
         self._scales = np.fromstring(scales[1:-1], dtype=float, sep=',')
         self._ratios = np.fromstring(ratios[1:-1], dtype=float, sep=',')
-        self._anchors = generate_anchors(base_size=self._feat_stride, scales=self._scales, ratios=self._ratios)
+        self._anchors = get_anchor_grid(1, 1, self._feat_stride, self._scales, self._ratios)[0]
         self._num_anchors = self._anchors.shape[0]
         self._output_score = output_score
         self._rpn_pre_nms_top_n = rpn_pre_nms_top_n
@@ -50,150 +66,135 @@ class ProposalOperator(mx.operator.CustomOp):
         logger.debug('anchors:\n%s' % self._anchors)
 
     def forward(self, is_train, req, in_data, out_data, aux):
-        nms = gpu_nms_wrapper(self._threshold, in_data[0].context.device_id)
-
-        batch_size = in_data[0].shape[0]
-        if batch_size > 1:
-            raise ValueError("Sorry, multiple images each device is not implemented")
+        if in_data[0].context.device_type == 'gpu':
+            nms = gpu_nms_wrapper(self._threshold, in_data[0].context.device_id)
+        else:
+            nms = cpu_nms_wrapper(self._threshold)
 
-        # for each (H, W) location i
+        # for each (H, W) location i of each image n
         #   generate A anchor boxes centered on cell i
         #   apply predicted bbox deltas at cell i to each of the A anchors
-        # clip predicted boxes to image
-        # remove predicted boxes with either height or width < threshold
-        # sort all (proposal, score) pairs by score from highest to lowest
+        # clip predicted boxes to image n
+        # remove predicted boxes with either height or width < threshold, or out of real image size
+        # sort all (proposal, score) pairs of image n by score from highest to lowest
         # take top pre_nms_topN proposals before NMS
-        # apply NMS with threshold 0.7 to remaining proposals
+        # apply NMS with threshold 0.7 to remaining proposals of each image in parallel
         # take after_nms_topN proposals after NMS
-        # return the top proposals (-> RoIs top, scores top)
+        # return the top proposals (-> RoIs top with batch index n, scores top)
 
         pre_nms_topN = self._rpn_pre_nms_top_n
         post_nms_topN = self._rpn_post_nms_top_n
-        min_size = self._rpn_min_size
 
         # the first set of anchors are background probabilities
         # keep the second part
         scores = in_data[0].asnumpy()[:, self._num_anchors:, :, :]
         bbox_deltas = in_data[1].asnumpy()
-        im_info = in_data[2].asnumpy()[0, :]
+        im_info = in_data[2].asnumpy()
+        batch_size = scores.shape[0]
 
         logger.debug('im_info: %s' % im_info)
+        logger.debug('score map size: (%d, %d)' % (scores.shape[2], scores.shape[3]))
 
-        # 1. Generate proposals from bbox_deltas and shifted anchors
-        # use real image size instead of padded feature map sizes
-        height, width = int(im_info[0] / self._feat_stride), int(im_info[1] / self._feat_stride)
+        # 1. - 3. decode, clip and filter proposals of all images at once
+        proposals, scores = self._decode(scores, bbox_deltas, im_info)
 
-        logger.debug('score map size: (%d, %d)' % (scores.shape[2], scores.shape[3]))
-        logger.debug('resudial: (%d, %d)' % (scores.shape[2] - height, scores.shape[3] - width))
+        # 4. sort all (proposal, score) pairs by score from highest to lowest
+        # 5. take top pre_nms_topN (e.g. 6000)
+        order = self._top_k(scores, pre_nms_topN)
 
-        # Enumerate all shifts
-        shift_x = np.arange(0, width) * self._feat_stride
-        shift_y = np.arange(0, height) * self._feat_stride
-        shift_x, shift_y = np.meshgrid(shift_x, shift_y)
-        shifts = np.vstack((shift_x.ravel(), shift_y.ravel(), shift_x.ravel(), shift_y.ravel())).transpose()
+        # 6. apply nms (e.g. threshold = 0.7) of each image
+        dets = []
+        for n in range(batch_size):
+            order_n = order[n][np.isfinite(scores[n, order[n]])]
+            dets.append(np.hstack((proposals[n, order_n], scores[n, order_n, np.newaxis])).astype(np.float32))
+        if batch_size > 1:
+            keeps = _get_nms_pool().map(lambda det: nms(det) if len(det) else [], dets)
+        else:
+            keeps = [nms(dets[0]) if len(dets[0]) else []]
 
-        # Enumerate all shifted anchors:
-        #
-        # add A anchors (1, A, 4) to
-        # cell K shifts (K, 1, 4) to get
-        # shift anchors (K, A, 4)
-        # reshape to (K*A, 4) shifted anchors
-        A = self._num_anchors
-        K = shifts.shape[0]
-        anchors = self._anchors.reshape((1, A, 4)) + shifts.reshape((1, K, 4)).transpose((1, 0, 2))
-        anchors = anchors.reshape((K * A, 4))
-
-        # Transpose and reshape predicted bbox transformations to get them
+        # 7. take after_nms_topN (e.g. 300)
+        # 8. return the top proposals (-> RoIs top)
+        blobs = []
+        for n, (det, keep) in enumerate(zip(dets, keeps)):
+            keep = np.asarray(keep, dtype=np.int64)
+            if len(keep) == 0:
+                # every proposal is filtered out, fall back to the whole image
+                det = np.array([[0, 0, im_info[n, 1] - 1, im_info[n, 0] - 1, 0]], dtype=np.float32)
+                keep = np.zeros((1,), dtype=np.int64)
+            if post_nms_topN > 0:
+                keep = keep[:post_nms_topN]
+            # pad to ensure output size remains unchanged
+            if len(keep) < post_nms_topN:
+                pad = npr.choice(keep, size=post_nms_topN - len(keep))
+                keep = np.hstack((keep, pad))
+            batch_inds = np.full((len(keep), 1), n, dtype=np.float32)
+            blobs.append(np.hstack((batch_inds, det[keep])))
+        blob = np.vstack(blobs)
+        self.assign(out_data[0], req[0], blob[:, :5])
+
+        if self._output_score:
+            self.assign(out_data[1], req[1], blob[:, 5:])
+
+    def _decode(self, scores, bbox_deltas, im_info):
+        """
+        Decode proposals of a batch on the padded feature map
+        :param scores: [N, A, H, W]
+        :param bbox_deltas: [N, 4 * A, H, W]
+        :param im_info: [N, 3]
+        :return: proposals [N, H * W * A, 4], scores [N, H * W * A] with -inf for filtered proposals
+        """
+        batch_size, num_anchors, feat_height, feat_width = scores.shape
+        _, anchors = get_anchor_grid(feat_height, feat_width, self._feat_stride, self._scales, self._ratios)
+
+        # Transpose and reshape predicted bbox transformations and scores to get them
         # into the same order as the anchors:
         #
-        # bbox deltas will be (1, 4 * A, H, W) format
-        # transpose to (1, H, W, 4 * A)
-        # reshape to (1 * H * W * A, 4) where rows are ordered by (h, w, a)
+        # bbox deltas will be (N, 4 * A, H, W) format
+        # transpose to (N, H, W, 4 * A)
+        # reshape to (N * H * W * A, 4) where rows are ordered by (n, h, w, a)
         # in slowest to fastest order
-        bbox_deltas = self._clip_pad(bbox_deltas, (height, width))
         bbox_deltas = bbox_deltas.transpose((0, 2, 3, 1)).reshape((-1, 4))
-
-        # Same story for the scores:
-        #
-        # scores are (1, A, H, W) format
-        # transpose to (1, H, W, A)
-        # reshape to (1 * H * W * A, 1) where rows are ordered by (h, w, a)
-        scores = self._clip_pad(scores, (height, width))
-        scores = scores.transpose((0, 2, 3, 1)).reshape((-1, 1))
+        scores = scores.transpose((0, 2, 3, 1)).reshape((batch_size, -1))
 
         # Convert anchors into proposals via bbox transformations
-        proposals = bbox_pred(anchors, bbox_deltas)
+        proposals = bbox_pred(np.tile(anchors, (batch_size, 1)), bbox_deltas).reshape((batch_size, -1, 4))
 
         # 2. clip predicted boxes to image
-        proposals = clip_boxes(proposals, im_info[:2])
+        bounds = im_info[:, [1, 0, 1, 0]] - 1
+        np.minimum(proposals, bounds[:, np.newaxis, :], out=proposals)
+        np.maximum(proposals, 0, out=proposals)
 
         # 3. remove predicted boxes with either height or width < threshold
         # (NOTE: convert min_size to input image scale stored in im_info[2])
-        keep = self._filter_boxes(proposals, min_size * im_info[2])
-        proposals = proposals[keep, :]
-        scores = scores[keep]
-
-        # 4. sort all (proposal, score) pairs by score from highest to lowest
-        # 5. take top pre_nms_topN (e.g. 6000)
-        order = scores.ravel().argsort()[::-1]
-        if pre_nms_topN > 0:
-            order = order[:pre_nms_topN]
-        proposals = proposals[order, :]
-        scores = scores[order]
-
-        # 6. apply nms (e.g. threshold = 0.7)
-        # 7. take after_nms_topN (e.g. 300)
-        # 8. return the top proposals (-> RoIs top)
-        det = np.hstack((proposals, scores)).astype(np.float32)
-        keep = nms(det)
-        if post_nms_topN > 0:
-            keep = keep[:post_nms_topN]
-        # pad to ensure output size remains unchanged
-        if len(keep) < post_nms_topN:
-            pad = npr.choice(keep, size=post_nms_topN - len(keep))
-            keep = np.hstack((keep, pad))
-        proposals = proposals[keep, :]
-        scores = scores[keep]
-
-        # Output rois array
-        # Our RPN implementation only supports a single input image, so all
-        # batch inds are 0
-        batch_inds = np.zeros((proposals.shape[0], 1), dtype=np.float32)
-        blob = np.hstack((batch_inds, proposals.astype(np.float32, copy=False)))
-        self.assign(out_data[0], req[0], blob)
+        min_size = (self._rpn_min_size * im_info[:, 2])[:, np.newaxis]
+        ws = proposals[:, :, 2] - proposals[:, :, 0] + 1
+        hs = proposals[:, :, 3] - proposals[:, :, 1] + 1
+        valid = (ws >= min_size) & (hs >= min_size)
+        # use real image size instead of padded feature map sizes
+        heights = (im_info[:, 0] / self._feat_stride).astype(np.int64)
+        widths = (im_info[:, 1] / self._feat_stride).astype(np.int64)
+        inside = (np.arange(feat_height)[np.newaxis, :, np.newaxis] < heights[:, np.newaxis, np.newaxis]) & \
+                 (np.arange(feat_width)[np.newaxis, np.newaxis, :] < widths[:, np.newaxis, np.newaxis])
+        valid &= np.repeat(inside.reshape((batch_size, -1)), num_anchors, axis=1)
+        scores = np.where(valid, scores, -np.inf)
+        return proposals, scores
 
-        if self._output_score:
-            self.assign(out_data[1], req[1], scores.astype(np.float32, copy=False))
+    @staticmethod
+    def _top_k(scores, k):
+        """ Indices of top k scores of each row, from highest to lowest """
+        if 0 < k < scores.shape[1]:
+            order = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            order = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        top_scores = np.take_along_axis(scores, order, axis=1)
+        # ties are ordered by descending index, as argsort()[::-1] of a single image does
+        return np.take_along_axis(order, np.lexsort((-order, -top_scores), axis=1), axis=1)
 
     def backward(self, req, out_grad, in_data, out_data, in_grad, aux):
         self.assign(in_grad[0], req[0], 0)
         self.assign(in_grad[1], req[1], 0)
         self.assign(in_grad[2], req[2], 0)
 
-    @staticmethod
-    def _filter_boxes(boxes, min_size):
-        """ Remove all boxes with any side smaller than min_size """
-        ws = boxes[:, 2] - boxes[:, 0] + 1
-        hs = boxes[:, 3] - boxes[:, 1] + 1
-        keep = np.where((ws >= min_size) & (hs >= min_size))[0]
-        return keep
-
-    @staticmethod
-    def _clip_pad(tensor, pad_shape):
-        """
-        Clip boxes of the pad area.
-        :param tensor: [n, c, H, W]
-        :param pad_shape: [h, w]
-        :return: [n, c, h, w]
-        """
-        H, W = tensor.shape[2:]
-        h, w = pad_shape
-
-        if h < H or w < W:
-            tensor = tensor[:, :, :h, :w].copy()
-
-        return tensor
-
 
 @mx.operator.register("proposal")
 class ProposalProp(mx.operator.CustomOpProp):
@@ -225,8 +226,9 @@ class ProposalProp(mx.operator.CustomOpProp):
 
         batch_size = cls_prob_shape[0]
         im_info_shape = (batch_size, 3)
-        output_shape = (self._rpn_post_nms_top_n, 5)
-        score_shape = (self._rpn_post_nms_top_n, 1)
+        # rois of all images are stacked, first column is batch index
+        output_shape = (batch_size * self._rpn_post_nms_top_n, 5)
+        score_shape = (batch_size * self._rpn_post_nms_top_n, 1)
 
         if self._output_score:
             return [cls_prob_shape, bbox_pred_shape, im_info_shape], [output_shape, score_shape]
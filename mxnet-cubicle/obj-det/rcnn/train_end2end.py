@@ -24,7 +24,7 @@ from rcnn.logger import logger
 from rcnn.config import config, default, generate_config
 from rcnn.symbol import *
 from rcnn.core import callback, metric
-from rcnn.core.loader import AnchorLoader
+from rcnn.core.loader import AnchorLoader, PrefetchAnchorLoader
 from rcnn.core.module import MutableModule
 from rcnn.utils.load_data import load_gt_roidb, merge_roidb, filter_roidb
 from rcnn.utils.load_model import load_param
@@ -58,10 +58,17 @@ def train_net(args, ctx, pretrained, epoch, prefix, begin_epoch, end_epoch,
     roidb = filter_roidb(roidb)
 
     # load training data
-    train_data = AnchorLoader(feat_sym, roidb, batch_size=input_batch_size, shuffle=not args.no_shuffle,
-                              ctx=ctx, work_load_list=args.work_load_list,
-                              feat_stride=config.RPN_FEAT_STRIDE, anchor_scales=config.ANCHOR_SCALES,
-                              anchor_ratios=config.ANCHOR_RATIOS, aspect_grouping=config.TRAIN.ASPECT_GROUPING)
+    if config.TRAIN.PREFETCH_WORKERS > 0:
+        train_data = PrefetchAnchorLoader(feat_sym, roidb, batch_size=input_batch_size, shuffle=not args.no_shuffle,
+                                          ctx=ctx, work_load_list=args.work_load_list,
+                                          feat_stride=config.RPN_FEAT_STRIDE, anchor_scales=config.ANCHOR_SCALES,
+                                          anchor_ratios=config.ANCHOR_RATIOS, aspect_grouping=config.TRAIN.ASPECT_GROUPING,
+                                          num_workers=config.TRAIN.PREFETCH_WORKERS)
+    else:
+        train_data = AnchorLoader(feat_sym, roidb, batch_size=input_batch_size, shuffle=not args.no_shuffle,
+                                  ctx=ctx, work_load_list=args.work_load_list,
+                                  feat_stride=config.RPN_FEAT_STRIDE, anchor_scales=config.ANCHOR_SCALES,
+                                  anchor_ratios=config.ANCHOR_RATIOS, aspect_grouping=config.TRAIN.ASPECT_GROUPING)
 
     # infer max shape
     max_data_shape = [('data', (input_batch_size, 3, max([v[0] for v in config.SCALES]), max([v[1] for v in config.SCALES])))]
@@ -147,11 +154,14 @@ def train_net(args, ctx, pretrained, epoch, prefix, begin_epoch, end_epoch,
                         'rescale_grad': (1.0 / batch_size),
                         'clip_gradient': 5}
 
-    # train
-    mod.fit(train_data, eval_metric=eval_metrics, epoch_end_callback=epoch_end_callback,
-            batch_end_callback=batch_end_callback, kvstore=args.kvstore,
-            optimizer='sgd', optimizer_params=optimizer_params,
-            arg_params=arg_params, aux_params=aux_params, begin_epoch=begin_epoch, num_epoch=end_epoch)
+    # train, loader workers are released even if training fails
+    try:
+        mod.fit(train_data, eval_metric=eval_metrics, epoch_end_callback=epoch_end_callback,
+                batch_end_callback=batch_end_callback, kvstore=args.kvstore,
+                optimizer='sgd', optimizer_params=optimizer_params,
+                arg_params=arg_params, aux_params=aux_params, begin_epoch=begin_epoch, num_epoch=end_epoch)
+    finally:
+        train_data.close()
 
 
 def parse_args():
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# created 2026/10/18 @Northrend
+#
+# Local stand-in of qhash endpoint for testing qhash_proxy
+#
+
+from __future__ import print_function
+import os
+import re
+import json
+import random
+import hashlib
+import threading
+import docopt
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import unquote
+
+# globale vars initialization
+GLOBAL_LOCK = threading.Lock()
+REQUEST_NUMBER = 0
+
+
+def _init_():
+    """
+    Serve <url>?qhash/<alg> of files under a local directory like a bucket domain,
+    usage of qhash_proxy against it:
+        qhash_proxy.py test.lst 16 --prefix http://127.0.0.1:8000/ --hash-alg md5,sha1
+    Update: 2026/10/18
+    Contributor:
+
+    Change log:
+    2026/10/18      v1.0                basic functions
+
+    Usage:
+        mock_qhash_server.py            <root> [--port=int --fail-rate=float --delay=float]
+        mock_qhash_server.py            -v|--version
+        mock_qhash_server.py            -h|--help
+
+    Arguments:
+        <root>                          directory served as bucket
+
+    Options:
+        -h --help                       show this screen
+        -v --version                    show script version
+        ------------------------------------------------------------------------------------------
+        --port=int                      listening port [default: 8000]
+        --fail-rate=float               ratio of requests answered with 503, to test retries [default: 0]
+        --delay=float                   seconds slept per request, to test concurrency [default: 0]
+    """
+    print('=' * 80 + '\nArguments submitted:')
+    for key in sorted(args.keys()):
+        print ('{:<20}= {}'.format(key.replace('--', ''), args[key]))
+    print('=' * 80)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class QhashHandler(BaseHTTPRequestHandler):
+    # keep-alive, so connection reuse of clients could be checked
+    protocol_version = 'HTTP/1.1'
+    # headers and body are sent separately, avoid delayed-ack stall on kept-alive connections
+    disable_nagle_algorithm = True
+
+    def reply(self, code, body):
+        body = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        global REQUEST_NUMBER
+        with GLOBAL_LOCK:
+            REQUEST_NUMBER += 1
+        if float(args['--delay']):
+            threading.Event().wait(float(args['--delay']))
+        path, _, query = self.path.partition('?')
+        match = re.match(r'^qhash/(md5|sha1)$', query)
+        if not match:
+            return self.reply(400, json.dumps({'error': 'invalid qhash query'}))
+        if random.random() < float(args['--fail-rate']):
+            return self.reply(503, json.dumps({'error': 'service unavailable'}))
+        file_path = os.path.join(args['<root>'], unquote(path).lstrip('/'))
+        if not os.path.isfile(file_path):
+            return self.reply(404, json.dumps({'error': 'no such file or directory'}))
+        hasher = hashlib.new(match.group(1))
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                hasher.update(chunk)
+        self.reply(200, json.dumps({'hash': hasher.hexdigest(), 'fsize': os.path.getsize(file_path)}))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', int(args['--port'])), QhashHandler)
+    print('serving {} at http://127.0.0.1:{}/'.format(args['<root>'], args['--port']))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    print('requests served:', REQUEST_NUMBER)
+
+
+if __name__ == '__main__':
+    version = re.compile('.*\d+/\d+\s+(v[\d.]+)').findall(_init_.__doc__)[0]
+    args = docopt.docopt(_init_.__doc__, version='Mock qhash server {}'.format(
+        version), argv=None, help=True, options_first=False)
+    _init_()
+    main()
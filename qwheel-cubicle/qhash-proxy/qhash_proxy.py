@@ -10,26 +10,33 @@ import os
 import requests
 import time
 import re
+import random
 import threading
-import Queue
 import json
 import docopt
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 
 # globale vars initialization
 GLOBAL_LOCK = threading.Lock()
 ERROR_NUMBER = 0
-FILE_NAME = str()
-RETRY_COUNT = dict()
-MAX_RETRY_TIMES = 5    # retry 5 times by default
+DONE_NUMBER = 0
+RETRY_STATUS = (408, 429, 500, 502, 503, 504)
+LOG_INTERVAL = 1000     # files between progress logs
+FLUSH_INTERVAL = 1000   # result lines buffered before flushing
 
 
 def _init_():
     """
     Getting remote file hash with multi-thread
-    Update: 2018/09/04
+    Update: 2026/10/18
     Contributor: laojiangwei@github.com 
 
     Change log:
+    2026/10/18          v2.0            keep-alive session per thread, retries with backoff outside lock,
+                                        streaming json-lines output
     2018/09/04          v1.3            fix 404 bug and add retry feature
     2018/05/08          v1.2            fix bug
     2018/04/20          v1.1            fix bug 
@@ -38,20 +45,25 @@ def _init_():
     Usage:
         qhash_proxy.py                  <infile> <thread-number>
                                         [--prefix=str --output=str --hash-alg=lst]
+                                        [--retries=int --backoff=float --timeout=int]
         qhash_proxy.py                  -v|--version
         qhash_proxy.py                  -h|--help
 
     Arguments:
         <infile>                        input file list
-        <thread-number>                 number of processing thread
+        <thread-number>                 number of processing thread, each keeps its own connections
 
     Options:
         -h --help                       show this screen
         -v --version                    show script version
         ------------------------------------------------------------------------------------------
         --hash-alg=lst                  hash algorithm, md5, sha1 or both [default: md5]
-        --output=str                    output json file path, will be saved as <infile>_hash.json path by default
+        --output=str                    output json-lines file path, one file per line, will be
+                                        saved as <infile>_hash.jsonl path by default
         --prefix=str                    add url prefix if needed
+        --retries=int                   retry times of each request [default: 5]
+        --backoff=float                 base seconds of exponential retry backoff [default: 0.5]
+        --timeout=int                   request timeout in seconds [default: 10]
     """
     print('=' * 80 + '\nArguments submitted:')
     for key in sorted(args.keys()):
@@ -66,126 +78,144 @@ class request_err(Exception):
     pass
 
 
-class prod_worker(threading.Thread):
+def get_qhash(session, url, alg, timeout=10):
+    req = '{}?qhash/{}'.format(url, alg)
+    ret = session.get(req, timeout=timeout)
+    if ret.status_code != 200:
+        raise request_err(ret.status_code)
+    try:
+        return ret.json()['hash']
+    except (ValueError, KeyError, TypeError):
+        raise request_err('bad response')
+
+
+def fetch_hashes(session, url, hash_alg_list, retries=5, backoff=0.5, timeout=10):
     """
-    producing worker
+    get all hashes of url with retries, return (hash dict, None) or (None, error)
+    """
+    result = dict()
+    for hash_alg in hash_alg_list:
+        for attempt in range(retries + 1):
+            try:
+                result[hash_alg] = get_qhash(session, url, hash_alg, timeout)
+                break
+            except request_err as e:
+                status = e.args[0] if e.args else None
+                error = 'status {}'.format(status) if isinstance(status, int) else 'bad response'
+                # client errors like 404 will not be fixed by retrying
+                if isinstance(status, int) and status not in RETRY_STATUS:
+                    return None, error
+            except requests.exceptions.RequestException as e:
+                error = type(e).__name__
+            if attempt < retries:
+                # exponential backoff with jitter, so retries from all threads do not arrive together
+                time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+        else:
+            return None, error
+    return result, None
+
+
+class ResultWriter(object):
+    """
+    thread-safe json-lines writer, one line per file
     """
-    global GLOBAL_LOCK
 
-    def __init__(self, queue, infile):
-        threading.Thread.__init__(self)
-        self.queue = queue
-        self.infile = infile
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.lock = threading.Lock()
+        self.pending = 0
 
-    def run(self):
-        for buff in self.infile:
-            temp = dict()
-            # skip blank line
-            if not buff.strip():
-                continue
-            file_tmp = buff.strip().split()[0]
-            GLOBAL_LOCK.acquire()
-            self.queue.put(file_tmp)
-            GLOBAL_LOCK.release()
-        GLOBAL_LOCK.acquire()
-        print('thread:', self.name, 'successfully quit')
-        GLOBAL_LOCK.release()
+    def write(self, record):
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.pending += 1
+            if self.pending >= FLUSH_INTERVAL:
+                self.file.flush()
+                self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.file.close()
 
 
 class cons_worker(threading.Thread):
+    """
+    consuming worker with its own keep-alive session, blocks on queue until a None is got
+    """
     global GLOBAL_LOCK
 
-    def __init__(self, queue, hash_dic, hash_alg_list, prefix=None):
+    def __init__(self, queue, writer, hash_alg_list, prefix=None):
         threading.Thread.__init__(self)
         self.queue = queue
-        self.hash_dic = hash_dic
+        self.writer = writer
         self.hash_alg_list = hash_alg_list
         self.prefix = prefix
-
-    def get_qhash(self, url, alg):
-        req = '{}?qhash/{}'.format(url, alg)
-        ret = requests.get(req, timeout=10)
-        if ret.status_code != 200:
-            raise request_err
-        try:
-            ret_dict = json.loads(ret.text)
-            return ret_dict
-        except:
-            raise request_err
-                
+        self.session = requests.Session()
 
     def run(self):
-        global ERROR_NUMBER, RETRY_COUNT
-        err_num = 0
-        while(not self.queue.empty()):
-            if GLOBAL_LOCK.acquire(False):
-                # customized code
-                file_tmp = self.queue.get()
-                print('processing:', file_tmp)
-                self.hash_dic[file_tmp] = dict()
-                GLOBAL_LOCK.release()
-                if self.prefix:
-                    url_tmp = os.path.join(self.prefix, file_tmp)
-                else:
-                    url_tmp = file_tmp
-                for hash_alg in self.hash_alg_list:
-                    try:
-                        result = self.get_qhash(url_tmp, hash_alg)
-                    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, request_err):
-                        GLOBAL_LOCK.acquire()
-                        err_num += 1
-                        # retry
-                        if url_tmp not in RETRY_COUNT:
-                            self.queue.put(file_tmp)
-                            RETRY_COUNT[url_tmp] = 1
-                            print('request error: {}'.format(url_tmp))
-                        elif RETRY_COUNT[url_tmp] < MAX_RETRY_TIMES:
-                            self.queue.put(file_tmp)
-                            RETRY_COUNT[url_tmp] += 1
-                            print('RETRY[{}] request error: {}'.format(RETRY_COUNT[url_tmp], url_tmp))
-                        else:
-                            print('max retrying times exceeded: {}'.format(url_tmp))
-                        GLOBAL_LOCK.release()
-                        break
-                    if result:
-                        GLOBAL_LOCK.acquire()
-                        self.hash_dic[file_tmp][hash_alg] = result['hash']
-                        GLOBAL_LOCK.release()
+        global ERROR_NUMBER, DONE_NUMBER
+        while True:
+            file_tmp = self.queue.get()
+            if file_tmp is None:
+                break
+            if self.prefix:
+                url_tmp = os.path.join(self.prefix, file_tmp)
             else:
-                pass
-        GLOBAL_LOCK.acquire()
-        ERROR_NUMBER += err_num
-        print('thread:', self.name, 'successfully quit')
-        GLOBAL_LOCK.release()
+                url_tmp = file_tmp
+            result, error = fetch_hashes(self.session, url_tmp, self.hash_alg_list, retries=int(args['--retries']),
+                                         backoff=float(args['--backoff']), timeout=int(args['--timeout']))
+            record = {'file': file_tmp}
+            if error:
+                record['error'] = error
+            else:
+                record.update(result)
+            self.writer.write(record)
+            with GLOBAL_LOCK:
+                DONE_NUMBER += 1
+                if error:
+                    ERROR_NUMBER += 1
+                    print('request error [{}]: {}'.format(error, url_tmp))
+                if DONE_NUMBER % LOG_INTERVAL == 0:
+                    print('files processed: {}, errors: {}'.format(DONE_NUMBER, ERROR_NUMBER))
+        self.session.close()
+
+
+def produce(infile, queue):
+    """
+    put files into queue
+    """
+    for buff in infile:
+        # skip blank line
+        if not buff.strip():
+            continue
+        queue.put(buff.strip().split()[0])
 
 
 def main():
-    infile = open(args['<infile>'], 'r')
-    output = args['--output'] if args['--output'] else '{}_hash.json'.format(os.path.splitext(args['<infile>'])[0])
+    output = args['--output'] if args['--output'] else '{}_hash.jsonl'.format(os.path.splitext(args['<infile>'])[0])
     thread_count = int(args['<thread-number>'])
-    prefix = args['--prefix']
-    queue = Queue.Queue(0)
-    hash_dic = dict()
     hash_alg_list = args['--hash-alg'].split(',')
     for check in hash_alg_list:
         assert check in ['md5', 'sha1'], 'invalid hash algorithm: {}'.format(check)
-    thread_prod = prod_worker(queue, infile)
-    thread_prod.start()
-    print('thread:', thread_prod.name, 'successfully started')
-    time.sleep(1)
+    writer = ResultWriter(output)
+    # bounded, so files are read only as fast as they are processed
+    task_queue = queue.Queue(thread_count * 4)
+    threads = [cons_worker(task_queue, writer, hash_alg_list, args['--prefix']) for _ in range(thread_count)]
+    for thread in threads:
+        thread.start()
     tic = time.time()
-    for i in xrange(thread_count):
-        exec('thread_cons_{} = cons_worker(queue, hash_dic, hash_alg_list, prefix)'.format(i))
-        eval('thread_cons_{}.start()'.format(i))
-    thread_prod.join()
-    for i in xrange(thread_count):
-        eval('thread_cons_{}.join()'.format(i))
-    toc = time.time()    
-    print('total error request times:', ERROR_NUMBER)
+    with open(args['<infile>'], 'r') as infile:
+        produce(infile, task_queue)
+    for _ in threads:
+        task_queue.put(None)
+    for thread in threads:
+        thread.join()
+    writer.close()
+    toc = time.time()
+    print('total files: {}, errors: {}'.format(DONE_NUMBER, ERROR_NUMBER))
     print('processing time:', (toc-tic),'s')
-    infile.close()
-    with open(output, 'w') as f:
-        json.dump(hash_dic, f, indent=4)
+    print('result saved:', output)
 
 
 if __name__ == '__main__':